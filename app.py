@@ -10,7 +10,18 @@ try:
 except Exception:
     pass
 
-from db import get_db_connection
+from db import get_db_connection, cerrar_pool
+from utils.indice_identidades import indice_identidades
+from utils import escritura_diferida as modulo_escritura_diferida
+from utils import journal_offline as modulo_journal_offline
+from utils.queries_ingreso import reproducir_escaneo
+from utils.esquema_bd import asegurar_esquema
+from utils.queries_admin_eventos_detalle import completar_identidad_asistencias
+from utils.queries_admin_eventos import finalizar_eventos_vencidos
+from utils.queries_eventos import precalentar_agenda_eventos
+from utils.planificador import planificador
+from utils.resumen_ingresos import acumular_resumen_ingresos
+import servidor_terminales as modulo_servidor_terminales
 
 from routes.ingreso import ingreso_bp
 from routes.visitantes import visitantes_bp
@@ -30,6 +41,7 @@ from routes.admin_auditoria import admin_auditoria_bp
 from routes.admin_backup import admin_backup_bp
 from routes.admin_salas import admin_salas_bp
 from routes.api_undac import api_undac_bp
+from routes.admin_monitoreo import admin_monitoreo_bp
 
 
 app = Flask(__name__)
@@ -146,6 +158,8 @@ def requerir_login_admin():
             or request.path.startswith("/admin/evento_detalle")
             or request.path.startswith("/admin/eliminar_evento")
             or request.path.startswith("/admin/eventos")
+            # Tras importar invitados (también permitido) el padrón se rearma
+            or request.path.startswith("/admin/reconstruir_padron_evento/")
         )
 
         if request.path not in rutas_permitidas and not es_dinamica:
@@ -266,6 +280,52 @@ app.register_blueprint(admin_auditoria_bp)
 app.register_blueprint(admin_backup_bp)
 app.register_blueprint(admin_salas_bp)
 app.register_blueprint(api_undac_bp)
+app.register_blueprint(admin_monitoreo_bp)
+
+# ============================================================
+# SERVICIOS EN SEGUNDO PLANO
+# ============================================================
+
+def iniciar_servicios_segundo_plano():
+    # Índices/columnas que el código espera (idempotente)
+    asegurar_esquema()
+
+    # Tareas periódicas de mantenimiento (ver /admin/api/tareas)
+    # Estado 'Finalizado' de los eventos que ya terminaron: un solo proceso por turno
+    planificador.registrar('finalizar_eventos', finalizar_eventos_vencidos,
+                           intervalo=int(os.getenv('EVENTOS_EXPIRACION_INTERVALO', 60)))
+    # Agenda del día y padrones de eventos en curso: cada proceso calienta su caché
+    planificador.registrar('precalentar_eventos', precalentar_agenda_eventos,
+                           intervalo=int(os.getenv('EVENTOS_PRECALENTAR_INTERVALO', 120)), exclusiva=False)
+    # Resumen por hora de ingresos para el dashboard (avanza desde su marca de RegistroID)
+    planificador.registrar('resumen_ingresos', acumular_resumen_ingresos,
+                           intervalo=int(os.getenv('RESUMEN_INGRESOS_INTERVALO', 60)))
+    # Identidad de asistencias a eventos anteriores al esquema ampliado (si ya está
+    # completa, cada pasada no actualiza nada)
+    planificador.registrar('identidad_asistencias', completar_identidad_asistencias,
+                           intervalo=int(os.getenv('ASISTENCIAS_BACKFILL_INTERVALO', 600)))
+    planificador.iniciar()
+
+    # Índice de identidades: solo lo consultan el write-behind y el acuse del
+    # journal offline (el registro normal lo resuelve sp_RegistrarIngreso)
+    if modulo_escritura_diferida.ACTIVA or modulo_journal_offline.ACTIVO:
+        indice_identidades.habilitar()
+        indice_identidades.recargar_async()
+
+    # Write-behind opcional de ingresos (SCAN_WRITE_BEHIND=true)
+    if modulo_escritura_diferida.ACTIVA:
+        modulo_escritura_diferida.escritura_diferida.iniciar()
+
+    # Journal local + replay cuando SQL Server no responde (SCAN_MODO_OFFLINE)
+    if modulo_journal_offline.ACTIVO:
+        modulo_journal_offline.journal_offline.iniciar(reproducir_escaneo)
+
+
+def detener_servicios_segundo_plano():
+    # Vaciar a la BD los ingresos que siguen en la cola del write-behind
+    modulo_escritura_diferida.escritura_diferida.detener()
+    cerrar_pool()
+
 
 # ============================================================
 # ARRANQUE DEL SERVIDOR
@@ -284,12 +344,26 @@ if __name__ == "__main__":
     print("[*] Multi-Threading activo para escaneos en paralelo")
     print("============================================================")
 
+    iniciar_servicios_segundo_plano()
+
     try:
         from waitress import serve
-        serve(app, host="0.0.0.0", port=port, threads=16)
+
+        if modulo_servidor_terminales.ACTIVO:
+            # Front end asyncio en el puerto público: rutas de terminales en su
+            # propio pool; el resto se reenvía a Waitress, que queda solo en local.
+            modulo_servidor_terminales.servidor_terminales.iniciar("0.0.0.0", port)
+            print(f"[*] Front end asyncio de terminales en el puerto {port} "
+                  f"({modulo_servidor_terminales.WORKERS} hilos de BD); Waitress en 127.0.0.1:{modulo_servidor_terminales.PUERTO_WSGI}")
+            serve(app, host="127.0.0.1", port=modulo_servidor_terminales.PUERTO_WSGI, threads=16,
+                  trusted_proxy="127.0.0.1", trusted_proxy_headers="x-forwarded-for",
+                  clear_untrusted_proxy_headers=True)
+        else:
+            serve(app, host="0.0.0.0", port=port, threads=16)
 
     except KeyboardInterrupt:
         print("\n[*] Servidor apagado por el administrador.")
+        detener_servicios_segundo_plano()
         os._exit(0)
     except OSError as e:
         print(f"\n[AVISO] No se pudo abrir el puerto {port}: {e}")
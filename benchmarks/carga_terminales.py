@@ -0,0 +1,186 @@
+"""
+Prueba de carga de las rutas de terminales.
+
+Abre N conexiones keep-alive concurrentes que envían escaneos (o consultas de
+estado de eventos) y reporta rendimiento y latencias p50/p95/p99. Con
+--ocupar se abren además conexiones lentas (p. ej. el SSE del dashboard o una
+exportación) para reproducir hilos de Waitress ocupados.
+
+Comparación sugerida (mismo servidor, misma BD):
+
+    # 1) Camino actual: SCAN_ASYNC=false  -> Waitress 16 hilos en :5000
+    python benchmarks/carga_terminales.py --url http://127.0.0.1:5000 --conexiones 300 --ocupar 16 \\
+        --ocupar-ruta /admin/api/dashboard_stream --cookie "session=..."
+
+    # 2) Front end asyncio: SCAN_ASYNC=true  -> event loop en :5000, Waitress en 127.0.0.1:5001
+    python benchmarks/carga_terminales.py --url http://127.0.0.1:5000 --conexiones 300 --ocupar 16 \\
+        --ocupar-ruta /admin/api/dashboard_stream --cookie "session=..."
+
+Resultado de referencia (300 conexiones, 15 s, 1 CPU; driver pyodbc de prueba
+que tarda 20 ms por consulta en lugar de SQL Server, así que mide el servidor
+HTTP y el reparto de hilos, no la BD):
+
+    --ocupar 4 --ocupar-ruta /api/eventos_stream   (4 terminales con SSE)
+      SCAN_ASYNC=false  507.3 req/s  p50/p95/p99 172 / 225 / 3297 ms  412 fallos (timeout 6 s)
+      SCAN_ASYNC=true   707.3 req/s  p50/p95/p99 417 / 440 / 449 ms   0 fallos
+
+    sin --ocupar
+      SCAN_ASYNC=false  671.1 req/s  p50/p95/p99 139 / 160 / 3560 ms  404 fallos
+      SCAN_ASYNC=true   700.0 req/s  p50/p95/p99 420 / 456 / 470 ms   0 fallos
+
+Waitress atiende rápido a algunas conexiones y deja otras sin turno hasta el
+timeout del terminal; el event loop reparte los 16 hilos entre todas.
+
+Solo usa la biblioteca estándar.
+"""
+import json
+import time
+import random
+import asyncio
+import argparse
+from urllib.parse import urlsplit
+
+
+def _percentil(valores, p):
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    k = min(len(ordenados) - 1, int(round(p / 100.0 * (len(ordenados) - 1))))
+    return ordenados[k]
+
+
+def _peticion(metodo, ruta, host, cuerpo=None, cookie=None):
+    lineas = [f"{metodo} {ruta} HTTP/1.1", f"Host: {host}", "Connection: keep-alive"]
+    if cookie:
+        lineas.append(f"Cookie: {cookie}")
+    datos = b''
+    if cuerpo is not None:
+        datos = json.dumps(cuerpo).encode('utf-8')
+        lineas.append("Content-Type: application/json")
+        lineas.append(f"Content-Length: {len(datos)}")
+    return ("\r\n".join(lineas) + "\r\n\r\n").encode('latin-1') + datos
+
+
+async def _leer_respuesta(reader):
+    linea = await reader.readline()
+    if not linea:
+        raise ConnectionError('conexión cerrada por el servidor')
+    codigo = int(linea.split()[1])
+    largo = 0
+    cerrar = False
+    while True:
+        cabecera = await reader.readline()
+        if cabecera in (b'\r\n', b''):
+            break
+        nombre, _, valor = cabecera.decode('latin-1').partition(':')
+        nombre = nombre.strip().lower()
+        if nombre == 'content-length':
+            largo = int(valor.strip())
+        elif nombre == 'connection' and 'close' in valor.lower():
+            cerrar = True
+    cuerpo = await reader.readexactly(largo) if largo else b''
+    return codigo, cuerpo, cerrar
+
+
+def _generar_peticion(args, host, codigos):
+    if args.escenario == 'estado':
+        return _peticion('GET', f"/api/eventos_activos?sede={args.sede}", host)
+    codigo = random.choice(codigos) if codigos else str(random.randint(10000000, 99999999))
+    return _peticion('POST', '/procesar_ingreso', host, {'codigo': codigo, 'sala_id': args.sala})
+
+
+async def _cliente(args, host, puerto, codigos, latencias, resultados, fin):
+    reader = writer = None
+    while time.perf_counter() < fin:
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection(host, puerto)
+            inicio = time.perf_counter()
+            writer.write(_generar_peticion(args, f"{host}:{puerto}", codigos))
+            await writer.drain()
+            codigo, _, cerrar = await asyncio.wait_for(_leer_respuesta(reader), args.timeout)
+            latencias.append((time.perf_counter() - inicio) * 1000)
+            resultados[codigo] = resultados.get(codigo, 0) + 1
+            if cerrar:
+                writer.close()
+                writer = None
+        except (OSError, ConnectionError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError, IndexError):
+            resultados['fallos'] = resultados.get('fallos', 0) + 1
+            if writer:
+                writer.close()
+            writer = None
+        if args.pausa:
+            await asyncio.sleep(args.pausa / 1000.0)
+    if writer:
+        writer.close()
+
+
+async def _ocupar(args, host, puerto, fin):
+    """Conexión lenta que retiene un hilo del servidor hasta el final de la prueba."""
+    try:
+        reader, writer = await asyncio.open_connection(host, puerto)
+        writer.write(_peticion('GET', args.ocupar_ruta, f"{host}:{puerto}", cookie=args.cookie))
+        await writer.drain()
+        while time.perf_counter() < fin:
+            datos = await asyncio.wait_for(reader.read(4096), max(0.1, fin - time.perf_counter()))
+            if not datos:
+                break
+        writer.close()
+    except (OSError, asyncio.TimeoutError):
+        pass
+
+
+async def _principal(args):
+    url = urlsplit(args.url)
+    host, puerto = url.hostname, url.port or 80
+
+    codigos = []
+    if args.codigos:
+        with open(args.codigos, encoding='utf-8') as f:
+            codigos = [linea.strip() for linea in f if linea.strip()]
+
+    fin = time.perf_counter() + args.segundos
+    latencias = []
+    resultados = {}
+
+    tareas = [_ocupar(args, host, puerto, fin) for _ in range(args.ocupar)]
+    if args.ocupar:
+        await asyncio.sleep(0.5)
+    inicio = time.perf_counter()
+    tareas += [_cliente(args, host, puerto, codigos, latencias, resultados, fin) for _ in range(args.conexiones)]
+    await asyncio.gather(*tareas)
+    duracion = time.perf_counter() - inicio
+
+    print("============================================================")
+    print(f"  {args.url}  escenario={args.escenario}  conexiones={args.conexiones}  ocupadas={args.ocupar}")
+    print("============================================================")
+    print(f"  Peticiones completadas : {len(latencias)}")
+    print(f"  Rendimiento            : {len(latencias) / duracion:.1f} req/s")
+    print(f"  Latencia p50 / p95 / p99: {_percentil(latencias, 50):.1f} / "
+          f"{_percentil(latencias, 95):.1f} / {_percentil(latencias, 99):.1f} ms")
+    print(f"  Latencia máxima        : {max(latencias) if latencias else 0:.1f} ms")
+    print(f"  Resultados             : {resultados}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Prueba de carga de las rutas de terminales')
+    parser.add_argument('--url', default='http://127.0.0.1:5000')
+    parser.add_argument('--escenario', choices=['ingreso', 'estado'], default='ingreso',
+                        help='ingreso = POST /procesar_ingreso, estado = GET /api/eventos_activos')
+    parser.add_argument('--conexiones', type=int, default=200, help='terminales concurrentes (keep-alive)')
+    parser.add_argument('--segundos', type=float, default=20)
+    parser.add_argument('--pausa', type=float, default=0, help='ms entre peticiones de cada terminal')
+    parser.add_argument('--timeout', type=float, default=6, help='segundos (el terminal aborta a los 6 s)')
+    parser.add_argument('--sala', type=int, default=1)
+    parser.add_argument('--sede', default='Central')
+    parser.add_argument('--codigos', help='archivo con un código/DNI por línea (por defecto aleatorios)')
+    parser.add_argument('--ocupar', type=int, default=0, help='conexiones lentas simultáneas')
+    parser.add_argument('--ocupar-ruta', default='/admin/api/dashboard_stream')
+    parser.add_argument('--cookie', help='cookie de sesión admin para --ocupar-ruta')
+    args = parser.parse_args()
+
+    asyncio.run(_principal(args))
+
+
+if __name__ == '__main__':
+    main()
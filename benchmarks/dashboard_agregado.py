@@ -0,0 +1,193 @@
+"""
+Benchmark de la agregación del dashboard sobre RegistroIngresos.
+
+Crea tablas temporales con la forma de RegistroIngresos y Salas (por
+defecto 300 mil ingresos repartidos en los últimos 30 días) y compara las
+diez consultas que hacía obtener_datos_dashboard (seis COUNT(*) y los
+GROUP BY de piso, sede, sala y hora) contra la consulta única con
+GROUPING SETS de utils/queries_dashboard.py. Reporta la mediana de tiempo,
+cuántas veces el plan lee la tabla de ingresos y si ambos resultados
+coinciden.
+
+Uso (desde la raíz del proyecto, con el .env de la BD configurado):
+
+    python -m benchmarks.dashboard_agregado --filas 300000 --dias 30 --repeticiones 5
+
+No modifica tablas reales: todo ocurre en #RegistroIngresosBench y #SalasBench.
+"""
+import re
+import time
+import argparse
+import statistics
+from datetime import date, timedelta
+
+try:
+    from dotenv import load_dotenv
+    load_dotenv()
+except ImportError:
+    pass
+
+from db import crear_conexion_directa
+from utils.filtros_fecha import filtro_ingresos, filtro_sede, filtro_fuera_de_central
+from utils.queries_dashboard import _SQL_AGREGADO, _FUENTE_CRUDA, _repartir_agregado
+
+TABLA = '#RegistroIngresosBench'
+TABLA_SALAS = '#SalasBench'
+
+
+def _crear_tablas(cursor, filas, dias):
+    cursor.execute(f"""
+        SET NOCOUNT ON;
+        CREATE TABLE {TABLA_SALAS} (
+            SalaID INT PRIMARY KEY,
+            NombreSala NVARCHAR(100) NOT NULL,
+            Piso INT NOT NULL,
+            Sede NVARCHAR(50) NOT NULL
+        );
+        INSERT INTO {TABLA_SALAS} (SalaID, NombreSala, Piso, Sede)
+        SELECT n, 'Sala ' + CAST(n AS NVARCHAR(10)), 1 + n % 4,
+               CASE WHEN n <= 8 THEN 'Central' WHEN n <= 10 THEN 'Pasco' ELSE 'Yanahuanca' END
+        FROM (SELECT TOP 12 ROW_NUMBER() OVER (ORDER BY (SELECT NULL)) AS n FROM sys.all_objects) N;
+
+        CREATE TABLE {TABLA} (
+            RegistroID INT IDENTITY(1,1) PRIMARY KEY,
+            SalaID INT NOT NULL,
+            Piso INT NULL,
+            Sede NVARCHAR(50) NULL,
+            TipoUsuario NVARCHAR(50) NOT NULL,
+            FechaHora DATETIME NOT NULL
+        );
+
+        WITH N AS (
+            SELECT TOP (?) ROW_NUMBER() OVER (ORDER BY (SELECT NULL)) AS n
+            FROM sys.all_objects a CROSS JOIN sys.all_objects b CROSS JOIN sys.all_objects c
+        )
+        INSERT INTO {TABLA} (SalaID, Piso, Sede, TipoUsuario, FechaHora)
+        SELECT
+            S.SalaID, S.Piso,
+            -- Parte de Central quedó con Sede NULL (registros antiguos)
+            CASE WHEN S.Sede = 'Central' AND N.n % 3 = 0 THEN NULL ELSE S.Sede END,
+            CASE N.n % 20 WHEN 0 THEN 'Visitante' WHEN 1 THEN 'Egresado' WHEN 2 THEN 'Docente' WHEN 3 THEN 'Administrativo' ELSE 'Alumno' END,
+            -- Últimos `dias` días, entre las 08:00 y las 20:45
+            DATEADD(SECOND, (N.n * 7919) % 45900,
+                DATEADD(HOUR, 8, CAST(DATEADD(DAY, -((N.n * 31) % ?), CAST(GETDATE() AS DATE)) AS DATETIME)))
+        FROM N JOIN {TABLA_SALAS} S ON S.SalaID = 1 + N.n % 12;
+
+        CREATE INDEX IX_Bench_FechaHora ON {TABLA} (FechaHora) INCLUDE (Sede, SalaID, Piso, TipoUsuario);
+    """, (filas, dias))
+
+
+def _consultas_antes(where, where_r, params):
+    """Las consultas que reemplaza _SQL_AGREGADO, tal como estaban."""
+    consultas = [
+        ('total_hoy', f"SELECT COUNT(*) FROM {TABLA} WHERE {where}"),
+    ]
+    for tipo, clave in (('Alumno', 'total_alumnos'), ('Visitante', 'total_visitantes'), ('Egresado', 'total_egresados'),
+                        ('Administrativo', 'total_personal'), ('Docente', 'total_docentes')):
+        consultas.append((clave, f"SELECT COUNT(*) FROM {TABLA} WHERE TipoUsuario = '{tipo}' AND {where}"))
+    consultas += [
+        ('pisos', f"SELECT Piso, COUNT(*) FROM {TABLA} WHERE {filtro_sede('Central')[0]} AND {where} GROUP BY Piso"),
+        ('salas', f"""SELECT S.Piso, S.NombreSala, COUNT(R.RegistroID) FROM {TABLA} R
+                      JOIN {TABLA_SALAS} S ON R.SalaID = S.SalaID
+                      WHERE S.Sede = 'Central' AND {where_r} GROUP BY S.Piso, S.NombreSala"""),
+        ('sedes', f"SELECT Sede, COUNT(*) FROM {TABLA} WHERE {filtro_fuera_de_central()} AND {where} GROUP BY Sede"),
+        ('horas', f"""SELECT DATEPART(HOUR, FechaHora) as Hora, COUNT(*) FROM {TABLA}
+                      WHERE {where} GROUP BY DATEPART(HOUR, FechaHora) ORDER BY Hora"""),
+    ]
+    return [(clave, sql, params) for clave, sql in consultas]
+
+
+def _a_diccionario(resultados):
+    datos = {}
+    for clave, filas in resultados.items():
+        if clave == 'pisos' or clave == 'sedes':
+            datos[clave] = {fila[0]: fila[1] for fila in filas}
+        elif clave == 'salas':
+            salas = {}
+            for piso, nombre, cant in filas:
+                salas.setdefault(str(piso), {})[nombre] = cant
+            datos[clave] = salas
+        elif clave == 'horas':
+            datos['chart_horas_labels'] = [f"{fila[0]}:00" for fila in filas]
+            datos['chart_horas_values'] = [fila[1] for fila in filas]
+        else:
+            datos[clave] = filas[0][0]
+    return datos
+
+
+def _lecturas_de_tabla(cursor, sql, params):
+    """Cuántos operadores del plan real acceden a la tabla de ingresos."""
+    cursor.execute("SET STATISTICS XML ON")
+    cursor.execute(sql, params)
+    cursor.fetchall()
+    plan = ''
+    if cursor.nextset():
+        fila = cursor.fetchone()
+        plan = fila[0] if fila else ''
+    cursor.execute("SET STATISTICS XML OFF")
+    return len(re.findall(r'<Object [^>]*Table="\[#RegistroIngresosBench[^"]*\]"', plan))
+
+
+def _medir(cursor, consultas, repeticiones):
+    tiempos = []
+    resultados = {}
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        for clave, sql, params in consultas:
+            cursor.execute(sql, params)
+            resultados[clave] = cursor.fetchall()
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    lecturas = sum(_lecturas_de_tabla(cursor, sql, params) for _, sql, params in consultas)
+    return statistics.median(tiempos), lecturas, resultados
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de la agregación del dashboard')
+    parser.add_argument('--filas', type=int, default=300000)
+    parser.add_argument('--dias', type=int, default=30)
+    parser.add_argument('--repeticiones', type=int, default=5)
+    args = parser.parse_args()
+
+    conn = crear_conexion_directa()
+    conn.autocommit = True
+    cursor = conn.cursor()
+
+    print(f"[*] Generando {args.filas} filas en {args.dias} días en {TABLA}...")
+    inicio = time.perf_counter()
+    _crear_tablas(cursor, args.filas, args.dias)
+    print(f"[*] Tablas listas en {time.perf_counter() - inicio:.1f} s\n")
+
+    hoy = date.today()
+    desde = (hoy - timedelta(days=args.dias - 1)).isoformat()
+    escenarios = [
+        ('Hoy', (None, None, None)),
+        ('7 días', ((hoy - timedelta(days=6)).isoformat(), hoy.isoformat(), None)),
+        (f'{args.dias} días', (desde, hoy.isoformat(), None)),
+        (f'{args.dias} días, sede Central', (desde, hoy.isoformat(), 'Central')),
+    ]
+
+    print(f"{'Escenario':<26} {'Consultas':>9} {'Lecturas':>9} {'Antes (ms)':>11} {'Lecturas':>9} {'Ahora (ms)':>11} {'Mejora':>7}")
+    print('-' * 88)
+    for nombre, (f_inicio, f_fin, sede) in escenarios:
+        where, params = filtro_ingresos(f_inicio, f_fin, sede)
+        where_r, params_r = filtro_ingresos(f_inicio, f_fin, sede, alias='R')
+
+        antes = _consultas_antes(where, where_r, tuple(params))
+        fuente = _FUENTE_CRUDA.format(ingresos=TABLA, where=where_r)
+        ahora = [('agregado', _SQL_AGREGADO.format(fuente=fuente, salas=TABLA_SALAS), tuple(params_r))]
+
+        t_antes, lect_antes, res_antes = _medir(cursor, antes, args.repeticiones)
+        t_ahora, lect_ahora, res_ahora = _medir(cursor, ahora, args.repeticiones)
+
+        agregado = _repartir_agregado(res_ahora['agregado'])
+        esperado = _a_diccionario(res_antes)
+        distintos = [k for k in esperado if esperado[k] != agregado.get(k)]
+        aviso = f"  [!] difiere: {', '.join(distintos)}" if distintos else ''
+        print(f"{nombre:<26} {len(antes):>5} → 1 {lect_antes:>9} {t_antes:>11.1f} {lect_ahora:>9} {t_ahora:>11.1f} "
+              f"{t_antes / t_ahora if t_ahora else 0:>6.1f}x{aviso}")
+
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,158 @@
+"""
+Benchmark de los filtros de fecha/sede sobre RegistroIngresos.
+
+Crea una tabla temporal con la forma de RegistroIngresos (por defecto un
+millón de filas repartidas en el último año, con índice en FechaHora) y
+compara los predicados anteriores (CAST(FechaHora AS DATE/TIME),
+ISNULL(Sede, 'Central')) contra los que genera utils/filtros_fecha.py.
+Por cada escenario reporta la mediana de tiempo y si el plan usó Index Seek.
+
+Uso (desde la raíz del proyecto, con el .env de la BD configurado):
+
+    python -m benchmarks.filtros_fecha --filas 1000000 --repeticiones 5
+
+No modifica tablas reales: todo ocurre en #RegistroIngresosBench.
+"""
+import re
+import time
+import argparse
+import statistics
+from datetime import date, timedelta
+
+try:
+    from dotenv import load_dotenv
+    load_dotenv()
+except ImportError:
+    pass
+
+from db import crear_conexion_directa
+from utils.filtros_fecha import filtro_ingresos, filtro_sede
+
+TABLA = '#RegistroIngresosBench'
+
+
+def _crear_tabla(cursor, filas):
+    cursor.execute(f"""
+        SET NOCOUNT ON;
+        CREATE TABLE {TABLA} (
+            RegistroID INT IDENTITY(1,1) PRIMARY KEY,
+            SalaID INT NOT NULL,
+            Sede NVARCHAR(50) NULL,
+            TipoUsuario NVARCHAR(50) NOT NULL,
+            FechaHora DATETIME NOT NULL
+        );
+
+        WITH N AS (
+            SELECT TOP (?) ROW_NUMBER() OVER (ORDER BY (SELECT NULL)) AS n
+            FROM sys.all_objects a CROSS JOIN sys.all_objects b CROSS JOIN sys.all_objects c
+        )
+        INSERT INTO {TABLA} (SalaID, Sede, TipoUsuario, FechaHora)
+        SELECT
+            1 + n % 12,
+            CASE n % 10 WHEN 0 THEN 'Pasco' WHEN 1 THEN 'Yanahuanca' WHEN 2 THEN 'Central' WHEN 3 THEN 'Central' ELSE NULL END,
+            CASE n % 20 WHEN 0 THEN 'Visitante' WHEN 1 THEN 'Egresado' WHEN 2 THEN 'Docente' WHEN 3 THEN 'Administrativo' ELSE 'Alumno' END,
+            -- Un año hacia atrás, entre las 08:00 y las 20:45
+            DATEADD(SECOND, (n * 7919) % 45900,
+                DATEADD(HOUR, 8, CAST(DATEADD(DAY, -((n * 31) % 365), CAST(GETDATE() AS DATE)) AS DATETIME)))
+        FROM N;
+
+        CREATE INDEX IX_Bench_FechaHora ON {TABLA} (FechaHora) INCLUDE (Sede, SalaID, TipoUsuario);
+    """, (filas,))
+
+
+def _escenarios():
+    hoy = date.today()
+    hace_7 = (hoy - timedelta(days=6)).isoformat()
+    hace_30 = (hoy - timedelta(days=29)).isoformat()
+    hace_180 = (hoy - timedelta(days=179)).isoformat()
+    hoy_txt = hoy.isoformat()
+
+    def nuevo(*args, **kwargs):
+        return filtro_ingresos(*args, **kwargs)
+
+    sql_central, _ = filtro_sede('Central')
+    return [
+        ('Hoy (dashboard/reporte_hoy)',
+         ("CAST(FechaHora AS DATE) = CAST(GETDATE() AS DATE)", []),
+         nuevo()),
+        ('Contador de sala (hoy)',
+         ("SalaID = ? AND CAST(FechaHora AS DATE) = CAST(GETDATE() AS DATE)", [3]),
+         (lambda w, p: ("SalaID = ? AND " + w, [3] + p))(*nuevo(hoy_txt, hoy_txt))),
+        ('Rango 7 días (reporte_rango)',
+         ("CAST(FechaHora AS DATE) >= ? AND CAST(FechaHora AS DATE) <= ?", [hace_7, hoy_txt]),
+         nuevo(hace_7, hoy_txt)),
+        ('Rango 30 días + 08:00-10:00',
+         ("CAST(FechaHora AS DATE) >= ? AND CAST(FechaHora AS DATE) <= ? "
+          "AND CAST(FechaHora AS TIME) >= ? AND CAST(FechaHora AS TIME) <= ?", [hace_30, hoy_txt, '08:00', '10:00']),
+         nuevo(hace_30, hoy_txt, None, '08:00', '10:00')),
+        ('Rango 180 días + 08:00-10:00',
+         ("CAST(FechaHora AS DATE) >= ? AND CAST(FechaHora AS DATE) <= ? "
+          "AND CAST(FechaHora AS TIME) >= ? AND CAST(FechaHora AS TIME) <= ?", [hace_180, hoy_txt, '08:00', '10:00']),
+         nuevo(hace_180, hoy_txt, None, '08:00', '10:00')),
+        ('Hoy, sede Central',
+         ("CAST(FechaHora AS DATE) = CAST(GETDATE() AS DATE) AND ISNULL(Sede, 'Central') = 'Central'", []),
+         nuevo(sede='Central')),
+        ('Rango 30 días, sede Pasco',
+         ("CAST(FechaHora AS DATE) >= ? AND CAST(FechaHora AS DATE) <= ? AND ISNULL(Sede, 'Central') = ?",
+          [hace_30, hoy_txt, 'Pasco']),
+         nuevo(hace_30, hoy_txt, 'Pasco')),
+        ('Pisos de Central (hoy)',
+         ("ISNULL(Sede, 'Central') = 'Central' AND CAST(FechaHora AS DATE) = CAST(GETDATE() AS DATE)", []),
+         (lambda w, p: (sql_central + " AND " + w, p))(*nuevo())),
+    ]
+
+
+def _medir(cursor, where, params, repeticiones):
+    sql = f"SELECT COUNT(*) FROM {TABLA} WHERE {where}"
+    tiempos = []
+    total = None
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        cursor.execute(sql, params)
+        total = cursor.fetchone()[0]
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+
+    # Plan real de una ejecución adicional
+    cursor.execute("SET STATISTICS XML ON")
+    cursor.execute(sql, params)
+    cursor.fetchall()
+    plan = ''
+    if cursor.nextset():
+        fila = cursor.fetchone()
+        plan = fila[0] if fila else ''
+    cursor.execute("SET STATISTICS XML OFF")
+
+    operadores = set(re.findall(r'PhysicalOp="([^"]+)"', plan))
+    acceso = 'Seek' if 'Index Seek' in operadores else ('Scan' if operadores else '?')
+    return statistics.median(tiempos), total, acceso
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de filtros de fecha sobre RegistroIngresos')
+    parser.add_argument('--filas', type=int, default=1000000)
+    parser.add_argument('--repeticiones', type=int, default=5)
+    args = parser.parse_args()
+
+    conn = crear_conexion_directa()
+    conn.autocommit = True
+    cursor = conn.cursor()
+
+    print(f"[*] Generando {args.filas} filas en {TABLA}...")
+    inicio = time.perf_counter()
+    _crear_tabla(cursor, args.filas)
+    print(f"[*] Tabla lista en {time.perf_counter() - inicio:.1f} s\n")
+
+    print(f"{'Escenario':<34} {'Filas':>8} {'Antes (ms)':>11} {'Plan':>5} {'Ahora (ms)':>11} {'Plan':>5} {'Mejora':>7}")
+    print('-' * 88)
+    for nombre, (where_antes, params_antes), (where_ahora, params_ahora) in _escenarios():
+        t_antes, filas_antes, plan_antes = _medir(cursor, where_antes, params_antes, args.repeticiones)
+        t_ahora, filas_ahora, plan_ahora = _medir(cursor, where_ahora, params_ahora, args.repeticiones)
+        aviso = '' if filas_antes == filas_ahora else f'  [!] {filas_antes} vs {filas_ahora} filas'
+        print(f"{nombre:<34} {filas_ahora:>8} {t_antes:>11.1f} {plan_antes:>5} {t_ahora:>11.1f} {plan_ahora:>5} "
+              f"{t_antes / t_ahora if t_ahora else 0:>6.1f}x{aviso}")
+
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,19 +1,379 @@
 import os
+import time
+import threading
+from collections import deque
+
 import pyodbc
 from dotenv import load_dotenv
 
 # Cargar variables de entorno
 load_dotenv()
 
+# ============================================================
+# CONFIGURACIÓN DEL POOL DE CONEXIONES
+# ============================================================
+# Tamaño máximo del pool (igual a los 16 hilos de Waitress). 0 = sin pool.
+POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 16))
+# Segundos que un hilo espera por una conexión libre antes de rendirse
+POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', 10))
+# Pool aparte para los hilos de segundo plano (write-behind, replay del journal,
+# tareas programadas, padrones, productores SSE, importaciones Excel), así no
+# le quitan conexiones a las peticiones.
+POOL_FONDO_SIZE = int(os.getenv('DB_POOL_FONDO_SIZE', 6))
+POOL_FONDO_TIMEOUT = float(os.getenv('DB_POOL_FONDO_TIMEOUT', 30))
+# Vida máxima de una conexión física antes de reciclarla (segundos)
+POOL_MAX_LIFETIME = float(os.getenv('DB_POOL_MAX_LIFETIME', 1800))
+# Si una conexión estuvo ociosa más de esto, se valida con SELECT 1 al prestarla
+POOL_PING_IDLE = float(os.getenv('DB_POOL_PING_IDLE', 30))
+# Timeout de login ODBC (segundos)
+DB_CONNECT_TIMEOUT = int(os.getenv('DB_CONNECT_TIMEOUT', 15))
+# Timeout de cada consulta en las conexiones del pool (segundos, 0 = sin límite):
+# con el servidor colgado un execute no retiene el hilo indefinidamente
+DB_QUERY_TIMEOUT = int(os.getenv('DB_QUERY_TIMEOUT', 30))
+# El pool de fondo corre tareas largas (resumen, importaciones, backfills)
+DB_QUERY_TIMEOUT_FONDO = int(os.getenv('DB_QUERY_TIMEOUT_FONDO', 600))
+
+
+def _construir_conn_str():
+    return (
+        f"DRIVER={os.getenv('DB_DRIVER')};"
+        f"SERVER={os.getenv('DB_SERVER')};"
+        f"DATABASE={os.getenv('DB_DATABASE')};"
+        f"Trusted_Connection={os.getenv('DB_TRUSTED_CONNECTION')};"
+    )
+
+
+def crear_conexion_directa(timeout=None, timeout_consulta=0):
+    """
+    Abre una conexión física nueva a SQL Server, fuera del pool.
+    timeout: login (segundos); timeout_consulta: de cada execute (0 = sin límite).
+    Lanza la excepción de pyodbc si falla.
+    """
+    conn = pyodbc.connect(_construir_conn_str(), timeout=timeout or DB_CONNECT_TIMEOUT)
+    if timeout_consulta:
+        conn.timeout = timeout_consulta
+    return conn
+
+
+class PoolAgotado(TimeoutError):
+    """Todas las conexiones del pool siguen prestadas al vencer la espera (la BD puede estar bien)."""
+
+
+class PooledConnection:
+    """
+    Envoltura de una conexión pyodbc prestada por el pool.
+    Se comporta como la conexión original, pero close() la devuelve al pool
+    en lugar de cerrar el socket, así ningún módulo tiene que cambiar.
+    Sin pool (pool=None) close() cierra la conexión física.
+    """
+
+    def __init__(self, pool, raw, creada_en):
+        self._pool = pool
+        self._raw = raw
+        self._creada_en = creada_en
+        self._ultimo_uso = time.monotonic()
+
+    def close(self):
+        # Idempotente: se puede cerrar antes del finally que también la cierra
+        if self._raw is None:
+            return
+        raw, self._raw = self._raw, None
+        if self._pool is None:
+            raw.close()
+        else:
+            self._pool._devolver(raw, self._creada_en)
+
+    @property
+    def closed(self):
+        return self._raw is None
+
+    def __getattr__(self, name):
+        raw = self.__dict__.get('_raw')
+        if raw is None:
+            raise pyodbc.ProgrammingError('Attempt to use a closed connection.')
+        return getattr(raw, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # Igual que pyodbc: commit si todo salió bien, rollback si hubo excepción
+        if self._raw is None:
+            return False
+        if exc_type is None:
+            self._raw.commit()
+        else:
+            self._raw.rollback()
+        return False
+
+    def __del__(self):
+        # Si alguien olvidó cerrar la conexión, no perdemos el cupo del pool
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+class ConnectionPool:
+    """
+    Pool acotado y thread-safe de conexiones pyodbc.
+    - Espera acotada (timeout) cuando todas las conexiones están ocupadas.
+    - Valida con SELECT 1 las conexiones que estuvieron ociosas mucho tiempo.
+    - Recicla las conexiones que superan su vida máxima.
+    """
+
+    def __init__(self, max_size, timeout, max_lifetime, ping_idle, timeout_consulta=0):
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.ping_idle = ping_idle
+        self.timeout_consulta = timeout_consulta
+        # Login de las conexiones nuevas (None = DB_CONNECT_TIMEOUT)
+        self.timeout_login = None
+
+        self._cond = threading.Condition(threading.Lock())
+        self._idle = deque()  # (raw, creada_en, devuelta_en)
+        self._total = 0
+        self._in_use = 0
+
+        self._waits = 0
+        self._timeouts = 0
+        self._created = 0
+        self._recycled = 0
+        self._discarded = 0
+
+    def _cerrar_fisica(self, raw):
+        try:
+            raw.close()
+        except Exception:
+            pass
+
+    def _expirada(self, creada_en, ahora):
+        return self.max_lifetime > 0 and (ahora - creada_en) > self.max_lifetime
+
+    def _viva(self, raw):
+        try:
+            cursor = raw.cursor()
+            cursor.execute("SELECT 1")
+            cursor.fetchone()
+            cursor.close()
+            return True
+        except Exception:
+            return False
+
+    def _liberar_cupo(self):
+        with self._cond:
+            self._total -= 1
+            self._cond.notify()
+
+    def obtener(self):
+        limite = time.monotonic() + self.timeout
+        esperando = False
+
+        while True:
+            candidata = None
+            crear = False
+
+            with self._cond:
+                while True:
+                    if self._idle:
+                        candidata = self._idle.pop()
+                        self._in_use += 1
+                        break
+                    if self._total < self.max_size:
+                        self._total += 1
+                        self._in_use += 1
+                        crear = True
+                        break
+
+                    restante = limite - time.monotonic()
+                    if restante <= 0:
+                        self._timeouts += 1
+                        raise PoolAgotado(
+                            f"Pool de conexiones agotado ({self.max_size} en uso) tras {self.timeout}s de espera"
+                        )
+                    if not esperando:
+                        self._waits += 1
+                        esperando = True
+                    self._cond.wait(restante)
+
+            if crear:
+                try:
+                    raw = crear_conexion_directa(self.timeout_login, self.timeout_consulta)
+                except Exception:
+                    with self._cond:
+                        self._in_use -= 1
+                    self._liberar_cupo()
+                    raise
+                with self._cond:
+                    self._created += 1
+                return PooledConnection(self, raw, time.monotonic())
+
+            raw, creada_en, devuelta_en = candidata
+            ahora = time.monotonic()
+
+            # Reciclar conexiones viejas o que no responden; reintentar el préstamo
+            descartar = False
+            if self._expirada(creada_en, ahora):
+                descartar = True
+                with self._cond:
+                    self._recycled += 1
+            elif (ahora - devuelta_en) > self.ping_idle and not self._viva(raw):
+                descartar = True
+                with self._cond:
+                    self._discarded += 1
+
+            if descartar:
+                self._cerrar_fisica(raw)
+                with self._cond:
+                    self._in_use -= 1
+                self._liberar_cupo()
+                continue
+
+            return PooledConnection(self, raw, creada_en)
+
+    def _devolver(self, raw, creada_en):
+        ahora = time.monotonic()
+        reutilizable = not self._expirada(creada_en, ahora)
+
+        if reutilizable:
+            # Nunca heredar una transacción abierta al siguiente hilo
+            try:
+                raw.rollback()
+            except Exception:
+                reutilizable = False
+
+        with self._cond:
+            self._in_use -= 1
+            if reutilizable:
+                self._idle.append((raw, creada_en, ahora))
+                self._cond.notify()
+                return
+            if self._expirada(creada_en, ahora):
+                self._recycled += 1
+            else:
+                self._discarded += 1
+
+        self._cerrar_fisica(raw)
+        self._liberar_cupo()
+
+    def cerrar_todo(self):
+        """Cierra las conexiones ociosas (las prestadas se cierran al devolverse)."""
+        with self._cond:
+            ociosas = list(self._idle)
+            self._idle.clear()
+            self._total -= len(ociosas)
+            self._cond.notify_all()
+        for raw, _, _ in ociosas:
+            self._cerrar_fisica(raw)
+
+    def estadisticas(self):
+        with self._cond:
+            return {
+                'max_size': self.max_size,
+                'size': self._total,
+                'idle': len(self._idle),
+                'in_use': self._in_use,
+                'waits': self._waits,
+                'timeouts': self._timeouts,
+                'created': self._created,
+                'recycled': self._recycled,
+                'discarded': self._discarded
+            }
+
+
+_pool = (ConnectionPool(POOL_SIZE, POOL_TIMEOUT, POOL_MAX_LIFETIME, POOL_PING_IDLE, DB_QUERY_TIMEOUT)
+         if POOL_SIZE > 0 else None)
+_pool_fondo = (ConnectionPool(POOL_FONDO_SIZE, POOL_FONDO_TIMEOUT, POOL_MAX_LIFETIME, POOL_PING_IDLE,
+                              DB_QUERY_TIMEOUT_FONDO)
+               if POOL_SIZE > 0 and POOL_FONDO_SIZE > 0 else None)
+
+# Pool de los hilos del front end asyncio de terminales (servidor_terminales);
+# se crea al iniciarlo, así sus consultas no compiten con los hilos de Waitress
+_pool_terminales = None
+
+_hilo = threading.local()
+
+# Login de las conexiones nuevas de las peticiones (None = DB_CONNECT_TIMEOUT)
+_timeout_login_peticiones = None
+
+
+def usar_pool_fondo():
+    """Marca el hilo actual como de segundo plano: sus conexiones salen del pool de fondo."""
+    _hilo.fondo = True
+
+
+def crear_pool_terminales(tamano):
+    global _pool_terminales
+    if POOL_SIZE > 0 and tamano > 0 and _pool_terminales is None:
+        _pool_terminales = ConnectionPool(tamano, POOL_TIMEOUT, POOL_MAX_LIFETIME, POOL_PING_IDLE, DB_QUERY_TIMEOUT)
+        _pool_terminales.timeout_login = _timeout_login_peticiones
+
+
+def acortar_timeout_login(segundos):
+    """
+    Login corto para las conexiones nuevas de las peticiones (no las de fondo):
+    con el modo offline del escáner, una BD caída se detecta en `segundos` y
+    no en DB_CONNECT_TIMEOUT antes del primer acuse provisional.
+    """
+    global _timeout_login_peticiones
+    _timeout_login_peticiones = segundos
+    for pool in (_pool, _pool_terminales):
+        if pool is not None:
+            pool.timeout_login = segundos
+
+
+def usar_pool_terminales():
+    """Marca el hilo actual como worker de terminales: sus conexiones salen de su pool."""
+    _hilo.terminales = True
+
+
+def _pool_del_hilo():
+    if _pool_fondo is not None and getattr(_hilo, 'fondo', False):
+        return _pool_fondo
+    if _pool_terminales is not None and getattr(_hilo, 'terminales', False):
+        return _pool_terminales
+    return _pool
+
+
 def get_db_connection():
+    _hilo.pool_agotado = False
     try:
-        conn_str = (
-            f"DRIVER={os.getenv('DB_DRIVER')};"
-            f"SERVER={os.getenv('DB_SERVER')};"
-            f"DATABASE={os.getenv('DB_DATABASE')};"
-            f"Trusted_Connection={os.getenv('DB_TRUSTED_CONNECTION')};"
-        )
-        return pyodbc.connect(conn_str, timeout=15)
+        pool = _pool_del_hilo()
+        if pool is None:
+            fondo = getattr(_hilo, 'fondo', False)
+            raw = crear_conexion_directa(None if fondo else _timeout_login_peticiones,
+                                         DB_QUERY_TIMEOUT_FONDO if fondo else DB_QUERY_TIMEOUT)
+            return PooledConnection(None, raw, time.monotonic())
+        return pool.obtener()
     except Exception as e:
+        _hilo.pool_agotado = isinstance(e, PoolAgotado)
         print(f"--- ERROR DE CONEXIÓN BD --- : {e}")
-        return None
\ No newline at end of file
+        return None
+
+
+def pool_agotado():
+    """
+    True si el último get_db_connection() de este hilo devolvió None por falta de
+    conexiones libres en el pool, y no porque SQL Server no respondiera.
+    """
+    return getattr(_hilo, 'pool_agotado', False)
+
+
+_ESTADISTICAS_VACIAS = {'max_size': 0, 'size': 0, 'idle': 0, 'in_use': 0, 'waits': 0,
+                        'timeouts': 0, 'created': 0, 'recycled': 0, 'discarded': 0}
+
+
+def obtener_estadisticas_pool():
+    """Contadores del pool para monitoreo (tamaño, en uso, esperas, timeouts)."""
+    estadisticas = _pool.estadisticas() if _pool is not None else dict(_ESTADISTICAS_VACIAS)
+    estadisticas['fondo'] = _pool_fondo.estadisticas() if _pool_fondo is not None else dict(_ESTADISTICAS_VACIAS)
+    estadisticas['terminales'] = (_pool_terminales.estadisticas() if _pool_terminales is not None
+                                  else dict(_ESTADISTICAS_VACIAS))
+    return estadisticas
+
+
+def cerrar_pool():
+    for pool in (_pool, _pool_fondo, _pool_terminales):
+        if pool is not None:
+            pool.cerrar_todo()
@@ -0,0 +1,60 @@
+-- ============================================================
+-- MIGRACIÓN 001: hora de lectura del controlador (FechaHoraLectura)
+-- ============================================================
+-- Ejecutar en SSMS en una ventana de mantenimiento, no la corre la app.
+--
+-- Los lotes de /procesar_ingreso_batch y el replay del journal offline
+-- registran con sp_RegistrarIngreso, que pone FechaHora con la hora del
+-- servidor. La hora en que el controlador leyó el carnet se guarda en
+-- FechaHoraLectura sin cambiar el procedimiento: la app la deja en el
+-- SESSION_CONTEXT 'lectura_escaneo' justo antes del EXEC y el DEFAULT de la
+-- columna la toma en el INSERT del propio procedimiento (nunca por
+-- @@IDENTITY). Requiere SQL Server 2016 o superior.
+--
+-- Una columna nueva rompe un INSERT INTO RegistroIngresos VALUES (...) sin
+-- lista de columnas: la migración revisa antes el código de
+-- sp_RegistrarIngreso y se detiene si lo encuentra. En ese caso hay que
+-- agregar la lista de columnas al INSERT del procedimiento y volver a
+-- ejecutar este script.
+--
+-- Idempotente: puede volver a ejecutarse.
+
+SET XACT_ABORT ON;
+BEGIN TRAN;
+
+IF OBJECT_ID('MigracionesEsquema') IS NULL
+    CREATE TABLE MigracionesEsquema (
+        Version INT NOT NULL PRIMARY KEY,
+        Descripcion NVARCHAR(200) NOT NULL,
+        AplicadaEn DATETIME NOT NULL DEFAULT GETDATE()
+    );
+
+DECLARE @sp NVARCHAR(MAX) = UPPER(OBJECT_DEFINITION(OBJECT_ID('sp_RegistrarIngreso')));
+IF @sp IS NULL
+    THROW 50001, 'No existe sp_RegistrarIngreso (o no hay permiso para leer su definición).', 1;
+
+-- Definición normalizada: un solo espacio, sin corchetes ni esquema
+SET @sp = REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(@sp, CHAR(13), ' '), CHAR(10), ' '), CHAR(9), ' '), '[', ''), ']', '');
+SET @sp = REPLACE(@sp, 'DBO.', '');
+WHILE CHARINDEX('  ', @sp) > 0
+    SET @sp = REPLACE(@sp, '  ', ' ');
+
+IF @sp LIKE '%INSERT INTO REGISTROINGRESOS VALUES%' OR @sp LIKE '%INSERT REGISTROINGRESOS VALUES%'
+   OR @sp LIKE '%INSERT INTO REGISTROINGRESOS SELECT%' OR @sp LIKE '%INSERT REGISTROINGRESOS SELECT%'
+    THROW 50002, 'sp_RegistrarIngreso inserta en RegistroIngresos sin lista de columnas; agréguela antes de esta migración.', 1;
+
+IF COL_LENGTH('RegistroIngresos', 'FechaHoraLectura') IS NULL
+    ALTER TABLE RegistroIngresos ADD FechaHoraLectura DATETIME NULL
+        CONSTRAINT DF_RegistroIngresos_FechaHoraLectura
+        DEFAULT (CONVERT(DATETIME, SESSION_CONTEXT(N'lectura_escaneo')));
+ELSE IF NOT EXISTS (SELECT 1 FROM sys.default_constraints
+                    WHERE name = 'DF_RegistroIngresos_FechaHoraLectura')
+    -- Columna creada por versiones anteriores de la app al arrancar, sin DEFAULT
+    ALTER TABLE RegistroIngresos ADD CONSTRAINT DF_RegistroIngresos_FechaHoraLectura
+        DEFAULT (CONVERT(DATETIME, SESSION_CONTEXT(N'lectura_escaneo'))) FOR FechaHoraLectura;
+
+IF NOT EXISTS (SELECT 1 FROM MigracionesEsquema WHERE Version = 1)
+    INSERT INTO MigracionesEsquema (Version, Descripcion)
+    VALUES (1, 'FechaHoraLectura en RegistroIngresos (DEFAULT desde SESSION_CONTEXT)');
+
+COMMIT;
@@ -0,0 +1,42 @@
+-- ============================================================
+-- MIGRACIÓN 002: tipo e ID de la persona de cada ingreso
+-- ============================================================
+-- Ejecutar en SSMS en una ventana de mantenimiento, no la corre la app.
+--
+-- Agrega a RegistroIngresos las columnas calculadas PERSISTED
+-- TipoPersonaIngreso y PersonaIngresoID, con la clave (TipoPersona,
+-- PersonaID) de la vista OrigenesPersona. Se calculan al insertar y tienen
+-- estadísticas, así el JOIN con la vista compara columnas y cada rama busca
+-- por su clave primaria. Mientras no existan, la app hace el mismo JOIN con
+-- las expresiones CASE/COALESCE.
+--
+-- Agregar columnas PERSISTED reescribe RegistroIngresos completa y la
+-- bloquea mientras tanto: los escaneos esperan hasta que termine. Conviene
+-- correrla con la biblioteca cerrada y medir antes el tamaño de la tabla.
+--
+-- Idempotente: puede volver a ejecutarse.
+
+SET XACT_ABORT ON;
+BEGIN TRAN;
+
+IF OBJECT_ID('MigracionesEsquema') IS NULL
+    CREATE TABLE MigracionesEsquema (
+        Version INT NOT NULL PRIMARY KEY,
+        Descripcion NVARCHAR(200) NOT NULL,
+        AplicadaEn DATETIME NOT NULL DEFAULT GETDATE()
+    );
+
+IF COL_LENGTH('RegistroIngresos', 'PersonaIngresoID') IS NULL
+    ALTER TABLE RegistroIngresos ADD
+        TipoPersonaIngreso AS (CASE WHEN AlumnoID IS NOT NULL THEN 'Alumno'
+                                    WHEN VisitanteID IS NOT NULL THEN 'Visitante'
+                                    WHEN EgresadoID IS NOT NULL THEN 'Egresado'
+                                    WHEN PersonalID IS NOT NULL THEN 'Administrativo'
+                                    WHEN DocenteID IS NOT NULL THEN 'Docente' END) PERSISTED,
+        PersonaIngresoID AS (COALESCE(AlumnoID, VisitanteID, EgresadoID, PersonalID, DocenteID)) PERSISTED;
+
+IF NOT EXISTS (SELECT 1 FROM MigracionesEsquema WHERE Version = 2)
+    INSERT INTO MigracionesEsquema (Version, Descripcion)
+    VALUES (2, 'TipoPersonaIngreso y PersonaIngresoID PERSISTED en RegistroIngresos');
+
+COMMIT;
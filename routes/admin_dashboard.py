@@ -1,9 +1,8 @@
 from flask import Blueprint, render_template, request, Response, session, send_file
 from utils.queries_dashboard import obtener_datos_dashboard, obtener_registros_csv
+from utils.canal_dashboard import canal_dashboard
 from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
 from openpyxl.utils import get_column_letter
-import json
-import time
 import io
 import pandas as pd
 
@@ -44,29 +43,16 @@ def admin_dashboard():
 @admin_dashboard_bp.route('/api/dashboard_stream')
 def api_dashboard_stream():
     sede_filtro = session.get('admin_sede') if session.get('admin_rol') == 'Supervisor' else None
-    
-    def generate():
-        while True:
-            try:
-                dash_data = obtener_datos_dashboard(None, None, sede_filtro, None, None)
-                payload = {
-                    'total_hoy': dash_data['total_hoy'],
-                    'total_alumnos': dash_data['total_alumnos'],
-                    'total_visitantes': dash_data['total_visitantes'],
-                    'total_egresados': dash_data['total_egresados'],
-                    'total_personal': dash_data['total_personal'],
-                    'total_docentes': dash_data.get('total_docentes', 0),
-                    'pisos': dash_data['pisos'],
-                    'salas': dash_data.get('salas', {}),
-                    'sedes': dash_data['sedes'],
-                    'ultimos': dash_data['ultimos']
-                }
-                yield f"data: {json.dumps(payload)}\n\n"
-            except Exception as e:
-                print("SSE Error:", e)
-            time.sleep(5)
-            
-    return Response(generate(), mimetype='text/event-stream')
+
+    # Un solo productor calcula los datos por sede; cada pestaña solo recibe
+    # lo que cambió. 204 = tope de streams alcanzado, el navegador reintenta.
+    sid, suscriptor = canal_dashboard.suscribir(sede_filtro)
+    if sid is None:
+        return '', 204
+
+    respuesta = Response(suscriptor.mensajes(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
+    respuesta.call_on_close(lambda: canal_dashboard.cancelar(sid))
+    return respuesta
 
 @admin_dashboard_bp.route('/exportar_ingresos_excel')
 def exportar_ingresos_excel():
@@ -1,8 +1,9 @@
 from flask import Blueprint, render_template, request, jsonify
 from utils.queries_admin_eventos import buscar_eventos, guardar_evento, borrar_evento, procesar_excel_invitados_async
-from utils.queries_admin_eventos_detalle import obtener_asistentes_evento
+from utils.queries_admin_eventos_detalle import obtener_info_evento, listar_asistentes_evento
 import threading
 from utils.task_manager import create_task
+from utils.padrones_eventos import padrones_eventos
 
 admin_eventos_bp = Blueprint('admin_eventos', __name__, url_prefix='/admin')
 
@@ -72,13 +73,34 @@ def importar_invitados():
         print("ERROR CRÍTICO AL LEER EXCEL VIP:", str(e))
         return jsonify({'status': 'error', 'msg': str(e)})
 
+@admin_eventos_bp.route('/reconstruir_padron_evento/<int:id>', methods=['POST'])
+def reconstruir_padron_evt(id):
+    # Para cargas de invitados o personas hechas por fuera del importador
+    padrones_eventos.reconstruir(id)
+    return jsonify({'status': 'success', 'msg': 'El padrón del evento se está reconstruyendo.'})
+
 @admin_eventos_bp.route('/evento_detalle/<int:id>')
 def evento_detalle_view(id):
-    resultado = obtener_asistentes_evento(id)
+    # Solo encabezado y estadísticas; la tabla se carga por páginas desde el navegador
+    resultado = obtener_info_evento(id)
     if resultado.get('status') == 'error':
         return "Evento no encontrado o error", 404
     
     return render_template('admin_evento_detalle.html', 
+                          evento_id=id,
                           evento=resultado['evento'], 
-                          asistentes=resultado['data'],
-                          stats=resultado['stats'])
+                          stats=resultado['stats'],
+                          total=sum(resultado['stats'].values()))
+
+@admin_eventos_bp.route('/evento_detalle/<int:id>/asistentes')
+def evento_asistentes_api(id):
+    resultado = listar_asistentes_evento(
+        id,
+        tipo=request.args.get('tipo') or None,
+        texto=request.args.get('q', '').strip(),
+        orden=request.args.get('orden', 'desc'),
+        despues_de=request.args.get('despues_de', type=int),
+        desde_id=request.args.get('desde_id', type=int),
+        limite=request.args.get('limite', type=int)
+    )
+    return jsonify(resultado)
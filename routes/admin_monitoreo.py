@@ -0,0 +1,72 @@
+from flask import Blueprint, jsonify, request, session
+from db import obtener_estadisticas_pool
+from utils.indice_identidades import indice_identidades
+from utils.escritura_diferida import escritura_diferida
+from utils.queries_ingreso import escaneos_repetidos
+from utils.journal_offline import journal_offline
+from servidor_terminales import servidor_terminales
+from utils.contadores_salas import contadores_salas
+from utils.metricas_escaneo import metricas_escaneo
+from utils.padrones_eventos import padrones_eventos
+from utils.queries_eventos import estadisticas_agenda_eventos
+from utils.canal_eventos import canal_eventos
+from utils.planificador import planificador
+from utils.canal_dashboard import canal_dashboard
+from utils.queries_dashboard import estadisticas_cache_dashboard
+from utils.resumen_ingresos import reconstruir_resumen_ingresos
+
+admin_monitoreo_bp = Blueprint('admin_monitoreo', __name__, url_prefix='/admin')
+
+@admin_monitoreo_bp.route('/api/monitoreo')
+def api_monitoreo():
+    return jsonify({
+        'pool_bd': obtener_estadisticas_pool(),
+        'indice_identidades': indice_identidades.estadisticas(),
+        'escritura_diferida': escritura_diferida.estadisticas(),
+        'escaneos_repetidos': escaneos_repetidos.stats(),
+        'journal_offline': journal_offline.estadisticas(),
+        'servidor_terminales': servidor_terminales.estadisticas(),
+        'contadores_salas': contadores_salas.estadisticas(),
+        'padrones_eventos': padrones_eventos.estadisticas(),
+        'agenda_eventos': estadisticas_agenda_eventos(),
+        'canal_eventos': canal_eventos.estadisticas(),
+        'canal_dashboard': canal_dashboard.estadisticas(),
+        'cache_dashboard': estadisticas_cache_dashboard(),
+        'tareas': planificador.estadisticas()
+    })
+
+@admin_monitoreo_bp.route('/api/monitoreo/cola_ingresos')
+def api_cola_ingresos():
+    return jsonify(escritura_diferida.estadisticas())
+
+@admin_monitoreo_bp.route('/api/metrics/scan')
+def api_metricas_escaneo():
+    # ?minutos=5 limita la ventana (por defecto, todo lo retenido)
+    minutos = request.args.get('minutos', type=int)
+    return jsonify(metricas_escaneo.resumen(minutos))
+
+@admin_monitoreo_bp.route('/api/tareas')
+def api_tareas():
+    return jsonify(planificador.estadisticas())
+
+def _solo_superadmin():
+    if session.get('admin_rol') != 'SuperAdmin':
+        return jsonify({'status': 'error', 'msg': 'Acceso denegado. Se requiere Nivel SuperAdmin.'}), 403
+    return None
+
+# Acciones de mantenimiento: fuera de /admin/api para que before_request valide el token CSRF
+@admin_monitoreo_bp.route('/tareas/<nombre>/ejecutar', methods=['POST'])
+def api_ejecutar_tarea(nombre):
+    denegado = _solo_superadmin()
+    if denegado:
+        return denegado
+    return jsonify(planificador.ejecutar_ahora(nombre))
+
+@admin_monitoreo_bp.route('/resumen_ingresos/reconstruir', methods=['POST'])
+def api_reconstruir_resumen_ingresos():
+    denegado = _solo_superadmin()
+    if denegado:
+        return denegado
+    # {"inicio": "2025-03-01", "fin": "2025-07-31"} rehace ese periodo; sin fechas, todo el resumen
+    data = request.get_json(silent=True) or {}
+    return jsonify(reconstruir_resumen_ingresos(data.get('inicio'), data.get('fin')))
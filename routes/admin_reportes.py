@@ -3,18 +3,22 @@ import pandas as pd
 import io
 from datetime import datetime
 from db import get_db_connection
+from utils.filtros_fecha import filtro_ingresos
+from utils.origenes_persona import persona_de_ingreso
 
 admin_reportes_bp = Blueprint('admin_reportes', __name__, url_prefix='/admin')
 
 @admin_reportes_bp.route('/reporte_hoy')
 def descargar_reporte():
     conn = get_db_connection()
-    sql = """
+    date_where, params = filtro_ingresos(alias='R')
+    joins_persona, persona = persona_de_ingreso('R')
+    sql = f"""
     SELECT 
         R.RegistroID as ID, 
-        COALESCE(A.NombreCompleto, V.NombreCompleto, E.NombreCompleto, P.ApellidosNombres, D.ApellidosNombres) as Persona, 
-        COALESCE(A.DNI, V.DNI, E.DNI, P.DNI, D.DNI) as DNI, 
-        COALESCE(A.Escuela, V.Institucion, E.EscuelaProfesional, P.Oficina, 'Escuela de ' + D.Facultad) as Origen, 
+        {persona['nombre']} as Persona, 
+        {persona['dni']} as DNI, 
+        {persona['origen_reporte']} as Origen, 
         ISNULL(R.TipoUsuario, 'Desconocido') as Tipo,
         ISNULL(R.Sede, 'Central') as Sede,
         CAST(R.Piso AS VARCHAR) as Piso, 
@@ -22,17 +26,12 @@ def descargar_reporte():
         R.Turno,
         FORMAT(R.FechaHora, 'HH:mm:ss') as Hora,
         FORMAT(R.FechaHora, 'dd/MM/yyyy') as Fecha
-    FROM RegistroIngresos R 
-    LEFT JOIN Alumnos A ON R.AlumnoID = A.AlumnoID
-    LEFT JOIN Visitantes V ON R.VisitanteID = V.VisitanteID
-    LEFT JOIN Egresados E ON R.EgresadoID = E.EgresadoID
-    LEFT JOIN PersonalAdministrativo P ON R.PersonalID = P.PersonalID
-    LEFT JOIN Docentes D ON R.DocenteID = D.DocenteID
+    FROM RegistroIngresos R{joins_persona}
     LEFT JOIN Salas S ON R.SalaID = S.SalaID
-    WHERE CAST(R.FechaHora AS DATE) = CAST(GETDATE() AS DATE) 
+    WHERE {date_where}
     ORDER BY R.FechaHora DESC
     """
-    df = pd.read_sql(sql, conn)
+    df = pd.read_sql(sql, conn, params=params)
     conn.close()
     
     output = io.BytesIO()
@@ -53,15 +52,21 @@ def reporte_rango():
     if not fecha_inicio or not fecha_fin:
         return "Error: Debes seleccionar ambas fechas", 400
 
+    try:
+        date_where, params = filtro_ingresos(fecha_inicio, fecha_fin, alias='R')
+    except ValueError:
+        return "Error: Formato de fecha inválido", 400
+
     conn = get_db_connection()
+    joins_persona, persona = persona_de_ingreso('R')
     
     # Consulta SQL filtrando por rango de fechas
-    sql = """
+    sql = f"""
     SELECT 
         R.RegistroID as ID,
-        COALESCE(A.NombreCompleto, V.NombreCompleto, E.NombreCompleto, P.ApellidosNombres, D.ApellidosNombres) as Persona,
-        COALESCE(A.DNI, V.DNI, E.DNI, P.DNI, D.DNI) as DNI,
-        COALESCE(A.Escuela, V.Institucion, E.EscuelaProfesional, P.Oficina, 'Escuela de ' + D.Facultad) as Origen,
+        {persona['nombre']} as Persona,
+        {persona['dni']} as DNI,
+        {persona['origen_reporte']} as Origen,
         ISNULL(R.TipoUsuario, 'Desconocido') as Tipo,
         ISNULL(R.Sede, 'Central') as Sede,
         CAST(R.Piso AS VARCHAR) as Piso,
@@ -69,21 +74,15 @@ def reporte_rango():
         R.Turno,
         FORMAT(R.FechaHora, 'HH:mm:ss') as Hora,
         FORMAT(R.FechaHora, 'dd/MM/yyyy') as Fecha
-    FROM RegistroIngresos R
-    LEFT JOIN Alumnos A ON R.AlumnoID = A.AlumnoID
-    LEFT JOIN Visitantes V ON R.VisitanteID = V.VisitanteID
-    LEFT JOIN Egresados E ON R.EgresadoID = E.EgresadoID
-    LEFT JOIN PersonalAdministrativo P ON R.PersonalID = P.PersonalID
-    LEFT JOIN Docentes D ON R.DocenteID = D.DocenteID
+    FROM RegistroIngresos R{joins_persona}
     LEFT JOIN Salas S ON R.SalaID = S.SalaID
-    WHERE CAST(R.FechaHora AS DATE) >= ? 
-    AND CAST(R.FechaHora AS DATE) <= ?
+    WHERE {date_where}
     ORDER BY R.FechaHora DESC
     """
     
     # Ejecutamos la consulta enviando las fechas
     # IMPORTANTE: Asegúrate de tener instalado openpyxl (pip install openpyxl)
-    df = pd.read_sql(sql, conn, params=(fecha_inicio, fecha_fin))
+    df = pd.read_sql(sql, conn, params=params)
     conn.close()
 
     output = io.BytesIO()
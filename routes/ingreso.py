@@ -1,7 +1,14 @@
-from flask import Blueprint, render_template, request, jsonify
+import queue
+from datetime import datetime, timedelta
+from flask import Blueprint, Response, render_template, request, jsonify
 from db import get_db_connection
 from utils.queries_eventos import obtener_agenda_eventos_hoy, procesar_ingreso_evento, verificar_estado_evento, obtener_sede_evento
-from utils.queries_ingreso import registrar_ingreso_general
+from utils.queries_ingreso import registrar_ingreso_general, registrar_ingresos_lote, MAX_ESCANEOS_LOTE
+from utils.contadores_salas import contadores_salas
+from utils.filtros_fecha import ATRASO_MAX_INGRESO
+from utils.metricas_escaneo import iniciar_traza, finalizar_traza, marcar_etapa, etiquetas_sala
+from utils import canal_eventos as modulo_canal_eventos
+from utils.canal_eventos import canal_eventos
 
 # Definimos el Blueprint
 ingreso_bp = Blueprint('ingreso', __name__)
@@ -40,21 +47,10 @@ def ingreso_sala(sala_id):
         conn.close()
         return "ERROR: Sala inactiva o no registrada en el sistema. Contacte Administración.", 404
         
-    # 2. NUEVO: Obtener la cantidad de ingresos exitosos de hoy para esta sala
-    contador_inicial = 0
-    try:
-        cursor.execute("""
-            SELECT COUNT(*) 
-            FROM RegistroIngresos 
-            WHERE SalaID = ? AND CAST(FechaHora AS DATE) = CAST(GETDATE() AS DATE)
-        """, (sala_id,))
-        res = cursor.fetchone()
-        if res:
-            contador_inicial = res[0]
-    except Exception as e:
-        print("Aviso - No se pudo cargar el contador inicial:", e)
-        
     conn.close()
+
+    # 2. Ingresos de hoy para esta sala (contador en vivo compartido por las terminales)
+    contador_inicial = contadores_salas.obtener(sala_id)
     
     # Pasamos el contador_inicial a la plantilla
     return render_template('ingreso.html', 
@@ -88,21 +84,10 @@ def filial(sede):
     nombre_sala = row.NombreSala
     piso = row.Piso
         
-    # Obtener la cantidad de ingresos exitosos de hoy para esta sala (filial)
-    contador_inicial = 0
-    try:
-        cursor.execute("""
-            SELECT COUNT(*) 
-            FROM RegistroIngresos 
-            WHERE SalaID = ? AND CAST(FechaHora AS DATE) = CAST(GETDATE() AS DATE)
-        """, (sala_id,))
-        res = cursor.fetchone()
-        if res:
-            contador_inicial = res[0]
-    except Exception as e:
-        print("Aviso - No se pudo cargar el contador inicial en filial:", e)
-
     conn.close()
+
+    # Ingresos de hoy para esta sala (filial), desde el contador en vivo
+    contador_inicial = contadores_salas.obtener(sala_id)
     
     return render_template('ingreso.html', 
                            sala_id=sala_id, 
@@ -111,35 +96,189 @@ def filial(sede):
                            sede=sede,
                            contador_inicial=contador_inicial)
 
-# API: PROCESAR EL ESCANEO
-@ingreso_bp.route('/procesar_ingreso', methods=['POST'])
-def procesar_ingreso():
-    data = request.json
+# ============================================================
+# LÓGICA DE LAS RUTAS DE TERMINALES
+# (compartida con el front end asyncio de servidor_terminales.py)
+# Cada función recibe datos ya decodificados y retorna (payload, código HTTP).
+# ============================================================
+def _lectura_erronea(codigo_str):
+    return not codigo_str or codigo_str in ['0', '0.0'] or codigo_str.replace('-', '').strip() == '' or len(codigo_str) < 4
+
+def _hora_lectura(client_timestamp, ahora):
+    """
+    Hora en que el controlador leyó el código (epoch en segundos/ms o ISO 8601).
+    Si falta, es inválida o el reloj del equipo está desfasado, se usa la del servidor.
+    """
+    if client_timestamp in (None, ''):
+        return ahora
+    try:
+        if isinstance(client_timestamp, (int, float)):
+            valor = float(client_timestamp)
+            momento = datetime.fromtimestamp(valor / 1000 if valor > 1e11 else valor)
+        else:
+            momento = datetime.fromisoformat(str(client_timestamp).replace('Z', '+00:00'))
+            if momento.tzinfo:
+                momento = momento.astimezone().replace(tzinfo=None)
+    except (ValueError, OverflowError, OSError):
+        return ahora
+
+    if momento > ahora + timedelta(minutes=1) or momento < ahora - ATRASO_MAX_INGRESO:
+        return ahora
+    return momento
+
+def atender_procesar_ingreso(data):
+    data = data if isinstance(data, dict) else {}
     codigo = data.get('codigo')
     sala_id = data.get('sala_id', 1)
 
     codigo_str = str(codigo).strip()
     
     # Prevenir inputs basura del escáner
-    if not codigo_str or codigo_str in ['0', '0.0'] or codigo_str.replace('-', '').strip() == '' or len(codigo_str) < 4:
-        return jsonify({'status': 'error', 'msg': 'Posible Lectura Errónea del Escáner'})
+    if _lectura_erronea(codigo_str):
+        return {'status': 'error', 'msg': 'Posible Lectura Errónea del Escáner'}, 200
+    marcar_etapa('validacion')
 
-    res = registrar_ingreso_general(codigo_str, sala_id)
-    return jsonify(res)
+    return registrar_ingreso_general(codigo_str, sala_id), 200
+
+def atender_ingreso_batch(data):
+    escaneos = data.get('escaneos') if isinstance(data, dict) else data
+
+    if not isinstance(escaneos, list) or not escaneos:
+        return {'status': 'error', 'msg': 'Se esperaba una lista de escaneos'}, 400
+    if len(escaneos) > MAX_ESCANEOS_LOTE:
+        return {'status': 'error', 'msg': f'Máximo {MAX_ESCANEOS_LOTE} escaneos por lote'}, 400
+
+    ahora = datetime.now()
+    resultados = [None] * len(escaneos)
+    validos = []
+    posiciones = []
+    for i, escaneo in enumerate(escaneos):
+        escaneo = escaneo if isinstance(escaneo, dict) else {}
+        codigo_str = str(escaneo.get('codigo') or '').strip()
+        if _lectura_erronea(codigo_str):
+            resultados[i] = {'status': 'error', 'msg': 'Posible Lectura Errónea del Escáner'}
+        else:
+            validos.append({
+                'codigo': codigo_str,
+                'sala_id': escaneo.get('sala_id', 1),
+                'momento': _hora_lectura(escaneo.get('client_timestamp'), ahora)
+            })
+            posiciones.append(i)
+
+    if validos:
+        for i, res in zip(posiciones, registrar_ingresos_lote(validos)):
+            resultados[i] = res
+
+    for escaneo, res in zip(escaneos, resultados):
+        res['codigo'] = escaneo.get('codigo') if isinstance(escaneo, dict) else None
+
+    return {'status': 'success', 'resultados': resultados}, 200
+
+def atender_contador_sala(sala_id):
+    return {'status': 'success', 'sala_id': sala_id, 'total': contadores_salas.obtener(sala_id)}, 200
+
+def atender_eventos_activos(sede):
+    eventos = obtener_agenda_eventos_hoy(sede)
+    if eventos and len(eventos) > 0:
+        return {'status': 'success', 'eventos_activos': True, 'eventos': eventos}, 200
+    return {'status': 'success', 'eventos_activos': False, 'eventos': []}, 200
+
+def atender_evento_estado(evento_id):
+    return verificar_estado_evento(evento_id), 200
+
+def atender_procesar_evento(data):
+    data = data if isinstance(data, dict) else {}
+    codigo = data.get('codigo')
+    evento_id = data.get('evento_id')
+    
+    if not codigo or str(codigo).strip() in ['0', '0.0', ''] or not evento_id: 
+        return {'status': 'error', 'msg': 'Datos inválidos o faltantes'}, 200
+    marcar_etapa('validacion')
+        
+    return procesar_ingreso_evento(str(codigo).strip(), evento_id), 200
+
+def sala_traza(data):
+    """
+    Etiqueta con la que se agrupan las métricas del escaneo: sala activa,
+    evento de hoy u 'otra'. En un lote se usa la sala de la primera lectura.
+    """
+    if isinstance(data, dict) and isinstance(data.get('escaneos'), list):
+        data = data['escaneos']
+    if isinstance(data, list):
+        data = data[0] if data else {}
+    data = data if isinstance(data, dict) else {}
+    if data.get('evento_id'):
+        return etiquetas_sala.evento(data.get('evento_id'))
+    return etiquetas_sala.sala(data.get('sala_id', 1))
+
+# API: PROCESAR EL ESCANEO
+@ingreso_bp.route('/procesar_ingreso', methods=['POST'])
+def procesar_ingreso():
+    traza = iniciar_traza('procesar_ingreso')
+    data = request.json
+    res, codigo_http = atender_procesar_ingreso(data)
+    respuesta = jsonify(res)
+    finalizar_traza(traza, sala_traza(data), res.get('status'))
+    return respuesta, codigo_http
+
+@ingreso_bp.route('/procesar_ingreso_batch', methods=['POST'])
+def procesar_ingreso_batch():
+    """Lecturas acumuladas por un controlador: [{codigo, sala_id, client_timestamp}, ...]"""
+    traza = iniciar_traza('procesar_ingreso_batch')
+    data = request.get_json(silent=True)
+    res, codigo_http = atender_ingreso_batch(data)
+    respuesta = jsonify(res)
+    finalizar_traza(traza, sala_traza(data), res.get('status'))
+    return respuesta, codigo_http
+
+@ingreso_bp.route('/api/contador_sala/<int:sala_id>', methods=['GET'])
+def api_contador_sala(sala_id):
+    res, codigo_http = atender_contador_sala(sala_id)
+    return jsonify(res), codigo_http
 
 # --- RUTAS DE EVENTOS ---
 @ingreso_bp.route('/api/eventos_activos', methods=['GET'])
 def api_eventos_activos():
-    sede = request.args.get('sede', 'Central')
-    eventos = obtener_agenda_eventos_hoy(sede)
-    if eventos and len(eventos) > 0:
-        return jsonify({'status': 'success', 'eventos_activos': True, 'eventos': eventos})
-    return jsonify({'status': 'success', 'eventos_activos': False, 'eventos': []})
+    res, codigo_http = atender_eventos_activos(request.args.get('sede', 'Central'))
+    return jsonify(res), codigo_http
 
 @ingreso_bp.route('/api/evento_estado/<int:evento_id>', methods=['GET'])
 def api_evento_estado(evento_id):
-    estado = verificar_estado_evento(evento_id)
-    return jsonify(estado)
+    res, codigo_http = atender_evento_estado(evento_id)
+    return jsonify(res), codigo_http
+
+@ingreso_bp.route('/api/eventos_stream')
+def api_eventos_stream():
+    # Con SCAN_ASYNC=true lo atiende el front end asyncio; Waitress solo admite
+    # unos pocos streams (cada uno ocupa un hilo). 204 = la terminal usa polling.
+    if not modulo_canal_eventos.ACTIVO or not canal_eventos.reservar_stream_waitress():
+        return '', 204
+
+    cola = queue.Queue(maxsize=100)
+
+    def entregar(mensaje):
+        try:
+            cola.put_nowait(mensaje)
+        except queue.Full:
+            pass
+
+    sid = canal_eventos.suscribir(request.args.get('sede', 'Central'), entregar)
+
+    def generate():
+        yield modulo_canal_eventos.INICIO_STREAM
+        while True:
+            try:
+                yield cola.get(timeout=modulo_canal_eventos.LATIDO)
+            except queue.Empty:
+                yield modulo_canal_eventos.LATIDO_STREAM
+
+    def cerrar():
+        canal_eventos.cancelar(sid)
+        canal_eventos.liberar_stream_waitress()
+
+    respuesta = Response(generate(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
+    respuesta.call_on_close(cerrar)
+    return respuesta
 
 @ingreso_bp.route('/evento/<int:evento_id>')
 def ingreso_evento(evento_id):
@@ -149,12 +288,9 @@ def ingreso_evento(evento_id):
 
 @ingreso_bp.route('/procesar_evento_ingreso', methods=['POST'])
 def procesar_evento():
+    traza = iniciar_traza('procesar_evento_ingreso')
     data = request.json
-    codigo = data.get('codigo')
-    evento_id = data.get('evento_id')
-    
-    if not codigo or str(codigo).strip() in ['0', '0.0', ''] or not evento_id: 
-        return jsonify({'status': 'error', 'msg': 'Datos inválidos o faltantes'})
-        
-    res = procesar_ingreso_evento(str(codigo).strip(), evento_id)
-    return jsonify(res)
\ No newline at end of file
+    res, codigo_http = atender_procesar_evento(data)
+    respuesta = jsonify(res)
+    finalizar_traza(traza, sala_traza(data), res.get('status'))
+    return respuesta, codigo_http
@@ -0,0 +1,347 @@
+import os
+import re
+import json
+import socket
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, parse_qs
+from db import crear_pool_terminales, usar_pool_terminales
+from routes.ingreso import (
+    atender_procesar_ingreso,
+    atender_ingreso_batch,
+    atender_procesar_evento,
+    atender_eventos_activos,
+    atender_evento_estado,
+    atender_contador_sala,
+    sala_traza
+)
+from utils.metricas_escaneo import iniciar_traza, soltar_traza, finalizar_traza
+from utils import canal_eventos as modulo_canal_eventos
+from utils.canal_eventos import canal_eventos
+
+# ============================================================
+# FRONT END ASYNCIO PARA TERMINALES (opcional, SCAN_ASYNC=true)
+# ============================================================
+# Atiende en el puerto público las rutas que usan los escáneres y molinetes
+# con un event loop (cientos de conexiones keep-alive sin ocupar hilos) y
+# ejecuta las consultas pyodbc en un pool de hilos acotado y exclusivo, cada
+# uno con su conexión de un pool de BD aparte del de Waitress.
+# Todo lo demás (páginas, panel admin, SSE, exportaciones) se reenvía a
+# Waitress, que pasa a escuchar solo en 127.0.0.1:SCAN_ASYNC_PUERTO_WSGI.
+ACTIVO = os.getenv('SCAN_ASYNC', 'false').lower() == 'true'
+WORKERS = int(os.getenv('SCAN_ASYNC_WORKERS', 16))
+PUERTO_WSGI = int(os.getenv('SCAN_ASYNC_PUERTO_WSGI', 5001))
+# Segundos que una petición puede esperar un hilo libre antes de responder 503
+ESPERA_WORKER = float(os.getenv('SCAN_ASYNC_ESPERA', 5))
+KEEPALIVE = float(os.getenv('SCAN_ASYNC_KEEPALIVE', 75))
+# Segundos para recibir las cabeceras o el cuerpo de una petición ya empezada
+TIMEOUT_LECTURA = float(os.getenv('SCAN_ASYNC_TIMEOUT_LECTURA', 10))
+MAX_CONEXIONES = int(os.getenv('SCAN_ASYNC_MAX_CONEXIONES', 1000))
+
+MAX_CUERPO = 1024 * 1024
+_TAMANO_BLOQUE = 64 * 1024
+
+_ESTADOS_HTTP = {
+    200: 'OK', 400: 'Bad Request', 411: 'Length Required',
+    413: 'Payload Too Large', 502: 'Bad Gateway', 503: 'Service Unavailable'
+}
+
+# Cabeceras que no se reenvían tal cual a Waitress
+_CABECERAS_SALTO = {'connection', 'keep-alive', 'proxy-connection', 'x-forwarded-for'}
+
+
+def _primer_valor(query, nombre, defecto):
+    valores = query.get(nombre)
+    return valores[0] if valores else defecto
+
+
+# (método, patrón, manejador, nombre de la traza de latencia o None)
+RUTAS = [
+    ('POST', re.compile(r'^/procesar_ingreso$'),
+     lambda m, q, datos: atender_procesar_ingreso(datos), 'procesar_ingreso'),
+    ('POST', re.compile(r'^/procesar_ingreso_batch$'),
+     lambda m, q, datos: atender_ingreso_batch(datos), 'procesar_ingreso_batch'),
+    ('POST', re.compile(r'^/procesar_evento_ingreso$'),
+     lambda m, q, datos: atender_procesar_evento(datos), 'procesar_evento_ingreso'),
+    ('GET', re.compile(r'^/api/eventos_activos$'),
+     lambda m, q, datos: atender_eventos_activos(_primer_valor(q, 'sede', 'Central')), None),
+    ('GET', re.compile(r'^/api/evento_estado/(\d+)$'),
+     lambda m, q, datos: atender_evento_estado(int(m.group(1))), None),
+    ('GET', re.compile(r'^/api/contador_sala/(\d+)$'),
+     lambda m, q, datos: atender_contador_sala(int(m.group(1))), None),
+]
+
+
+# Canal SSE de eventos: se atiende aquí sin ocupar un hilo por terminal
+RUTA_STREAM_EVENTOS = '/api/eventos_stream'
+
+
+def _buscar_ruta(metodo, ruta):
+    for metodo_ruta, patron, manejador, traza in RUTAS:
+        if metodo_ruta == metodo:
+            m = patron.match(ruta)
+            if m:
+                return manejador, m, traza
+    return None, None, None
+
+
+def _en_hilo(manejador, coincidencia, query, datos, nombre_traza):
+    """Se ejecuta en el pool: la traza se inicia aquí y se cierra tras responder."""
+    traza = iniciar_traza(nombre_traza) if nombre_traza else None
+    try:
+        return manejador(coincidencia, query, datos), traza
+    finally:
+        soltar_traza()
+
+
+class ServidorTerminales:
+
+    def __init__(self, workers, puerto_wsgi):
+        self.workers = workers
+        self.puerto_wsgi = puerto_wsgi
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='terminales',
+                                            initializer=usar_pool_terminales)
+        self._cupos = None
+        self._hilo = None
+
+        self.atendidas = 0
+        self.reenviadas = 0
+        self.rechazadas = 0
+        self.conexiones_abiertas = 0
+        self.streams_eventos = 0
+
+    # ---------------------------------------------------------
+    # Respuestas
+    # ---------------------------------------------------------
+    async def _responder(self, writer, codigo, payload, mantener):
+        cuerpo = json.dumps(payload, ensure_ascii=False, default=str).encode('utf-8')
+        cabecera = (
+            f"HTTP/1.1 {codigo} {_ESTADOS_HTTP.get(codigo, 'OK')}\r\n"
+            "Content-Type: application/json; charset=utf-8\r\n"
+            f"Content-Length: {len(cuerpo)}\r\n"
+            f"Connection: {'keep-alive' if mantener else 'close'}\r\n"
+            "\r\n"
+        ).encode('latin-1')
+        writer.write(cabecera + cuerpo)
+        await writer.drain()
+
+    async def _ejecutar(self, manejador, coincidencia, query, datos, nombre_traza):
+        """Corre la lógica bloqueante en el pool acotado; 503 si no hay hilo a tiempo."""
+        try:
+            await asyncio.wait_for(self._cupos.acquire(), ESPERA_WORKER)
+        except asyncio.TimeoutError:
+            self.rechazadas += 1
+            return ({'status': 'error', 'msg': 'Servidor ocupado, intente nuevamente'}, 503), None
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self._executor, _en_hilo, manejador, coincidencia, query, datos, nombre_traza)
+        except Exception as e:
+            print(f"Error atendiendo petición de terminal: {e}")
+            return ({'status': 'error', 'msg': str(e)}, 200), None
+        finally:
+            self._cupos.release()
+
+    async def _stream_eventos(self, writer, query):
+        """Mantiene abierto el canal SSE de una terminal hasta que se desconecte."""
+        if not modulo_canal_eventos.ACTIVO:
+            writer.write(b"HTTP/1.1 204 No Content\r\nConnection: close\r\n\r\n")
+            await writer.drain()
+            return
+
+        loop = asyncio.get_running_loop()
+        cola = asyncio.Queue(maxsize=100)
+
+        def poner(mensaje):
+            if not cola.full():
+                cola.put_nowait(mensaje)
+
+        # El productor entrega desde su hilo; se pasa al event loop
+        sid = canal_eventos.suscribir(_primer_valor(query, 'sede', 'Central'),
+                                      lambda mensaje: loop.call_soon_threadsafe(poner, mensaje))
+        self.streams_eventos += 1
+        try:
+            writer.write((
+                "HTTP/1.1 200 OK\r\n"
+                "Content-Type: text/event-stream; charset=utf-8\r\n"
+                "Cache-Control: no-cache\r\n"
+                "Connection: close\r\n"
+                "\r\n" + modulo_canal_eventos.INICIO_STREAM
+            ).encode('utf-8'))
+            await writer.drain()
+            while True:
+                try:
+                    mensaje = await asyncio.wait_for(cola.get(), modulo_canal_eventos.LATIDO)
+                except asyncio.TimeoutError:
+                    mensaje = modulo_canal_eventos.LATIDO_STREAM
+                writer.write(mensaje.encode('utf-8'))
+                await writer.drain()
+        finally:
+            self.streams_eventos -= 1
+            canal_eventos.cancelar(sid)
+
+    # ---------------------------------------------------------
+    # Reenvío a Waitress
+    # ---------------------------------------------------------
+    async def _copiar(self, origen, destino, restante=None, timeout=None):
+        while restante is None or restante > 0:
+            datos = await asyncio.wait_for(
+                origen.read(_TAMANO_BLOQUE if restante is None else min(_TAMANO_BLOQUE, restante)), timeout)
+            if not datos:
+                break
+            if restante is not None:
+                restante -= len(datos)
+            destino.write(datos)
+            await destino.drain()
+
+    async def _reenviar(self, linea, lineas_cabecera, cabeceras, reader, writer, ip_cliente):
+        """Pasa la petición a Waitress y devuelve la respuesta en streaming (SSE, descargas)."""
+        try:
+            up_reader, up_writer = await asyncio.open_connection('127.0.0.1', self.puerto_wsgi)
+        except OSError as e:
+            print(f"Error conectando con Waitress en el puerto {self.puerto_wsgi}: {e}")
+            await self._responder(writer, 502, {'status': 'error', 'msg': 'Servidor no disponible'}, False)
+            return
+
+        self.reenviadas += 1
+        cabecera = [linea]
+        for cruda in lineas_cabecera:
+            nombre = cruda.split(b':', 1)[0].strip().lower().decode('latin-1')
+            if nombre not in _CABECERAS_SALTO:
+                cabecera.append(cruda)
+        cabecera.append(f"X-Forwarded-For: {ip_cliente}\r\n".encode('latin-1'))
+        cabecera.append(b"Connection: close\r\n\r\n")
+        up_writer.write(b''.join(cabecera))
+
+        largo = cabeceras.get('content-length')
+        subida = asyncio.ensure_future(self._copiar(reader, up_writer, int(largo) if largo else None, TIMEOUT_LECTURA)) \
+            if largo or 'chunked' in cabeceras.get('transfer-encoding', '').lower() else None
+        try:
+            await self._copiar(up_reader, writer)
+        finally:
+            if subida:
+                subida.cancel()
+            up_writer.close()
+
+    # ---------------------------------------------------------
+    # Conexión HTTP/1.1 con keep-alive
+    # ---------------------------------------------------------
+    async def _leer_cabeceras(self, reader):
+        lineas_cabecera = []
+        cabeceras = {}
+        while True:
+            cruda = await reader.readline()
+            if cruda in (b'\r\n', b'\n', b''):
+                return lineas_cabecera, cabeceras
+            lineas_cabecera.append(cruda)
+            nombre, _, valor = cruda.decode('latin-1').partition(':')
+            cabeceras[nombre.strip().lower()] = valor.strip()
+
+    async def _atender_conexion(self, reader, writer):
+        ip_cliente = (writer.get_extra_info('peername') or ('-',))[0]
+        if self.conexiones_abiertas >= MAX_CONEXIONES:
+            writer.close()
+            return
+        self.conexiones_abiertas += 1
+        try:
+            while True:
+                try:
+                    linea = await asyncio.wait_for(reader.readline(), KEEPALIVE)
+                except asyncio.TimeoutError:
+                    break
+                if not linea:
+                    break
+                if not linea.strip():
+                    continue
+
+                partes = linea.decode('latin-1').split()
+                if len(partes) != 3:
+                    await self._responder(writer, 400, {'status': 'error', 'msg': 'Petición inválida'}, False)
+                    break
+                metodo, destino, version = partes
+
+                # Un cliente lento no retiene la conexión: cabeceras y cuerpo con plazo
+                lineas_cabecera, cabeceras = await asyncio.wait_for(self._leer_cabeceras(reader), TIMEOUT_LECTURA)
+
+                url = urlsplit(destino)
+                if metodo == 'GET' and url.path == RUTA_STREAM_EVENTOS:
+                    await self._stream_eventos(writer, parse_qs(url.query))
+                    break
+
+                manejador, coincidencia, nombre_traza = _buscar_ruta(metodo, url.path)
+                if manejador is None:
+                    await self._reenviar(linea, lineas_cabecera, cabeceras, reader, writer, ip_cliente)
+                    break
+
+                conexion = cabeceras.get('connection', '').lower()
+                mantener = 'close' not in conexion if version == 'HTTP/1.1' else 'keep-alive' in conexion
+
+                if 'chunked' in cabeceras.get('transfer-encoding', '').lower():
+                    await self._responder(writer, 411, {'status': 'error', 'msg': 'Se requiere Content-Length'}, False)
+                    break
+                largo = int(cabeceras.get('content-length') or 0)
+                if largo > MAX_CUERPO:
+                    await self._responder(writer, 413, {'status': 'error', 'msg': 'Petición demasiado grande'}, False)
+                    break
+                cuerpo = await asyncio.wait_for(reader.readexactly(largo), TIMEOUT_LECTURA) if largo else b''
+
+                datos = None
+                if cuerpo:
+                    try:
+                        datos = json.loads(cuerpo)
+                    except ValueError:
+                        await self._responder(writer, 400, {'status': 'error', 'msg': 'JSON inválido'}, mantener)
+                        if not mantener:
+                            break
+                        continue
+
+                (payload, codigo), traza = await self._ejecutar(
+                    manejador, coincidencia, parse_qs(url.query), datos, nombre_traza)
+                self.atendidas += 1
+                await self._responder(writer, codigo, payload, mantener)
+                finalizar_traza(traza, sala_traza(datos), payload.get('status'))
+                if not mantener:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.TimeoutError, ValueError):
+            pass
+        finally:
+            self.conexiones_abiertas -= 1
+            writer.close()
+
+    # ---------------------------------------------------------
+    # Ciclo de vida
+    # ---------------------------------------------------------
+    async def _servir(self, sock):
+        self._cupos = asyncio.Semaphore(self.workers)
+        servidor = await asyncio.start_server(self._atender_conexion, sock=sock, limit=MAX_CUERPO)
+        async with servidor:
+            await servidor.serve_forever()
+
+    def iniciar(self, host, puerto):
+        """
+        Abre el puerto público en el hilo que llama (así un puerto ocupado
+        lanza OSError como antes) y corre el event loop en un hilo daemon.
+        """
+        if self._hilo:
+            return
+        sock = socket.create_server((host, puerto))
+        crear_pool_terminales(self.workers)
+        self._hilo = threading.Thread(target=lambda: asyncio.run(self._servir(sock)))
+        self._hilo.daemon = True
+        self._hilo.start()
+
+    def estadisticas(self):
+        return {
+            'activo': self._hilo is not None,
+            'workers': self.workers,
+            'conexiones_abiertas': self.conexiones_abiertas,
+            'atendidas': self.atendidas,
+            'reenviadas': self.reenviadas,
+            'rechazadas_503': self.rechazadas,
+            'streams_eventos': self.streams_eventos,
+            'puerto_wsgi': self.puerto_wsgi
+        }
+
+
+servidor_terminales = ServidorTerminales(WORKERS, PUERTO_WSGI)
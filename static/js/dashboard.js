@@ -81,93 +81,106 @@ function inicializarFormularioRangoFechas() {
 }
 
 function inicializarAutoRefresh(isToday) {
-    if (isToday === 'true') {
-        const evtSource = new EventSource('/admin/api/dashboard_stream');
-
-        evtSource.onmessage = function (event) {
-            try {
-                const data = JSON.parse(event.data);
-
-                // 1. Actualizar Tarjeta Principal
-                document.querySelector('.text-3xl.font-bold.text-slate-800').innerText = data.total_hoy;
-
-                // Actualizar badges
-                const badges = document.querySelectorAll('.rounded-full.inline-block');
-                if (badges.length >= 4) {
-                    badges[0].innerText = `${data.total_alumnos} Alumnos`;
-                    badges[1].innerText = `${data.total_egresados} Egresados`;
-                    badges[2].innerText = `${data.total_visitantes} Externos`;
-                    badges[3].innerText = `${data.total_personal} Trabajadores`;
-                }
+    if (isToday !== 'true') return;
+    abrirStreamDashboard();
+}
 
-                // 2. Actualizar Tarjetas de Pisos
-                const pisosHeaders = document.querySelectorAll('.text-2xl.font-bold.text-slate-700');
-                if (pisosHeaders.length >= 3) {
-                    pisosHeaders[0].innerText = data.pisos['1'] || 0;
-                    pisosHeaders[1].innerText = data.pisos['2'] || 0;
-                    pisosHeaders[2].innerText = data.pisos['3'] || 0;
-                }
+// El servidor manda la foto completa al conectar y luego solo las claves que
+// cambiaron; se combinan aquí para redibujar con el estado completo.
+const estadoDashboard = {};
 
-                // 3. Actualizar Tabla
-                const tbody = document.getElementById('tbody-ultimos');
-                if (tbody) {
-                    tbody.innerHTML = '';
-                    data.ultimos.forEach(reg => {
-                        let pillHTML = '';
-                        if (reg.tipo === 'Visitante') {
-                            pillHTML = '<span class="text-[10px] bg-orange-100 text-orange-700 font-bold px-1 rounded ml-1">EXT</span>';
-                        } else if (reg.tipo === 'Administrativo') {
-                            pillHTML = '<span class="text-[10px] bg-purple-100 text-purple-700 font-bold px-1 rounded ml-1">ADM</span>';
-                        } else if (reg.tipo === 'Docente') {
-                            pillHTML = '<span class="text-[10px] bg-indigo-100 text-indigo-700 font-bold px-1 rounded ml-1">DOC</span>';
-                        } else if (reg.tipo === 'Alumno') {
-                            pillHTML = '<span class="text-[10px] bg-sky-100 text-sky-700 font-bold px-1 rounded ml-1">ALU</span>';
-                        } else if (reg.tipo === 'Egresado') {
-                            pillHTML = '<span class="text-[10px] bg-emerald-100 text-emerald-700 font-bold px-1 rounded ml-1">EGR</span>';
-                        }
+function abrirStreamDashboard() {
+    const evtSource = new EventSource('/admin/api/dashboard_stream');
+
+    evtSource.onmessage = function (event) {
+        try {
+            const cambios = JSON.parse(event.data);
+            Object.assign(estadoDashboard, cambios);
+            const data = estadoDashboard;
+
+            // 1. Actualizar Tarjeta Principal
+            document.querySelector('.text-3xl.font-bold.text-slate-800').innerText = data.total_hoy;
+
+            // Actualizar badges
+            const badges = document.querySelectorAll('.rounded-full.inline-block');
+            if (badges.length >= 4) {
+                badges[0].innerText = `${data.total_alumnos} Alumnos`;
+                badges[1].innerText = `${data.total_egresados} Egresados`;
+                badges[2].innerText = `${data.total_visitantes} Externos`;
+                badges[3].innerText = `${data.total_personal} Trabajadores`;
+            }
+
+            // 2. Actualizar Tarjetas de Pisos
+            const pisosHeaders = document.querySelectorAll('.text-2xl.font-bold.text-slate-700');
+            if (pisosHeaders.length >= 3) {
+                pisosHeaders[0].innerText = data.pisos['1'] || 0;
+                pisosHeaders[1].innerText = data.pisos['2'] || 0;
+                pisosHeaders[2].innerText = data.pisos['3'] || 0;
+            }
+
+            // 3. Actualizar Tabla (solo si llegaron ingresos nuevos)
+            const tbody = document.getElementById('tbody-ultimos');
+            if (tbody && cambios.ultimos) {
+                tbody.innerHTML = '';
+                data.ultimos.forEach(reg => {
+                    let pillHTML = '';
+                    if (reg.tipo === 'Visitante') {
+                        pillHTML = '<span class="text-[10px] bg-orange-100 text-orange-700 font-bold px-1 rounded ml-1">EXT</span>';
+                    } else if (reg.tipo === 'Administrativo') {
+                        pillHTML = '<span class="text-[10px] bg-purple-100 text-purple-700 font-bold px-1 rounded ml-1">ADM</span>';
+                    } else if (reg.tipo === 'Docente') {
+                        pillHTML = '<span class="text-[10px] bg-indigo-100 text-indigo-700 font-bold px-1 rounded ml-1">DOC</span>';
+                    } else if (reg.tipo === 'Alumno') {
+                        pillHTML = '<span class="text-[10px] bg-sky-100 text-sky-700 font-bold px-1 rounded ml-1">ALU</span>';
+                    } else if (reg.tipo === 'Egresado') {
+                        pillHTML = '<span class="text-[10px] bg-emerald-100 text-emerald-700 font-bold px-1 rounded ml-1">EGR</span>';
+                    }
 
-                        let sedeStr = reg.sede || 'Central';
-                        let ubicacionHTML = '';
-                        if (sedeStr === 'Central') {
-                            if (reg.nombre_sala) {
-                                ubicacionHTML = `<div class="flex flex-col items-center gap-1"><span class="text-slate-400 font-medium text-xs">Piso ${reg.piso}</span><span class="text-[10px] bg-sky-100 text-sky-700 font-bold px-2 py-1.5 rounded-md shadow-sm border border-sky-200/50 uppercase">${reg.nombre_sala}</span></div>`;
-                            } else {
-                                ubicacionHTML = `<span class="text-slate-500 font-medium">Piso ${reg.piso}</span>`;
-                            }
+                    let sedeStr = reg.sede || 'Central';
+                    let ubicacionHTML = '';
+                    if (sedeStr === 'Central') {
+                        if (reg.nombre_sala) {
+                            ubicacionHTML = `<div class="flex flex-col items-center gap-1"><span class="text-slate-400 font-medium text-xs">Piso ${reg.piso}</span><span class="text-[10px] bg-sky-100 text-sky-700 font-bold px-2 py-1.5 rounded-md shadow-sm border border-sky-200/50 uppercase">${reg.nombre_sala}</span></div>`;
                         } else {
-                            ubicacionHTML = `<span class="text-[10px] bg-emerald-100 text-emerald-700 font-bold px-2 py-1 rounded truncate inline-block max-w-[100px] uppercase">${sedeStr}</span>`;
+                            ubicacionHTML = `<span class="text-slate-500 font-medium">Piso ${reg.piso}</span>`;
                         }
-
-                        const rowHTML = `
-                            <tr data-sede="${sedeStr}">
-                                <td class="px-6 py-3 text-slate-500">
-                                    <span class="block text-xs font-bold text-slate-400 mb-0.5">${reg.fecha}</span>
-                                    <span class="font-mono text-[13px]">${reg.hora}</span>
-                                </td>
-                                <td class="px-6 py-3 font-medium">
-                                    ${reg.nombre || 'Desconocido'} ${pillHTML}
-                                </td>
-                                <td class="px-6 py-3 text-slate-500">${reg.origen || ''}</td>
-                                <td class="px-6 py-3 text-center font-medium text-slate-600">${ubicacionHTML}</td>
-                            </tr>
-                        `;
-                        tbody.innerHTML += rowHTML;
-                    });
-
-                    // Re-aplicar filtro actual
-                    if (window.currentFiltroSede) {
-                        filtrarUltimos(window.currentFiltroSede, null, true);
+                    } else {
+                        ubicacionHTML = `<span class="text-[10px] bg-emerald-100 text-emerald-700 font-bold px-2 py-1 rounded truncate inline-block max-w-[100px] uppercase">${sedeStr}</span>`;
                     }
+
+                    const rowHTML = `
+                        <tr data-sede="${sedeStr}">
+                            <td class="px-6 py-3 text-slate-500">
+                                <span class="block text-xs font-bold text-slate-400 mb-0.5">${reg.fecha}</span>
+                                <span class="font-mono text-[13px]">${reg.hora}</span>
+                            </td>
+                            <td class="px-6 py-3 font-medium">
+                                ${reg.nombre || 'Desconocido'} ${pillHTML}
+                            </td>
+                            <td class="px-6 py-3 text-slate-500">${reg.origen || ''}</td>
+                            <td class="px-6 py-3 text-center font-medium text-slate-600">${ubicacionHTML}</td>
+                        </tr>
+                    `;
+                    tbody.innerHTML += rowHTML;
+                });
+
+                // Re-aplicar filtro actual
+                if (window.currentFiltroSede) {
+                    filtrarUltimos(window.currentFiltroSede, null, true);
                 }
-            } catch (error) {
-                console.log("Error procesando stream SSE:", error);
             }
-        };
+        } catch (error) {
+            console.log("Error procesando stream SSE:", error);
+        }
+    };
 
-        evtSource.onerror = function (err) {
-            console.error('SSE Error - Connection dropped or failed to connect:', err);
-        };
-    }
+    evtSource.onerror = function (err) {
+        console.error('SSE Error - Connection dropped or failed to connect:', err);
+        // 204 (tope de streams) o servidor caído: el navegador no reintenta solo
+        if (evtSource.readyState === EventSource.CLOSED) {
+            setTimeout(abrirStreamDashboard, 30000);
+        }
+    };
 }
 
 function filtrarUltimos(categoria, btnElement = null, isAutoRefresh = false) {
@@ -1,6 +1,11 @@
 let sedeContexto = 'Central';
 let previousMenuContext = 'central-menu';
 
+// Canal SSE de la agenda; mientras está abierto el polling no consulta al servidor
+let eventosStream = null;
+let eventosStreamSede = null;
+let eventosStreamAbierto = false;
+
 document.addEventListener('DOMContentLoaded', () => {
     // No iniciar el autoverificador de eventos inmediatamente, ya que consume recursos y depende de la sede
     // Se activará cuando abran el menú de eventos
@@ -33,6 +38,41 @@ function cerrarEventosMenu() {
         clearInterval(window.eventosInterval);
         window.eventosInterval = null;
     }
+    cerrarCanalEventos();
+}
+
+function abrirCanalEventos() {
+    if (!window.EventSource) return;
+    if (eventosStream && eventosStreamSede === sedeContexto) return;
+    cerrarCanalEventos();
+
+    eventosStreamSede = sedeContexto;
+    eventosStream = new EventSource('/api/eventos_stream?sede=' + encodeURIComponent(sedeContexto));
+    eventosStream.onopen = () => { eventosStreamAbierto = true; };
+    eventosStream.addEventListener('agenda', (e) => {
+        renderAgenda(JSON.parse(e.data).eventos);
+    });
+    eventosStream.onerror = () => {
+        eventosStreamAbierto = false;
+        // 204 del servidor o cierre definitivo: queda solo el polling
+        if (eventosStream && eventosStream.readyState === EventSource.CLOSED) {
+            eventosStream = null;
+        }
+    };
+}
+
+function cerrarCanalEventos() {
+    if (eventosStream) {
+        eventosStream.close();
+        eventosStream = null;
+    }
+    eventosStreamAbierto = false;
+}
+
+function pollingAgendaRespaldo() {
+    if (!eventosStreamAbierto) {
+        verificarEventoActivo();
+    }
 }
 
 function toggleMenu(menuId) {
@@ -47,17 +87,19 @@ function toggleMenu(menuId) {
     const activeMenu = document.getElementById(menuId);
     if (activeMenu) activeMenu.classList.remove('hidden');
 
-    // Si entra a eventos, recargamos la lista e iniciamos polling
+    // Si entra a eventos, recargamos la lista y abrimos el canal (polling de respaldo)
     if (menuId === 'eventos-menu') {
         verificarEventoActivo();
+        abrirCanalEventos();
         if (!window.eventosInterval) {
-            window.eventosInterval = setInterval(verificarEventoActivo, 60000);
+            window.eventosInterval = setInterval(pollingAgendaRespaldo, 60000);
         }
     } else {
         if (window.eventosInterval) {
             clearInterval(window.eventosInterval);
             window.eventosInterval = null;
         }
+        cerrarCanalEventos();
     }
 }
 
@@ -65,57 +107,7 @@ function verificarEventoActivo() {
     fetch('/api/eventos_activos?sede=' + encodeURIComponent(sedeContexto))
         .then(response => response.json())
         .then(data => {
-            const container = document.getElementById('eventos-container');
-
-            if (data.status === 'success' && data.eventos_activos && data.eventos.length > 0) {
-                // Filtrar los que están finalizados para que ya no aparezcan en la vista
-                const eventosActivosYProximos = data.eventos.filter(evt => evt.estado_virtual !== 'finalizado');
-
-                if (eventosActivosYProximos.length > 0) {
-                    let html = '';
-                    eventosActivosYProximos.forEach(evt => {
-                        if (evt.estado_virtual === 'en_curso') {
-                            // Rojo, animado y con link
-                            html += `
-                            <a href="/evento/${evt.id}" class="group flex items-center justify-between p-4 bg-white border border-rose-500 rounded-xl transition-all duration-300 shadow-sm cursor-pointer opacity-100 evento-activo-anim hover:text-white">
-                                <div class="flex flex-col gap-1 relative z-10 w-full pr-4">
-                                    <div class="flex justify-between items-center w-full mb-1">
-                                        <span class="bg-rose-100 text-rose-700 text-[10px] font-bold px-2 py-0.5 rounded-full group-hover:bg-white/30 group-hover:text-white transition-colors flex items-center gap-1"><span class="w-1.5 h-1.5 rounded-full bg-rose-500 group-hover:bg-white animate-pulse"></span> EN CURSO</span>
-                                        <span class="text-xs font-bold text-rose-500 flex items-center gap-1 group-hover:text-white/80 transition-colors"><i class="ph-bold ph-clock"></i> ${evt.hora_inicio} - ${evt.hora_fin}</span>
-                                    </div>
-                                    <h3 class="font-bold text-lg text-slate-800 transition-colors group-hover:text-white leading-tight">${evt.nombre}</h3>
-                                    <span class="text-xs text-slate-500 font-medium transition-colors group-hover:text-white/80 flex items-center gap-1"><i class="ph-fill ph-map-pin"></i> ${evt.lugar}</span>
-                                </div>
-                                <div class="w-10 h-10 rounded-full bg-rose-50 flex items-center justify-center shrink-0 group-hover:bg-white/20 transition-colors">
-                                    <i class="ph-bold ph-caret-right text-rose-500 group-hover:text-white transition-colors text-xl"></i>
-                                </div>
-                            </a>`;
-                        } else if (evt.estado_virtual === 'proximo') {
-                            // Grisáceo bloqueado
-                            html += `
-                            <div class="group flex items-center justify-between p-4 bg-slate-50 border border-slate-200 rounded-xl transition-all duration-300 shadow-sm opacity-80 cursor-not-allowed relative">
-                                <div class="flex flex-col gap-1 relative z-10 w-full pr-4">
-                                    <div class="flex justify-between items-center w-full mb-1">
-                                        <span class="bg-amber-100 text-amber-700 text-[10px] font-bold px-2 py-0.5 rounded-full flex items-center gap-1"><i class="ph-bold ph-hourglass-high"></i> PRÓXIMO</span>
-                                        <span class="text-xs font-bold text-slate-500 flex items-center gap-1"><i class="ph-bold ph-clock"></i> ${evt.hora_inicio} - ${evt.hora_fin}</span>
-                                    </div>
-                                    <h3 class="font-bold text-lg text-slate-700 leading-tight">${evt.nombre}</h3>
-                                    <span class="text-xs text-slate-400 font-medium flex items-center gap-1"><i class="ph-fill ph-map-pin"></i> ${evt.lugar}</span>
-                                </div>
-                                <div class="w-10 h-10 rounded-full bg-slate-100 flex items-center justify-center shrink-0">
-                                    <i class="ph-bold ph-lock-key text-slate-400 text-xl"></i>
-                                </div>
-                            </div>`;
-                        }
-                    });
-
-                    container.innerHTML = html;
-                } else {
-                    renderEmptyAgenda(container);
-                }
-            } else {
-                renderEmptyAgenda(container);
-            }
+            renderAgenda((data.status === 'success' && data.eventos_activos) ? data.eventos : []);
         })
         .catch(error => {
             console.error("Error al consultar agenda:", error);
@@ -123,6 +115,60 @@ function verificarEventoActivo() {
         });
 }
 
+function renderAgenda(eventos) {
+    const container = document.getElementById('eventos-container');
+
+    if (eventos && eventos.length > 0) {
+        // Filtrar los que están finalizados para que ya no aparezcan en la vista
+        const eventosActivosYProximos = eventos.filter(evt => evt.estado_virtual !== 'finalizado');
+
+        if (eventosActivosYProximos.length > 0) {
+            let html = '';
+            eventosActivosYProximos.forEach(evt => {
+                if (evt.estado_virtual === 'en_curso') {
+                    // Rojo, animado y con link
+                    html += `
+                    <a href="/evento/${evt.id}" class="group flex items-center justify-between p-4 bg-white border border-rose-500 rounded-xl transition-all duration-300 shadow-sm cursor-pointer opacity-100 evento-activo-anim hover:text-white">
+                        <div class="flex flex-col gap-1 relative z-10 w-full pr-4">
+                            <div class="flex justify-between items-center w-full mb-1">
+                                <span class="bg-rose-100 text-rose-700 text-[10px] font-bold px-2 py-0.5 rounded-full group-hover:bg-white/30 group-hover:text-white transition-colors flex items-center gap-1"><span class="w-1.5 h-1.5 rounded-full bg-rose-500 group-hover:bg-white animate-pulse"></span> EN CURSO</span>
+                                <span class="text-xs font-bold text-rose-500 flex items-center gap-1 group-hover:text-white/80 transition-colors"><i class="ph-bold ph-clock"></i> ${evt.hora_inicio} - ${evt.hora_fin}</span>
+                            </div>
+                            <h3 class="font-bold text-lg text-slate-800 transition-colors group-hover:text-white leading-tight">${evt.nombre}</h3>
+                            <span class="text-xs text-slate-500 font-medium transition-colors group-hover:text-white/80 flex items-center gap-1"><i class="ph-fill ph-map-pin"></i> ${evt.lugar}</span>
+                        </div>
+                        <div class="w-10 h-10 rounded-full bg-rose-50 flex items-center justify-center shrink-0 group-hover:bg-white/20 transition-colors">
+                            <i class="ph-bold ph-caret-right text-rose-500 group-hover:text-white transition-colors text-xl"></i>
+                        </div>
+                    </a>`;
+                } else if (evt.estado_virtual === 'proximo') {
+                    // Grisáceo bloqueado
+                    html += `
+                    <div class="group flex items-center justify-between p-4 bg-slate-50 border border-slate-200 rounded-xl transition-all duration-300 shadow-sm opacity-80 cursor-not-allowed relative">
+                        <div class="flex flex-col gap-1 relative z-10 w-full pr-4">
+                            <div class="flex justify-between items-center w-full mb-1">
+                                <span class="bg-amber-100 text-amber-700 text-[10px] font-bold px-2 py-0.5 rounded-full flex items-center gap-1"><i class="ph-bold ph-hourglass-high"></i> PRÓXIMO</span>
+                                <span class="text-xs font-bold text-slate-500 flex items-center gap-1"><i class="ph-bold ph-clock"></i> ${evt.hora_inicio} - ${evt.hora_fin}</span>
+                            </div>
+                            <h3 class="font-bold text-lg text-slate-700 leading-tight">${evt.nombre}</h3>
+                            <span class="text-xs text-slate-400 font-medium flex items-center gap-1"><i class="ph-fill ph-map-pin"></i> ${evt.lugar}</span>
+                        </div>
+                        <div class="w-10 h-10 rounded-full bg-slate-100 flex items-center justify-center shrink-0">
+                            <i class="ph-bold ph-lock-key text-slate-400 text-xl"></i>
+                        </div>
+                    </div>`;
+                }
+            });
+
+            container.innerHTML = html;
+        } else {
+            renderEmptyAgenda(container);
+        }
+    } else {
+        renderEmptyAgenda(container);
+    }
+}
+
 function renderEmptyAgenda(container) {
     container.innerHTML = `
     <div class="col-span-full flex flex-col items-center justify-center py-12 px-4 bg-white/50 rounded-xl border border-rose-100 border-dashed animate-fade-in-up">
@@ -0,0 +1,33 @@
+from datetime import datetime, time
+
+# Los 6 bloques de 2 horas que aplica sp_RegistrarIngreso para impedir
+# ingresos repetidos (el último bloque cierra a las 08:45 p.m.).
+BLOQUES_HORARIO = [
+    (time(8, 0), time(10, 0)),
+    (time(10, 0), time(12, 0)),
+    (time(12, 0), time(14, 0)),
+    (time(14, 0), time(16, 0)),
+    (time(16, 0), time(18, 0)),
+    (time(18, 0), time(20, 45)),
+]
+
+
+def obtener_bloque(momento=None):
+    """
+    Retorna (numero_bloque, inicio, fin) del bloque al que pertenece `momento`
+    como datetimes del mismo día, o None si está fuera del horario de atención.
+    """
+    momento = momento or datetime.now()
+    hora = momento.time()
+    for numero, (ini, fin) in enumerate(BLOQUES_HORARIO, start=1):
+        if ini <= hora < fin:
+            return (
+                numero,
+                datetime.combine(momento.date(), ini),
+                datetime.combine(momento.date(), fin)
+            )
+    return None
+
+
+def etiqueta_bloque(inicio, fin):
+    return f"{inicio.strftime('%H:%M')} - {fin.strftime('%H:%M')}"
@@ -1,4 +1,5 @@
 import time
+import threading
 
 class SimpleTTLCache:
     def __init__(self, ttl_seconds):
@@ -24,4 +25,62 @@ class SimpleTTLCache:
         else:
             self.cache.clear()
 
+class ExpiringCache:
+    """
+    Caché thread-safe donde cada entrada vence en un instante propio
+    (timestamp absoluto) y que lleva la cuenta de aciertos y fallos.
+    """
+    def __init__(self, max_items=50000):
+        self.max_items = max_items
+        self.cache = {}
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self.cache.get(key)
+            if item is not None:
+                data, expira_en = item
+                if time.time() < expira_en:
+                    self.hits += 1
+                    return data
+                del self.cache[key]
+            self.misses += 1
+            return None
+
+    def set(self, key, value, expira_en):
+        with self._lock:
+            if len(self.cache) >= self.max_items:
+                self._purgar()
+                if len(self.cache) >= self.max_items:
+                    self.cache.clear()
+            self.cache[key] = (value, expira_en)
+
+    def _purgar(self):
+        ahora = time.time()
+        for key in [k for k, (_, expira_en) in self.cache.items() if expira_en <= ahora]:
+            del self.cache[key]
+
+    def clear(self, key=None):
+        with self._lock:
+            if key:
+                self.cache.pop(key, None)
+            else:
+                self.cache.clear()
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'entradas': len(self.cache),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / total, 4) if total else 0.0
+            }
+
 global_cache = SimpleTTLCache(ttl_seconds=60) # 1 minuto de caché por defecto
+
+# Escaneos repetidos dentro del mismo bloque horario: (codigo, sala, día, bloque) -> aviso.
+# Cada entrada vence al terminar su bloque; se vacía al borrar historial de ingresos.
+escaneos_repetidos = ExpiringCache(max_items=50000)
\ No newline at end of file
@@ -0,0 +1,191 @@
+import os
+import json
+import queue
+import itertools
+import threading
+from db import usar_pool_fondo
+from utils.queries_dashboard import obtener_datos_dashboard
+
+# ============================================================
+# CANAL SSE DEL DASHBOARD (/admin/api/dashboard_stream)
+# ============================================================
+# Un único hilo productor calcula los datos de hoy una vez por tick y por
+# filtro de sede (Administrador = todas, Supervisor = su sede) y los reparte
+# a todas las pestañas abiertas con ese filtro. Solo se envían las claves que
+# cambiaron desde el último tick; una pestaña nueva recibe la foto completa.
+# Cada stream ocupa un hilo de Waitress, por eso hay un tope de suscriptores:
+# por encima se responde 204 y el navegador reintenta más tarde.
+INTERVALO = float(os.getenv('DASHBOARD_STREAM_INTERVALO', 5))
+LATIDO = float(os.getenv('DASHBOARD_STREAM_LATIDO', 15))
+MAX_SUSCRIPTORES = int(os.getenv('DASHBOARD_STREAM_MAX', 4))
+
+INICIO_STREAM = "retry: 5000\n\n"
+LATIDO_STREAM = ": ping\n\n"
+
+# Claves de obtener_datos_dashboard que viajan por el stream
+CLAVES_PAYLOAD = ('total_hoy', 'total_alumnos', 'total_visitantes', 'total_egresados', 'total_personal',
+                  'total_docentes', 'pisos', 'salas', 'sedes', 'ultimos')
+
+
+def _mensaje(datos):
+    return f"data: {json.dumps(datos, default=str)}\n\n"
+
+
+class Suscriptor:
+    __slots__ = ('sede', 'cola', 'activo')
+
+    def __init__(self, sede):
+        self.sede = sede
+        # Pocos mensajes en cola: si la pestaña no lee, se la da por caída
+        self.cola = queue.Queue(maxsize=20)
+        self.activo = True
+
+    def entregar(self, mensaje):
+        try:
+            self.cola.put_nowait(mensaje)
+            return True
+        except queue.Full:
+            self.activo = False
+            return False
+
+    def mensajes(self):
+        """Generador del stream: mensajes del productor o un latido si no hay."""
+        yield INICIO_STREAM
+        while self.activo:
+            try:
+                yield self.cola.get(timeout=LATIDO)
+            except queue.Empty:
+                yield LATIDO_STREAM
+
+
+class CanalDashboard:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._despertar = threading.Event()
+        self._hilo = None
+        self._ids = itertools.count(1)
+        self._suscriptores = {}
+        self._nuevos = set()
+        # sede -> último payload enviado
+        self._ultimo = {}
+        self.calculos = 0
+        self.mensajes = 0
+        self.rechazados_204 = 0
+        self.desconectados = 0
+
+    def suscribir(self, sede):
+        """(sid, suscriptor), o (None, None) si se alcanzó el tope."""
+        with self._lock:
+            if len(self._suscriptores) >= MAX_SUSCRIPTORES:
+                self.rechazados_204 += 1
+                return None, None
+            sid = next(self._ids)
+            suscriptor = Suscriptor(sede)
+            self._suscriptores[sid] = suscriptor
+            ultimo = self._ultimo.get(sede)
+            if ultimo is not None:
+                suscriptor.entregar(_mensaje(ultimo))
+            else:
+                self._nuevos.add(sid)
+        self._iniciar()
+        if ultimo is None:
+            self._despertar.set()
+        return sid, suscriptor
+
+    def cancelar(self, sid):
+        with self._lock:
+            suscriptor = self._suscriptores.pop(sid, None)
+            self._nuevos.discard(sid)
+        if suscriptor:
+            suscriptor.activo = False
+
+    # ---------------------------------------------------------
+    # Productor
+    # ---------------------------------------------------------
+    def _iniciar(self):
+        with self._lock:
+            if self._hilo:
+                return
+            self._hilo = threading.Thread(target=self._ciclo)
+            self._hilo.daemon = True
+        self._hilo.start()
+
+    def _calcular(self, sede):
+        datos = obtener_datos_dashboard(None, None, sede, None, None)
+        self.calculos += 1
+        if not datos:
+            return None
+        return {clave: datos[clave] for clave in CLAVES_PAYLOAD}
+
+    def _repartir(self, sede, payload):
+        """Guarda el payload de la sede y lo envía (completo o solo lo que cambió)."""
+        caidos = []
+        with self._lock:
+            # Bajo el lock: una suscripción nueva recibe exactamente la foto
+            # sobre la que se calculan los siguientes deltas
+            anterior = self._ultimo.get(sede)
+            self._ultimo[sede] = payload
+            completo = _mensaje(payload)
+            delta = None
+            if anterior is not None:
+                cambios = {k: v for k, v in payload.items() if anterior.get(k) != v}
+                delta = _mensaje(cambios) if cambios else None
+
+            for sid, suscriptor in self._suscriptores.items():
+                if suscriptor.sede != sede:
+                    continue
+                if sid in self._nuevos or anterior is None:
+                    mensaje = completo
+                    self._nuevos.discard(sid)
+                else:
+                    mensaje = delta
+                if mensaje is None:
+                    continue
+                if suscriptor.entregar(mensaje):
+                    self.mensajes += 1
+                else:
+                    caidos.append(sid)
+
+        for sid in caidos:
+            self.desconectados += 1
+            self.cancelar(sid)
+
+    def _ciclo(self):
+        usar_pool_fondo()
+        while True:
+            with self._lock:
+                sedes = {suscriptor.sede for suscriptor in self._suscriptores.values()}
+                # Sin pestañas abiertas no se guarda el payload de la sede
+                for sede in list(self._ultimo):
+                    if sede not in sedes:
+                        del self._ultimo[sede]
+
+            for sede in sedes:
+                try:
+                    payload = self._calcular(sede)
+                    if payload is not None:
+                        self._repartir(sede, payload)
+                except Exception as e:
+                    print(f"Error en canal SSE del dashboard ({sede or 'Todas'}): {e}")
+
+            self._despertar.wait(INTERVALO)
+            self._despertar.clear()
+
+    def estadisticas(self):
+        with self._lock:
+            por_sede = {}
+            for suscriptor in self._suscriptores.values():
+                clave = suscriptor.sede or 'Todas'
+                por_sede[clave] = por_sede.get(clave, 0) + 1
+            return {
+                'suscriptores': por_sede,
+                'max_suscriptores': MAX_SUSCRIPTORES,
+                'calculos': self.calculos,
+                'mensajes': self.mensajes,
+                'rechazados_204': self.rechazados_204,
+                'desconectados': self.desconectados
+            }
+
+
+canal_dashboard = CanalDashboard()
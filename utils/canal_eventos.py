@@ -0,0 +1,171 @@
+import os
+import json
+import itertools
+import threading
+from db import usar_pool_fondo
+from utils.queries_eventos import obtener_agenda_eventos_hoy
+
+# ============================================================
+# CANAL SSE DE EVENTOS POR SEDE (/api/eventos_stream)
+# ============================================================
+# Un único hilo productor revisa la agenda (en caché) de las sedes que tienen
+# terminales conectadas y les empuja los cambios: la agenda completa cuando
+# algo cambia y un aviso por evento cuando empieza, termina o se cancela.
+# Guardar o eliminar un evento despierta al productor en el momento. El
+# polling de main.js e ingreso.html queda solo como respaldo si el canal cae.
+ACTIVO = os.getenv('EVENTOS_PUSH', 'true').lower() == 'true'
+# Cada cuántos segundos se recalcula el estado (los cambios por hora son al minuto)
+INTERVALO = float(os.getenv('EVENTOS_PUSH_INTERVALO', 5))
+# Comentario SSE para mantener viva la conexión y detectar clientes caídos
+LATIDO = float(os.getenv('EVENTOS_PUSH_LATIDO', 15))
+# Cada stream servido por Waitress ocupa un hilo mientras está abierto; por
+# encima de este tope se responde 204 y la terminal sigue con polling. Con
+# SCAN_ASYNC=true el front end asyncio atiende el canal sin ocupar hilos.
+MAX_STREAMS_WAITRESS = int(os.getenv('EVENTOS_PUSH_MAX_WAITRESS', 4))
+
+# Primer bloque de cada stream: el navegador reintenta a los 5 s si se corta
+INICIO_STREAM = "retry: 5000\n\n"
+LATIDO_STREAM = ": ping\n\n"
+
+
+def _mensaje(tipo, datos):
+    return f"event: {tipo}\ndata: {json.dumps(datos, ensure_ascii=False, default=str)}\n\n"
+
+
+def _estado_evento(evento):
+    """Estado por evento que se avisa a las terminales: proximo, en_curso o finalizado."""
+    if evento.get('estado') not in (None, 'Activo'):
+        return 'finalizado'
+    return evento['estado_virtual']
+
+
+class CanalEventos:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._despertar = threading.Event()
+        self._hilo = None
+        self._ids = itertools.count(1)
+        # id -> (sede, entregar); entregar(mensaje) no debe bloquear
+        self._suscriptores = {}
+        self._nuevos = set()
+        # sede -> (agenda, {evento_id: estado})
+        self._ultimo = {}
+        self.streams_waitress = 0
+        self.mensajes = 0
+        self.rechazados_204 = 0
+
+    # ---------------------------------------------------------
+    # Suscripción
+    # ---------------------------------------------------------
+    def suscribir(self, sede, entregar):
+        """
+        Registra una conexión. La foto inicial de la agenda se envía desde el
+        hilo productor, así quien llama (p. ej. el event loop) no toca la BD.
+        """
+        with self._lock:
+            sid = next(self._ids)
+            self._suscriptores[sid] = (sede or 'Central', entregar)
+            self._nuevos.add(sid)
+        self._iniciar()
+        self._despertar.set()
+        return sid
+
+    def cancelar(self, sid):
+        with self._lock:
+            self._suscriptores.pop(sid, None)
+            self._nuevos.discard(sid)
+
+    def reservar_stream_waitress(self):
+        with self._lock:
+            if self.streams_waitress >= MAX_STREAMS_WAITRESS:
+                self.rechazados_204 += 1
+                return False
+            self.streams_waitress += 1
+            return True
+
+    def liberar_stream_waitress(self):
+        with self._lock:
+            self.streams_waitress -= 1
+
+    def despertar(self):
+        """Recalcular ya (tras guardar o eliminar un evento)."""
+        self._despertar.set()
+
+    # ---------------------------------------------------------
+    # Productor
+    # ---------------------------------------------------------
+    def _iniciar(self):
+        with self._lock:
+            if self._hilo:
+                return
+            self._hilo = threading.Thread(target=self._ciclo)
+            self._hilo.daemon = True
+        self._hilo.start()
+
+    def _enviar(self, destinatarios, mensaje):
+        for entregar in destinatarios:
+            try:
+                entregar(mensaje)
+            except Exception as e:
+                print(f"Aviso - No se pudo entregar mensaje SSE de eventos: {e}")
+        self.mensajes += len(destinatarios)
+
+    def _revisar_sede(self, sede, suscriptores, nuevos):
+        agenda = obtener_agenda_eventos_hoy(sede)
+        estados = {e['id']: _estado_evento(e) for e in agenda}
+        agenda_anterior, estados_anteriores = self._ultimo.get(sede, (None, None))
+        self._ultimo[sede] = (agenda, estados)
+
+        mensaje_agenda = _mensaje('agenda', {'eventos': agenda})
+        if nuevos:
+            self._enviar(nuevos, mensaje_agenda)
+        if agenda_anterior is None or agenda == agenda_anterior:
+            return
+
+        self._enviar(suscriptores, mensaje_agenda)
+        for evento_id, estado in estados.items():
+            if estados_anteriores.get(evento_id) != estado:
+                self._enviar(suscriptores, _mensaje('estado', {'id': evento_id, 'estado': estado}))
+        for evento_id in estados_anteriores.keys() - estados.keys():
+            # Ya no figura en la agenda del día: cancelado o eliminado
+            self._enviar(suscriptores, _mensaje('estado', {'id': evento_id, 'estado': 'cancelado'}))
+
+    def _ciclo(self):
+        usar_pool_fondo()
+        while True:
+            self._despertar.wait(INTERVALO)
+            self._despertar.clear()
+
+            with self._lock:
+                por_sede = {}
+                for sid, (sede, entregar) in self._suscriptores.items():
+                    existentes, nuevos = por_sede.setdefault(sede, ([], []))
+                    (nuevos if sid in self._nuevos else existentes).append(entregar)
+                self._nuevos.clear()
+                # Sin terminales conectadas no se guarda estado de la sede
+                for sede in list(self._ultimo):
+                    if sede not in por_sede:
+                        del self._ultimo[sede]
+
+            for sede, (existentes, nuevos) in por_sede.items():
+                try:
+                    self._revisar_sede(sede, existentes, nuevos)
+                except Exception as e:
+                    print(f"Error en canal SSE de eventos ({sede}): {e}")
+
+    def estadisticas(self):
+        with self._lock:
+            por_sede = {}
+            for sede, _ in self._suscriptores.values():
+                por_sede[sede] = por_sede.get(sede, 0) + 1
+            return {
+                'activo': ACTIVO,
+                'suscriptores': por_sede,
+                'streams_waitress': self.streams_waitress,
+                'rechazados_204': self.rechazados_204,
+                'mensajes': self.mensajes
+            }
+
+
+canal_eventos = CanalEventos()
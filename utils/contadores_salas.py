@@ -0,0 +1,100 @@
+import threading
+from datetime import date
+from db import get_db_connection
+from utils.filtros_fecha import filtro_ingresos
+
+
+class ContadoresSalas:
+    """
+    Ingresos del día por sala, en memoria. Cada sala se siembra con un
+    COUNT(*) la primera vez que se consulta en el día, luego solo se suma con
+    cada escaneo exitoso. Al cambiar de día todos los contadores vuelven a 0,
+    así todas las terminales de una sala muestran el mismo número.
+    El conteo es por proceso: con varios procesos de la app cada uno suma solo
+    sus escaneos sobre la siembra, y el número solo es exacto con uno.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._dia = date.today()
+        self._conteos = {}
+        self.siembras = 0
+
+    def _revisar_dia(self):
+        hoy = date.today()
+        if hoy != self._dia:
+            # Medianoche: el día nuevo empieza en 0 para todas las salas
+            self._dia = hoy
+            self._conteos = {}
+            return True
+        return False
+
+    def _sembrar(self, sala_id, dia):
+        conn = get_db_connection()
+        if not conn:
+            return None
+        try:
+            cursor = conn.cursor()
+            date_where, params = filtro_ingresos(dia, dia)
+            cursor.execute(f"""
+                SELECT COUNT(*)
+                FROM RegistroIngresos
+                WHERE SalaID = ? AND {date_where}
+            """, [sala_id] + params)
+            row = cursor.fetchone()
+            return row[0] if row else 0
+        except Exception as e:
+            print(f"Aviso - No se pudo sembrar el contador de la sala {sala_id}: {e}")
+            return None
+        finally:
+            conn.close()
+
+    def obtener(self, sala_id):
+        """Ingresos de hoy en la sala (siembra desde la BD solo la primera vez)."""
+        sala_id = int(sala_id)
+        with self._lock:
+            self._revisar_dia()
+            if sala_id in self._conteos:
+                return self._conteos[sala_id]
+            dia = self._dia
+
+        total = self._sembrar(sala_id, dia)
+        if total is None:
+            return 0
+
+        with self._lock:
+            # Si otro hilo sembró o ya pasó la medianoche, se respeta lo que hay
+            if self._dia == dia:
+                total = self._conteos.setdefault(sala_id, total)
+                self.siembras += 1
+        return total
+
+    def incrementar(self, sala_id, cantidad=1):
+        """Suma escaneos exitosos. Las salas aún no sembradas se contarán al sembrar."""
+        try:
+            sala_id = int(sala_id)
+        except (TypeError, ValueError):
+            return None
+        with self._lock:
+            if self._revisar_dia():
+                self._conteos[sala_id] = 0
+            if sala_id not in self._conteos:
+                return None
+            self._conteos[sala_id] += cantidad
+            return self._conteos[sala_id]
+
+    def reiniciar(self):
+        """Descarta los conteos (p. ej. tras borrar ingresos); se vuelven a sembrar al consultarlos."""
+        with self._lock:
+            self._conteos = {}
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                'dia': self._dia.isoformat(),
+                'salas': {str(k): v for k, v in self._conteos.items()},
+                'siembras': self.siembras
+            }
+
+
+contadores_salas = ContadoresSalas()
@@ -0,0 +1,395 @@
+import os
+import json
+import time
+import atexit
+import threading
+from datetime import datetime
+from db import get_db_connection, usar_pool_fondo
+from utils.bloques_horario import obtener_bloque, etiqueta_bloque
+from utils.indice_identidades import COLUMNA_REGISTRO
+from utils.filtros_fecha import ATRASO_MAX_INGRESO
+from utils.queries_dashboard import invalidar_cache_dashboard
+
+# ============================================================
+# CONFIGURACIÓN (modo opcional, desactivado por defecto)
+# ============================================================
+ACTIVA = os.getenv('SCAN_WRITE_BEHIND', 'false').lower() == 'true'
+# Se vacía la cola cada N milisegundos o al juntar M filas (lo que ocurra primero)
+FLUSH_MS = int(os.getenv('SCAN_WB_FLUSH_MS', 500))
+MAX_FILAS = min(int(os.getenv('SCAN_WB_MAX_FILAS', 100)), 200)  # 9 parámetros por fila, límite 2100
+# Líneas ya escritas en la BD que toleran quedar en el journal antes de compactarlo
+COMPACTAR_LINEAS = 10000
+RUTA_JOURNAL = os.getenv(
+    'SCAN_WB_JOURNAL',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'journal_ingresos.jsonl')
+)
+
+_COLUMNAS_ID = ['AlumnoID', 'EgresadoID', 'DocenteID', 'PersonalID', 'VisitanteID']
+_TIPO_POR_COLUMNA = {columna: tipo for tipo, columna in COLUMNA_REGISTRO.items()}
+
+_FILA_VALUES = "(CAST(? AS INT), CAST(? AS INT), CAST(? AS INT), CAST(? AS INT), CAST(? AS INT), CAST(? AS INT), CAST(? AS NVARCHAR(50)), CAST(? AS NVARCHAR(50)), CAST(? AS DATETIME))"
+
+
+class EscrituraDiferida:
+    """
+    Write-behind de ingresos aceptados: el escaneo se valida en memoria
+    (bloque horario y duplicados), se anota en un journal local durable y se
+    responde al terminal; un hilo escribe en RegistroIngresos por lotes y
+    vacía el journal cuando no queda nada pendiente.
+    """
+
+    def __init__(self, ruta_journal, flush_ms, max_filas):
+        self.ruta_journal = ruta_journal
+        self.flush_ms = flush_ms
+        self.max_filas = max_filas
+
+        self._cond = threading.Condition()
+        self._lock_vaciado = threading.Lock()
+        # Orden de toma: _lock_journal antes que _cond (nunca al revés)
+        self._lock_journal = threading.Lock()
+        self._lock_siembra = threading.Lock()
+        self._pendientes = []
+        self._journal = None
+        self._lineas_journal = 0
+        self._cortar_linea = False
+        self._hilo = None
+        self._detener = False
+
+        # Personas ya aceptadas en el bloque vigente: (tipo, id, sala_id)
+        self._bloque_vigente = None
+        self._aceptados = set()
+
+        self.escritos = 0
+        self.lotes = 0
+        self.errores = 0
+        self.ultimo_flush = None
+        self.ultimo_error = None
+
+    # ---------------------------------------------------------
+    # Journal local (solo se agrega; se trunca cuando todo llegó a la BD)
+    # ---------------------------------------------------------
+    def _abrir_journal(self):
+        os.makedirs(os.path.dirname(self.ruta_journal), exist_ok=True)
+        self._journal = open(self.ruta_journal, 'a', encoding='utf-8')
+
+    def _anotar(self, registro):
+        tamanio = os.fstat(self._journal.fileno()).st_size
+        try:
+            # Tras una falla que no se pudo deshacer la línea pudo quedar a
+            # medias: se corta antes de seguir para no perder este registro
+            prefijo = '\n' if self._cortar_linea else ''
+            self._journal.write(prefijo + json.dumps(registro) + '\n')
+            self._journal.flush()
+            os.fsync(self._journal.fileno())
+        except Exception:
+            self._deshacer_anotacion(tamanio)
+            raise
+        self._cortar_linea = False
+        self._lineas_journal += 1
+
+    def _deshacer_anotacion(self, tamanio):
+        """Quita del journal un registro que no quedó durable (irá por la vía síncrona)."""
+        try:
+            self._journal.close()
+        except Exception:
+            pass
+        try:
+            os.truncate(self.ruta_journal, tamanio)
+        except OSError:
+            self._cortar_linea = True
+        self._abrir_journal()
+
+    def _truncar_journal(self):
+        """Vacía el journal si ya no queda nada pendiente (se llama tras cada commit)."""
+        with self._lock_journal:
+            with self._cond:
+                pendientes = list(self._pendientes)
+            try:
+                if not pendientes:
+                    self._journal.seek(0)
+                    self._journal.truncate(0)
+                    self._journal.flush()
+                    os.fsync(self._journal.fileno())
+                    self._lineas_journal = 0
+                elif self._lineas_journal > COMPACTAR_LINEAS:
+                    # Con escaneos entrando sin pausa la cola nunca llega a 0:
+                    # cada tanto se reescribe solo lo pendiente
+                    self._reescribir_journal(pendientes)
+            except OSError as e:
+                # Lo ya escrito se repite al recuperar, sin duplicar (NOT EXISTS)
+                print(f"Aviso - No se pudo recortar el journal de ingresos: {e}")
+
+    def _reescribir_journal(self, pendientes):
+        temporal = self.ruta_journal + '.tmp'
+        with open(temporal, 'w', encoding='utf-8') as f:
+            for registro in pendientes:
+                f.write(json.dumps(registro) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        self._journal.close()
+        os.replace(temporal, self.ruta_journal)
+        self._journal = open(self.ruta_journal, 'a', encoding='utf-8')
+        self._cortar_linea = False
+        self._lineas_journal = len(pendientes)
+
+    def _recuperar_journal(self):
+        if not os.path.exists(self.ruta_journal):
+            return []
+        recuperados = []
+        with open(self.ruta_journal, encoding='utf-8') as f:
+            for linea in f:
+                linea = linea.strip()
+                if not linea:
+                    continue
+                try:
+                    recuperados.append(json.loads(linea))
+                except ValueError:
+                    # Última línea truncada por un corte de energía
+                    print(f"[AVISO] Línea inválida en journal de ingresos: {linea[:80]}")
+        return recuperados
+
+    # ---------------------------------------------------------
+    # Reglas en memoria
+    # ---------------------------------------------------------
+    def _consultar_bloque(self, inicio, fin):
+        """Quién ya ingresó en el bloque según la BD, o None si no se pudo consultar."""
+        conn = get_db_connection()
+        if not conn:
+            return None
+        try:
+            cursor = conn.cursor()
+            cursor.execute(f"""
+                SELECT {', '.join(_COLUMNAS_ID)}, SalaID
+                FROM RegistroIngresos
+                WHERE FechaHora >= ? AND FechaHora < ?
+            """, (inicio, fin))
+            aceptados = set()
+            for row in cursor.fetchall():
+                for i, columna in enumerate(_COLUMNAS_ID):
+                    if row[i] is not None:
+                        aceptados.add((_TIPO_POR_COLUMNA[columna], row[i], row[5]))
+                        break
+            return aceptados
+        except Exception as e:
+            print(f"Error sembrando bloque horario en memoria: {e}")
+            return None
+        finally:
+            conn.close()
+
+    def _pendientes_del_bloque(self, clave_bloque):
+        return {(r['tipo'], r['id'], r['sala_id']) for r in self._pendientes if r['bloque'] == list(clave_bloque)}
+
+    def _sembrar_bloque(self, clave_bloque, inicio, fin):
+        """
+        Carga de la BD quién ya ingresó en el bloque (una vez por bloque). La
+        consulta corre sin tomar _cond: los demás terminales y el hilo de
+        escritura siguen mientras tanto.
+        """
+        with self._lock_siembra:
+            with self._cond:
+                if self._bloque_vigente == clave_bloque:
+                    return True
+                # Lo que el hilo de escritura inserte durante la consulta ya no
+                # estará en la cola al instalar el bloque: se toma antes
+                en_cola = self._pendientes_del_bloque(clave_bloque)
+
+            aceptados = self._consultar_bloque(inicio, fin)
+            if aceptados is None:
+                return False
+
+            with self._cond:
+                self._aceptados = aceptados | en_cola | self._pendientes_del_bloque(clave_bloque)
+                self._bloque_vigente = clave_bloque
+            return True
+
+    def registrar(self, identidad, sala_id, momento, msg_concedido):
+        """
+        Valida y encola el ingreso. Retorna el mensaje para el terminal,
+        o None si el caso debe resolverse de forma síncrona en la BD.
+        """
+        bloque = obtener_bloque(momento)
+        if not bloque:
+            return None
+        numero, inicio, fin = bloque
+        clave_bloque = (momento.date().isoformat(), numero)
+        try:
+            sala_id = int(sala_id)
+        except (TypeError, ValueError):
+            return None
+
+        with self._cond:
+            vigente = self._bloque_vigente == clave_bloque
+        if not vigente and not self._sembrar_bloque(clave_bloque, inicio, fin):
+            return None
+
+        llave = (identidad.tipo, identidad.id, sala_id)
+        with self._cond:
+            # Otro hilo pudo pasar a otro bloque (p. ej. un lote con lecturas viejas)
+            if self._bloque_vigente != clave_bloque:
+                return None
+            if llave in self._aceptados:
+                return 'YA REGISTRADO EN ESTE BLOQUE HORARIO'
+            self._aceptados.add(llave)
+
+        registro = {
+            'tipo': identidad.tipo,
+            'id': identidad.id,
+            'sala_id': sala_id,
+            'turno': etiqueta_bloque(inicio, fin),
+            'fecha': momento.replace(microsecond=0).isoformat(),
+            'bloque': list(clave_bloque)
+        }
+        # El fsync va fuera de _cond; solo se encola lo que ya es durable
+        with self._lock_journal:
+            try:
+                self._anotar(registro)
+            except Exception as e:
+                print(f"Error escribiendo journal de ingresos (se registra en la BD): {e}")
+                with self._cond:
+                    self._aceptados.discard(llave)
+                return None
+            with self._cond:
+                self._pendientes.append(registro)
+                if len(self._pendientes) >= self.max_filas:
+                    self._cond.notify()
+
+        return msg_concedido
+
+    # ---------------------------------------------------------
+    # Escritura por lotes
+    # ---------------------------------------------------------
+    def _insertar_lote(self, lote):
+        conn = get_db_connection()
+        if not conn:
+            raise ConnectionError('Sin conexión a la BD')
+        try:
+            params = []
+            for registro in lote:
+                ids = [None] * len(_COLUMNAS_ID)
+                ids[_COLUMNAS_ID.index(COLUMNA_REGISTRO[registro['tipo']])] = registro['id']
+                params.extend(ids + [
+                    registro['sala_id'],
+                    registro['turno'],
+                    registro['tipo'],
+                    datetime.fromisoformat(registro['fecha'])
+                ])
+
+            valores = ',\n'.join([_FILA_VALUES] * len(lote))
+            # NOT EXISTS hace idempotente el reintento si el proceso cayó tras el COMMIT
+            sql = f"""
+                INSERT INTO RegistroIngresos (AlumnoID, EgresadoID, DocenteID, PersonalID, VisitanteID,
+                                              SalaID, Piso, Sede, Turno, TipoUsuario, FechaHora)
+                SELECT v.AlumnoID, v.EgresadoID, v.DocenteID, v.PersonalID, v.VisitanteID,
+                       v.SalaID, S.Piso, S.Sede, v.Turno, v.TipoUsuario, v.FechaHora
+                FROM (VALUES
+                    {valores}
+                ) AS v (AlumnoID, EgresadoID, DocenteID, PersonalID, VisitanteID, SalaID, Turno, TipoUsuario, FechaHora)
+                JOIN Salas S ON S.SalaID = v.SalaID
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM RegistroIngresos R
+                    WHERE R.FechaHora = v.FechaHora AND R.SalaID = v.SalaID
+                      AND (R.AlumnoID = v.AlumnoID OR R.EgresadoID = v.EgresadoID OR R.DocenteID = v.DocenteID
+                           OR R.PersonalID = v.PersonalID OR R.VisitanteID = v.VisitanteID)
+                )
+            """
+            cursor = conn.cursor()
+            cursor.execute(sql, params)
+            conn.commit()
+        finally:
+            conn.close()
+
+    def vaciar(self):
+        """Escribe en la BD todo lo pendiente. Retorna True si la cola quedó vacía."""
+        with self._lock_vaciado:
+            return self._vaciar()
+
+    def _vaciar(self):
+        while True:
+            with self._cond:
+                lote = self._pendientes[:self.max_filas]
+            if not lote:
+                return True
+            try:
+                self._insertar_lote(lote)
+            except Exception as e:
+                with self._cond:
+                    self.errores += 1
+                    self.ultimo_error = str(e)
+                print(f"Error escribiendo lote de ingresos (se reintentará): {e}")
+                return False
+
+            with self._cond:
+                del self._pendientes[:len(lote)]
+                self.escritos += len(lote)
+                self.lotes += 1
+                self.ultimo_flush = datetime.now()
+            self._truncar_journal()
+            # Ingresos recuperados del journal tras varias horas caído: caen en
+            # rangos que el dashboard ya guardó como históricos
+            if min(datetime.fromisoformat(r['fecha']) for r in lote) < datetime.now() - ATRASO_MAX_INGRESO:
+                invalidar_cache_dashboard()
+
+    def _bucle(self):
+        usar_pool_fondo()
+        while True:
+            with self._cond:
+                if not self._detener and len(self._pendientes) < self.max_filas:
+                    self._cond.wait(self.flush_ms / 1000.0)
+                if self._detener:
+                    return
+            if not self.vaciar():
+                time.sleep(2)
+
+    # ---------------------------------------------------------
+    # Ciclo de vida
+    # ---------------------------------------------------------
+    def iniciar(self):
+        if self._hilo:
+            return
+        with self._lock_journal, self._cond:
+            self._pendientes = self._recuperar_journal()
+            self._lineas_journal = len(self._pendientes)
+            self._abrir_journal()
+        if self._pendientes:
+            print(f"[*] Journal de ingresos: {len(self._pendientes)} registros pendientes recuperados")
+        self._hilo = threading.Thread(target=self._bucle)
+        self._hilo.daemon = True
+        self._hilo.start()
+        atexit.register(self.detener)
+
+    def detener(self):
+        """Hook de apagado: detiene el hilo y vacía la cola a la BD."""
+        if not self._hilo:
+            return
+        with self._cond:
+            self._detener = True
+            self._cond.notify_all()
+        self._hilo.join(timeout=5)
+        self._hilo = None
+        if not self.vaciar():
+            print(f"[AVISO] Quedaron {self.profundidad()} ingresos en el journal; se escribirán al reiniciar.")
+
+    @property
+    def activa(self):
+        return self._hilo is not None
+
+    def profundidad(self):
+        with self._cond:
+            return len(self._pendientes)
+
+    def estadisticas(self):
+        with self._cond:
+            return {
+                'activa': self._hilo is not None,
+                'pendientes': len(self._pendientes),
+                'escritos': self.escritos,
+                'lotes': self.lotes,
+                'errores': self.errores,
+                'ultimo_error': self.ultimo_error,
+                'ultimo_flush': self.ultimo_flush.strftime('%Y-%m-%d %H:%M:%S') if self.ultimo_flush else None,
+                'flush_ms': self.flush_ms,
+                'max_filas': self.max_filas
+            }
+
+
+escritura_diferida = EscrituraDiferida(RUTA_JOURNAL, FLUSH_MS, MAX_FILAS)
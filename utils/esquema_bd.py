@@ -0,0 +1,175 @@
+from db import get_db_connection
+
+# ============================================================
+# AJUSTES DE ESQUEMA IDEMPOTENTES (al arrancar)
+# ============================================================
+# Índices y columnas que el código espera encontrar. Cada paso comprueba
+# si ya existe antes de crearlo, así puede correr en cada arranque. Si el
+# usuario de la BD no tiene permisos de DDL, se avisa y se sigue: el código
+# funciona igual, solo sin la mejora del paso. Lo que reescribe tablas
+# grandes o depende del procedimiento de registro no va aquí sino en
+# migraciones/ (lo aplica un operador); al arrancar solo se detecta.
+
+PASOS = [
+    (
+        "Clave única de asistencia por evento (EventoID, CodigoEscaneado)",
+        """
+        IF NOT EXISTS (SELECT 1 FROM sys.indexes
+                       WHERE name = 'UX_AsistenciaEventos_Evento_Codigo'
+                         AND object_id = OBJECT_ID('AsistenciaEventos'))
+        BEGIN
+            IF EXISTS (SELECT 1 FROM AsistenciaEventos
+                       GROUP BY EventoID, CodigoEscaneado HAVING COUNT(*) > 1)
+                RAISERROR('AsistenciaEventos tiene asistencias duplicadas; depúrelas para crear la clave única.', 16, 1);
+            ELSE
+                CREATE UNIQUE INDEX UX_AsistenciaEventos_Evento_Codigo
+                    ON AsistenciaEventos (EventoID, CodigoEscaneado);
+        END
+        """
+    ),
+    (
+        "Identidad resuelta en AsistenciaEventos (PersonaID, NombrePersona, OrigenPersona)",
+        """
+        IF COL_LENGTH('AsistenciaEventos', 'PersonaID') IS NULL
+            ALTER TABLE AsistenciaEventos ADD PersonaID INT NULL;
+        IF COL_LENGTH('AsistenciaEventos', 'NombrePersona') IS NULL
+            ALTER TABLE AsistenciaEventos ADD NombrePersona NVARCHAR(300) NULL;
+        IF COL_LENGTH('AsistenciaEventos', 'OrigenPersona') IS NULL
+            ALTER TABLE AsistenciaEventos ADD OrigenPersona NVARCHAR(300) NULL;
+        """
+    ),
+    (
+        "Índice del detalle de asistentes (EventoID, HoraAsistencia)",
+        """
+        IF NOT EXISTS (SELECT 1 FROM sys.indexes
+                       WHERE name = 'IX_AsistenciaEventos_Evento_Hora'
+                         AND object_id = OBJECT_ID('AsistenciaEventos'))
+            CREATE INDEX IX_AsistenciaEventos_Evento_Hora
+                ON AsistenciaEventos (EventoID, HoraAsistencia)
+                INCLUDE (CodigoEscaneado, TipoPersona, PersonaID, NombrePersona, OrigenPersona);
+        """
+    ),
+    (
+        "Leases de tareas programadas (TareasProgramadas)",
+        """
+        IF OBJECT_ID('TareasProgramadas') IS NULL
+            CREATE TABLE TareasProgramadas (
+                Nombre NVARCHAR(100) NOT NULL PRIMARY KEY,
+                Duenio NVARCHAR(200) NULL,
+                VenceEn DATETIME2 NULL,
+                UltimaEjecucion DATETIME2 NULL,
+                DuracionMs INT NULL,
+                Resultado NVARCHAR(500) NULL
+            );
+        """
+    ),
+    (
+        "Resumen por hora de ingresos (ResumenIngresosHora, ResumenIngresosMarca)",
+        """
+        IF OBJECT_ID('ResumenIngresosHora') IS NULL
+            CREATE TABLE ResumenIngresosHora (
+                Hora DATETIME NOT NULL,
+                Sede NVARCHAR(50) NOT NULL,
+                Piso INT NOT NULL,
+                SalaID INT NOT NULL,
+                TipoUsuario NVARCHAR(50) NOT NULL,
+                Origen NVARCHAR(300) NOT NULL,
+                Cantidad INT NOT NULL,
+                CONSTRAINT PK_ResumenIngresosHora PRIMARY KEY (Hora, Sede, Piso, SalaID, TipoUsuario, Origen)
+            );
+        IF OBJECT_ID('ResumenIngresosMarca') IS NULL
+        BEGIN
+            CREATE TABLE ResumenIngresosMarca (
+                MarcaID INT NOT NULL PRIMARY KEY CHECK (MarcaID = 1),
+                UltimoRegistroID BIGINT NOT NULL,
+                Reconstruir BIT NOT NULL,
+                ActualizadoEn DATETIME NULL
+            );
+            INSERT INTO ResumenIngresosMarca (MarcaID, UltimoRegistroID, Reconstruir) VALUES (1, 0, 0);
+        END
+        """
+    ),
+    (
+        "Persona y origen por tipo de usuario (vista OrigenesPersona)",
+        # Vista simple (no indexada: SQL Server no indexa vistas con UNION ALL);
+        # cada rama se resuelve por la clave primaria de su tabla.
+        """
+        IF OBJECT_ID('OrigenesPersona', 'V') IS NULL
+            EXEC('
+            CREATE VIEW OrigenesPersona AS
+            SELECT ''Alumno'' AS TipoPersona, AlumnoID AS PersonaID, NombreCompleto, DNI, CodigoMatricula,
+                   Facultad, Escuela AS Origen, Escuela AS OrigenReporte
+            FROM Alumnos
+            UNION ALL
+            SELECT ''Visitante'', VisitanteID, NombreCompleto, DNI, NULL,
+                   Institucion, Institucion, Institucion
+            FROM Visitantes
+            UNION ALL
+            SELECT ''Egresado'', EgresadoID, NombreCompleto, DNI, CodigoMatricula,
+                   Facultad, EscuelaProfesional, EscuelaProfesional
+            FROM Egresados
+            UNION ALL
+            SELECT ''Administrativo'', PersonalID, ApellidosNombres, DNI, NULL,
+                   Oficina, Oficina, Oficina
+            FROM PersonalAdministrativo
+            UNION ALL
+            SELECT ''Docente'', DocenteID, ApellidosNombres, DNI, NULL,
+                   Facultad, Facultad, ''Escuela de '' + Facultad
+            FROM Docentes
+            ');
+        """
+    ),
+]
+
+# Qué partes opcionales del esquema están disponibles (se completa al arrancar).
+# Mientras no se verifique, el código usa el esquema original.
+capacidades = {
+    'identidad_asistencia': False,
+    'lease_tareas': False,
+    'resumen_ingresos': False,
+    'origenes_persona': False,
+    'persona_ingreso': False,
+    'hora_lectura': False,
+}
+
+
+def _detectar_capacidades(cursor):
+    cursor.execute("SELECT CASE WHEN COL_LENGTH('AsistenciaEventos', 'OrigenPersona') IS NULL THEN 0 ELSE 1 END")
+    capacidades['identidad_asistencia'] = bool(cursor.fetchone()[0])
+    cursor.execute("SELECT CASE WHEN OBJECT_ID('TareasProgramadas') IS NULL THEN 0 ELSE 1 END")
+    capacidades['lease_tareas'] = bool(cursor.fetchone()[0])
+    cursor.execute("SELECT CASE WHEN OBJECT_ID('ResumenIngresosMarca') IS NULL THEN 0 ELSE 1 END")
+    capacidades['resumen_ingresos'] = bool(cursor.fetchone()[0])
+    cursor.execute("SELECT CASE WHEN OBJECT_ID('OrigenesPersona', 'V') IS NULL THEN 0 ELSE 1 END")
+    capacidades['origenes_persona'] = bool(cursor.fetchone()[0])
+    # Las dos siguientes vienen de migraciones/ (las corre un operador, no el arranque)
+    cursor.execute("SELECT CASE WHEN COL_LENGTH('RegistroIngresos', 'PersonaIngresoID') IS NULL THEN 0 ELSE 1 END")
+    capacidades['persona_ingreso'] = bool(cursor.fetchone()[0])
+    cursor.execute("""SELECT CASE WHEN EXISTS (SELECT 1 FROM sys.default_constraints
+                   WHERE name = 'DF_RegistroIngresos_FechaHoraLectura') THEN 1 ELSE 0 END""")
+    capacidades['hora_lectura'] = bool(cursor.fetchone()[0])
+
+
+def asegurar_esquema():
+    conn = get_db_connection()
+    if not conn:
+        print("Aviso - No se pudo verificar el esquema: BD no disponible")
+        return False
+    ok = True
+    try:
+        cursor = conn.cursor()
+        for descripcion, sql in PASOS:
+            try:
+                cursor.execute(sql)
+                conn.commit()
+            except Exception as e:
+                ok = False
+                conn.rollback()
+                print(f"Aviso - Esquema '{descripcion}' no aplicado: {e}")
+        try:
+            _detectar_capacidades(cursor)
+        except Exception as e:
+            print(f"Aviso - No se pudo detectar el esquema disponible: {e}")
+        return ok
+    finally:
+        conn.close()
@@ -0,0 +1,100 @@
+from datetime import date, datetime, time, timedelta
+
+# ============================================================
+# FILTROS SARGABLES SOBRE RegistroIngresos
+# ============================================================
+# CAST(FechaHora AS DATE/TIME) e ISNULL(Sede, ...) obligan a SQL Server a
+# recorrer la tabla completa. Aquí los filtros se traducen a rangos
+# semiabiertos sobre la columna sin transformar (FechaHora >= ? AND
+# FechaHora < ?) y a comparaciones directas de Sede, que sí usan índices.
+
+# Con un filtro de horas, cada día del rango se convierte en su propio rango
+# de FechaHora (varias búsquedas en el índice). Para rangos más largos se
+# conserva el rango de días y la hora se filtra como predicado residual.
+MAX_DIAS_RANGOS_HORA = 62
+
+# Atraso máximo aceptado para la hora de lectura de un controlador: con el
+# write-behind un ingreso puede quedar con FechaHora de hasta 12 h atrás.
+ATRASO_MAX_INGRESO = timedelta(hours=12)
+
+
+def _a_fecha(valor):
+    if isinstance(valor, datetime):
+        return valor.date()
+    if isinstance(valor, date):
+        return valor
+    return date.fromisoformat(str(valor).strip())
+
+
+def _a_hora(valor):
+    if isinstance(valor, time):
+        return valor
+    return time.fromisoformat(str(valor).strip())
+
+
+def _columna(alias, nombre):
+    return f"{alias}.{nombre}" if alias else nombre
+
+
+def rango_dias(f_inicio=None, f_fin=None):
+    """
+    Días [f_inicio, f_fin] (ambos incluidos) como (desde, hasta) datetimes
+    para FechaHora >= desde AND FechaHora < hasta. Sin fechas: hoy.
+    """
+    if f_inicio and f_fin:
+        inicio, fin = _a_fecha(f_inicio), _a_fecha(f_fin)
+    else:
+        inicio = fin = date.today()
+    desde = datetime.combine(inicio, time.min)
+    hasta = datetime.combine(fin + timedelta(days=1), time.min)
+    return desde, hasta
+
+
+def filtro_sede(sede, alias=''):
+    """(sql, params) de la sede; las filas con Sede NULL pertenecen a Central."""
+    if not sede or sede == 'Todas':
+        return '', []
+    columna = _columna(alias, 'Sede')
+    if sede == 'Central':
+        return f"({columna} = 'Central' OR {columna} IS NULL)", []
+    return f"{columna} = ?", [sede]
+
+
+def filtro_fuera_de_central(alias=''):
+    """Equivale a ISNULL(Sede, 'Central') != 'Central' (los NULL no califican)."""
+    return f"{_columna(alias, 'Sede')} <> 'Central'"
+
+
+def filtro_ingresos(f_inicio=None, f_fin=None, sede=None, hora_inicio=None, hora_fin=None, alias=''):
+    """
+    Construye el WHERE (sin la palabra WHERE) y sus parámetros para filtrar
+    RegistroIngresos por rango de días, franja horaria y sede.
+    El límite superior de la franja horaria es inclusivo, como en los filtros
+    originales (CAST(FechaHora AS TIME) <= hora_fin).
+    """
+    fecha_hora = _columna(alias, 'FechaHora')
+    desde, hasta = rango_dias(f_inicio, f_fin)
+
+    condiciones = [f"{fecha_hora} >= ? AND {fecha_hora} < ?"]
+    params = [desde, hasta]
+
+    if hora_inicio and hora_fin:
+        h_ini, h_fin = _a_hora(hora_inicio), _a_hora(hora_fin)
+        dias = (hasta - desde).days
+        if dias <= MAX_DIAS_RANGOS_HORA:
+            rangos = []
+            for i in range(dias):
+                dia = desde.date() + timedelta(days=i)
+                rangos.append(f"({fecha_hora} >= ? AND {fecha_hora} <= ?)")
+                params.extend([datetime.combine(dia, h_ini), datetime.combine(dia, h_fin)])
+            condiciones.append("(" + " OR ".join(rangos) + ")")
+        else:
+            condiciones.append(f"CAST({fecha_hora} AS TIME) >= ? AND CAST({fecha_hora} AS TIME) <= ?")
+            params.extend([h_ini, h_fin])
+
+    sql_sede, params_sede = filtro_sede(sede, alias)
+    if sql_sede:
+        condiciones.append(sql_sede)
+        params.extend(params_sede)
+
+    return " AND ".join(condiciones), params
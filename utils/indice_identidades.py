@@ -0,0 +1,278 @@
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime
+from db import get_db_connection, usar_pool_fondo
+
+# Orden de prioridad con el que sp_RegistrarIngreso identifica a una persona.
+# Alumnos se buscan por Código de Matrícula o DNI; el resto solo por DNI.
+TIPOS_PRIORIDAD = ('Alumno', 'Egresado', 'Docente', 'Administrativo', 'Visitante')
+
+# Columna de RegistroIngresos que guarda el ID de cada tipo de persona
+COLUMNA_REGISTRO = {
+    'Alumno': 'AlumnoID',
+    'Egresado': 'EgresadoID',
+    'Docente': 'DocenteID',
+    'Administrativo': 'PersonalID',
+    'Visitante': 'VisitanteID',
+}
+
+Identidad = namedtuple('Identidad', 'tipo id nombre escuela semestre vencimiento')
+
+_SQL_POR_TIPO = {
+    'Alumno': """
+        SELECT a.AlumnoID, a.NombreCompleto, COALESCE(e.NombreEscuela, a.Escuela),
+               COALESCE(s.NombreSemestre, a.Semestre), a.FechaVencimientoCarnet,
+               a.CodigoMatricula, a.DNI
+        FROM Alumnos a
+        LEFT JOIN Escuelas e ON a.EscuelaID = e.EscuelaID
+        LEFT JOIN Semestres s ON a.SemestreID = s.SemestreID
+        WHERE ISNULL(a.Estado, 1) = 1 {filtro}
+    """,
+    'Egresado': """
+        SELECT EgresadoID, NombreCompleto, EscuelaProfesional, 'EGRESADO', NULL, NULL, DNI
+        FROM Egresados WHERE ISNULL(Estado, 1) = 1 {filtro}
+    """,
+    'Docente': """
+        SELECT DocenteID, ApellidosNombres, Facultad, 'DOCENTE', NULL, NULL, DNI
+        FROM Docentes WHERE 1 = 1 {filtro}
+    """,
+    'Administrativo': """
+        SELECT PersonalID, ApellidosNombres, Oficina, 'ADMINISTRATIVO', NULL, NULL, DNI
+        FROM PersonalAdministrativo WHERE 1 = 1 {filtro}
+    """,
+    'Visitante': """
+        SELECT VisitanteID, NombreCompleto, Institucion, 'VISITANTE', NULL, NULL, DNI
+        FROM Visitantes WHERE 1 = 1 {filtro}
+    """,
+}
+
+_COLUMNA_ID = {
+    'Alumno': 'a.AlumnoID',
+    'Egresado': 'EgresadoID',
+    'Docente': 'DocenteID',
+    'Administrativo': 'PersonalID',
+    'Visitante': 'VisitanteID',
+}
+
+# SQL Server admite 2100 parámetros por sentencia
+_TAMANO_LOTE = 900
+
+
+def limpiar_clave(valor):
+    """DNI o código tal como se indexa: sin espacios, None si está vacío o es '0'."""
+    if valor is None:
+        return None
+    clave = str(valor).strip()
+    if clave in ('', '0', '0.0'):
+        return None
+    return clave
+
+
+class IndiceIdentidades:
+    """
+    Índice en memoria Código de Matrícula / DNI -> persona. El registro
+    síncrono siempre lo resuelve sp_RegistrarIngreso; el índice solo lo usan
+    los modos que registran o responden sin el procedimiento (write-behind y
+    acuse del journal offline), así que se carga y mantiene únicamente si
+    alguno está activo (habilitar()). Los textos repetidos (escuelas,
+    facultades, semestres) se guardan una sola vez, de modo que 60k+
+    personas ocupan pocos MB.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.habilitado = False
+        self._por_clave = {}
+        self._textos = {}
+        self.cargado = False
+        self.ultima_carga = None
+        self.duracion_carga_ms = 0
+        self.cargando = False
+
+    # ---------------------------------------------------------
+    # Lectura (camino del escáner, sin bloqueos)
+    # ---------------------------------------------------------
+    def buscar(self, codigo):
+        if not self.cargado:
+            return None
+        return self._por_clave.get(codigo)
+
+    # ---------------------------------------------------------
+    # Construcción
+    # ---------------------------------------------------------
+    def _compartir(self, textos, valor):
+        if valor is None:
+            return None
+        return textos.setdefault(valor, valor)
+
+    def _crear_identidad(self, textos, tipo, row):
+        return Identidad(
+            tipo,
+            row[0],
+            row[1] or '',
+            self._compartir(textos, row[2]),
+            self._compartir(textos, row[3]),
+            self._compartir(textos, row[4])
+        )
+
+    def _claves_de_fila(self, tipo, row):
+        if tipo == 'Alumno':
+            return [c for c in (limpiar_clave(row[5]), limpiar_clave(row[6])) if c]
+        clave = limpiar_clave(row[6])
+        return [clave] if clave else []
+
+    def habilitar(self):
+        """Lo llama el arranque cuando un modo que consulta el índice está activo."""
+        self.habilitado = True
+
+    def recargar(self):
+        """Carga completa del índice desde la BD (reemplazo atómico)."""
+        if not self.habilitado:
+            return False
+        conn = get_db_connection()
+        if not conn:
+            return False
+
+        inicio = time.perf_counter()
+        self.cargando = True
+        try:
+            cursor = conn.cursor()
+            nuevo = {}
+            textos = {}
+            # Se recorre en orden de prioridad: el primero que toma una clave la conserva
+            for tipo in TIPOS_PRIORIDAD:
+                cursor.execute(_SQL_POR_TIPO[tipo].format(filtro=''))
+                for row in cursor.fetchall():
+                    claves = self._claves_de_fila(tipo, row)
+                    if not claves:
+                        continue
+                    identidad = self._crear_identidad(textos, tipo, row)
+                    for clave in claves:
+                        nuevo.setdefault(clave, identidad)
+
+            with self._lock:
+                self._por_clave = nuevo
+                self._textos = textos
+                self.cargado = True
+                self.ultima_carga = datetime.now()
+                self.duracion_carga_ms = int((time.perf_counter() - inicio) * 1000)
+            print(f"[*] Índice de identidades cargado: {len(nuevo)} claves en {self.duracion_carga_ms} ms")
+            return True
+        except Exception as e:
+            print(f"Error cargando índice de identidades: {e}")
+            return False
+        finally:
+            self.cargando = False
+            conn.close()
+
+    def _recargar_en_fondo(self):
+        usar_pool_fondo()
+        self.recargar()
+
+    def recargar_async(self):
+        if not self.habilitado:
+            return
+        hilo = threading.Thread(target=self._recargar_en_fondo)
+        hilo.daemon = True
+        hilo.start()
+
+    # ---------------------------------------------------------
+    # Mantenimiento incremental (después de CRUD)
+    # ---------------------------------------------------------
+    def _resolver_claves(self, cursor, claves):
+        """Vuelve a resolver contra la BD las claves dadas, respetando la prioridad."""
+        conjunto = set(claves)
+        claves = sorted(conjunto)
+        encontrados = {}
+        for tipo in TIPOS_PRIORIDAD:
+            for i in range(0, len(claves), _TAMANO_LOTE):
+                lote = claves[i:i + _TAMANO_LOTE]
+                marcadores = ','.join(['?'] * len(lote))
+                if tipo == 'Alumno':
+                    filtro = f"AND (a.CodigoMatricula IN ({marcadores}) OR a.DNI IN ({marcadores}))"
+                    params = lote + lote
+                else:
+                    filtro = f"AND DNI IN ({marcadores})"
+                    params = lote
+                cursor.execute(_SQL_POR_TIPO[tipo].format(filtro=filtro), params)
+                for row in cursor.fetchall():
+                    for clave in self._claves_de_fila(tipo, row):
+                        if clave in conjunto and clave not in encontrados:
+                            encontrados[clave] = (tipo, row)
+        return encontrados
+
+    def _aplicar(self, claves, encontrados):
+        with self._lock:
+            for clave in claves:
+                self._por_clave.pop(clave, None)
+            identidades = {}
+            for clave, (tipo, row) in encontrados.items():
+                llave = (tipo, row[0])
+                if llave not in identidades:
+                    identidades[llave] = self._crear_identidad(self._textos, tipo, row)
+                self._por_clave[clave] = identidades[llave]
+
+    def refrescar_claves(self, claves):
+        """Actualiza el índice para los códigos/DNIs indicados (altas y ediciones)."""
+        claves = {c for c in (limpiar_clave(x) for x in claves) if c}
+        if not claves or not self.cargado:
+            return
+        conn = get_db_connection()
+        if not conn:
+            return
+        try:
+            cursor = conn.cursor()
+            self._aplicar(claves, self._resolver_claves(cursor, list(claves)))
+        except Exception as e:
+            print(f"Error refrescando índice de identidades: {e}")
+        finally:
+            conn.close()
+
+    def refrescar_entidad(self, tipo, ids):
+        """
+        Actualiza el índice para personas identificadas por su ID (ediciones y
+        eliminaciones): se descartan sus claves anteriores y se resuelven de nuevo.
+        """
+        ids = {int(i) for i in ids if i not in (None, '')}
+        if not ids or not self.cargado:
+            return
+        with self._lock:
+            claves = {c for c, ident in self._por_clave.items() if ident.tipo == tipo and ident.id in ids}
+
+        conn = get_db_connection()
+        if not conn:
+            return
+        try:
+            cursor = conn.cursor()
+            lista_ids = sorted(ids)
+            for i in range(0, len(lista_ids), _TAMANO_LOTE):
+                lote = lista_ids[i:i + _TAMANO_LOTE]
+                marcadores = ','.join(['?'] * len(lote))
+                filtro = f"AND {_COLUMNA_ID[tipo]} IN ({marcadores})"
+                cursor.execute(_SQL_POR_TIPO[tipo].format(filtro=filtro), lote)
+                for row in cursor.fetchall():
+                    claves.update(self._claves_de_fila(tipo, row))
+            if claves:
+                self._aplicar(claves, self._resolver_claves(cursor, list(claves)))
+        except Exception as e:
+            print(f"Error refrescando índice de identidades: {e}")
+        finally:
+            conn.close()
+
+    def estadisticas(self):
+        with self._lock:
+            personas = len({(i.tipo, i.id) for i in self._por_clave.values()})
+            return {
+                'habilitado': self.habilitado,
+                'cargado': self.cargado,
+                'cargando': self.cargando,
+                'claves': len(self._por_clave),
+                'personas': personas,
+                'textos_compartidos': len(self._textos),
+                'ultima_carga': self.ultima_carga.strftime('%Y-%m-%d %H:%M:%S') if self.ultima_carga else None,
+                'duracion_carga_ms': self.duracion_carga_ms
+            }
+
+
+indice_identidades = IndiceIdentidades()
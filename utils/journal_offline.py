@@ -0,0 +1,193 @@
+import os
+import time
+import sqlite3
+import threading
+from datetime import datetime
+from db import crear_conexion_directa, usar_pool_fondo, acortar_timeout_login
+
+# ============================================================
+# MODO DEGRADADO DEL ESCÁNER (SQL Server inaccesible)
+# ============================================================
+ACTIVO = os.getenv('SCAN_MODO_OFFLINE', 'false').lower() == 'true'
+# Cada cuántos segundos se sondea la BD mientras está caída
+INTERVALO_SONDEO = float(os.getenv('SCAN_OFFLINE_SONDEO', 5))
+# Timeout corto del sondeo para detectar la caída/recuperación rápido
+TIMEOUT_SONDEO = int(os.getenv('SCAN_OFFLINE_TIMEOUT', 3))
+RUTA_JOURNAL = os.getenv(
+    'SCAN_OFFLINE_JOURNAL',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'journal_offline.db')
+)
+
+
+class JournalOffline:
+    """
+    Cuando la BD no responde, los escaneos de personas del índice en memoria
+    se guardan en un journal SQLite local (solo se agrega) y reciben un acuse
+    provisional. Un hilo sondea la BD y, al volver, re-procesa los escaneos en
+    orden con la lógica normal (la hora original queda en FechaHoraLectura si
+    se aplicó migraciones/001_hora_lectura.sql).
+    """
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self._lock = threading.Lock()
+        self._hilo = None
+        self._reproducir = None
+
+        self.caida_desde = None
+        self.guardados = 0
+        self.reproducidos = 0
+        self.resultados = {'success': 0, 'warning': 0, 'error': 0}
+
+    def _conectar(self):
+        conn = sqlite3.connect(self.ruta, timeout=10)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=FULL")
+        return conn
+
+    def _crear_tabla(self):
+        os.makedirs(os.path.dirname(self.ruta), exist_ok=True)
+        with self._lock:
+            conn = self._conectar()
+            try:
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS EscaneosPendientes (
+                        ID INTEGER PRIMARY KEY AUTOINCREMENT,
+                        Codigo TEXT NOT NULL,
+                        SalaID INTEGER,
+                        FechaHora TEXT NOT NULL
+                    )
+                """)
+                conn.commit()
+            finally:
+                conn.close()
+
+    # ---------------------------------------------------------
+    # Detección de caída (circuit breaker)
+    # ---------------------------------------------------------
+    def bd_caida(self):
+        return self.caida_desde is not None
+
+    def marcar_caida(self):
+        if self.caida_desde is None:
+            self.caida_desde = datetime.now()
+            print(f"[AVISO] BD inaccesible desde {self.caida_desde:%H:%M:%S}: escaneos al journal local")
+
+    def _sondear(self):
+        try:
+            conn = crear_conexion_directa(timeout=TIMEOUT_SONDEO)
+            conn.close()
+            return True
+        except Exception:
+            return False
+
+    # ---------------------------------------------------------
+    # Journal
+    # ---------------------------------------------------------
+    def guardar(self, codigo, sala_id, momento):
+        with self._lock:
+            conn = self._conectar()
+            try:
+                conn.execute(
+                    "INSERT INTO EscaneosPendientes (Codigo, SalaID, FechaHora) VALUES (?, ?, ?)",
+                    (codigo, sala_id, momento.isoformat())
+                )
+                conn.commit()
+            finally:
+                conn.close()
+            self.guardados += 1
+
+    def pendientes(self):
+        if not os.path.exists(self.ruta):
+            return 0
+        with self._lock:
+            conn = self._conectar()
+            try:
+                return conn.execute("SELECT COUNT(*) FROM EscaneosPendientes").fetchone()[0]
+            finally:
+                conn.close()
+
+    def _siguiente(self):
+        with self._lock:
+            conn = self._conectar()
+            try:
+                return conn.execute(
+                    "SELECT ID, Codigo, SalaID, FechaHora FROM EscaneosPendientes ORDER BY ID LIMIT 1"
+                ).fetchone()
+            finally:
+                conn.close()
+
+    def _borrar(self, id_escaneo):
+        with self._lock:
+            conn = self._conectar()
+            try:
+                conn.execute("DELETE FROM EscaneosPendientes WHERE ID = ?", (id_escaneo,))
+                conn.commit()
+            finally:
+                conn.close()
+
+    def _reproducir_pendientes(self):
+        """Re-procesa en orden; se detiene si la BD vuelve a fallar."""
+        while True:
+            fila = self._siguiente()
+            if not fila:
+                return
+            id_escaneo, codigo, sala_id, fecha = fila
+            res = self._reproducir(codigo, sala_id, datetime.fromisoformat(fecha))
+            if res.get('msg') == 'Error BD':
+                self.marcar_caida()
+                return
+            if res.get('msg') == 'Servidor ocupado, intente nuevamente':
+                # Pool de fondo sin conexiones libres: se reintenta en la próxima vuelta
+                return
+            self._borrar(id_escaneo)
+            self.reproducidos += 1
+            estado = res.get('status', 'error')
+            self.resultados[estado] = self.resultados.get(estado, 0) + 1
+
+    def _bucle(self):
+        usar_pool_fondo()
+        while True:
+            try:
+                if self.bd_caida():
+                    if self._sondear():
+                        print(f"[*] BD disponible nuevamente (caída desde {self.caida_desde:%H:%M:%S})")
+                        self.caida_desde = None
+                if not self.bd_caida():
+                    self._reproducir_pendientes()
+            except Exception as e:
+                print(f"Error en el replay del journal offline: {e}")
+            time.sleep(INTERVALO_SONDEO)
+
+    # ---------------------------------------------------------
+    # Ciclo de vida
+    # ---------------------------------------------------------
+    def iniciar(self, funcion_reproducir):
+        """funcion_reproducir(codigo, sala_id, momento) -> dict de resultado."""
+        if self._hilo:
+            return
+        self._reproducir = funcion_reproducir
+        self._crear_tabla()
+        # La primera caída se detecta con el timeout del sondeo, no con el de 15 s
+        acortar_timeout_login(TIMEOUT_SONDEO)
+        self._hilo = threading.Thread(target=self._bucle)
+        self._hilo.daemon = True
+        self._hilo.start()
+
+    @property
+    def activo(self):
+        return self._hilo is not None
+
+    def estadisticas(self):
+        return {
+            'activo': self.activo,
+            'bd_caida': self.bd_caida(),
+            'caida_desde': self.caida_desde.strftime('%Y-%m-%d %H:%M:%S') if self.caida_desde else None,
+            'pendientes': self.pendientes() if self.activo else 0,
+            'guardados': self.guardados,
+            'reproducidos': self.reproducidos,
+            'resultados': dict(self.resultados)
+        }
+
+
+journal_offline = JournalOffline(RUTA_JOURNAL)
@@ -0,0 +1,231 @@
+import os
+import math
+import time
+import threading
+from datetime import date
+from collections import deque
+from db import get_db_connection, usar_pool_fondo
+
+# ============================================================
+# TRAZAS DE LATENCIA DEL ESCANEO POR ETAPA
+# ============================================================
+# Cada escaneo marca el tiempo transcurrido entre etapas (validación,
+# preparación, conexión, ejecución, commit, respuesta). Los tiempos van a
+# histogramas logarítmicos por ventana de un minuto: registrar cuesta un
+# par de sumas en un diccionario, así que puede quedar activo en producción.
+ACTIVAS = os.getenv('SCAN_METRICAS', 'true').lower() == 'true'
+VENTANA_S = 60
+VENTANAS = int(os.getenv('SCAN_METRICAS_MINUTOS', 15))
+
+# Cubetas geométricas (10% de ancho) desde 0.05 ms
+_BASE_MS = 0.05
+_FACTOR = 1.1
+_LOG_FACTOR = math.log(_FACTOR)
+
+# Cada cuánto se releen las salas activas y los eventos del día que pueden ser etiqueta
+ETIQUETAS_TTL = int(os.getenv('SCAN_METRICAS_ETIQUETAS_TTL', 60))
+
+ETAPAS = ('validacion', 'preparacion', 'conexion', 'ejecucion', 'commit', 'respuesta', 'total')
+
+_local = threading.local()
+
+
+def _cubeta(ms):
+    if ms <= _BASE_MS:
+        return 0
+    return int(math.log(ms / _BASE_MS) / _LOG_FACTOR) + 1
+
+
+def _limite_superior(cubeta):
+    return _BASE_MS * (_FACTOR ** cubeta)
+
+
+class Traza:
+    __slots__ = ('ruta', 'inicio', 'ultimo', 'etapas')
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self.inicio = self.ultimo = time.perf_counter()
+        self.etapas = {}
+
+    def marcar(self, etapa):
+        """Asigna a `etapa` el tiempo desde la marca anterior."""
+        ahora = time.perf_counter()
+        self.etapas[etapa] = self.etapas.get(etapa, 0.0) + (ahora - self.ultimo) * 1000
+        self.ultimo = ahora
+
+
+def iniciar_traza(ruta):
+    if not ACTIVAS:
+        return None
+    traza = Traza(ruta)
+    _local.traza = traza
+    return traza
+
+
+def marcar_etapa(etapa):
+    """Marca una etapa en la traza del hilo actual (no hace nada si no hay traza)."""
+    traza = getattr(_local, 'traza', None)
+    if traza is not None:
+        traza.marcar(etapa)
+
+
+def soltar_traza():
+    """Desvincula la traza del hilo (p. ej. antes de serializar en otro hilo)."""
+    _local.traza = None
+
+
+def finalizar_traza(traza, sala, resultado):
+    if traza is None:
+        return
+    traza.marcar('respuesta')
+    traza.etapas['total'] = (traza.ultimo - traza.inicio) * 1000
+    if getattr(_local, 'traza', None) is traza:
+        _local.traza = None
+    metricas_escaneo.registrar(traza.ruta, str(sala), resultado or 'error', traza.etapas)
+
+
+class EtiquetasSala:
+    """
+    Etiquetas de sala/evento admitidas en los histogramas. La sala y el evento
+    llegan en el cuerpo del escaneo: un valor que no sea una sala activa ni un
+    evento de hoy se agrupa como 'otra', así un cliente no puede crear series
+    nuevas a voluntad. Los IDs válidos se releen en un hilo aparte cuando
+    vencen, nunca en el camino del escaneo (ni en el event loop asyncio).
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._salas = frozenset()
+        self._eventos = frozenset()
+        self._vence = 0.0
+        self._actualizando = False
+
+    def _leer(self):
+        usar_pool_fondo()
+        try:
+            conn = get_db_connection()
+            if not conn:
+                return
+            try:
+                cursor = conn.cursor()
+                cursor.execute("SELECT SalaID FROM Salas WHERE Activo = 1")
+                salas = frozenset(int(row[0]) for row in cursor.fetchall())
+                cursor.execute(
+                    "SELECT EventoID FROM Eventos WHERE FechaEvento = ? AND Estado != 'Cancelado'",
+                    (date.today(),)
+                )
+                eventos = frozenset(int(row[0]) for row in cursor.fetchall())
+            finally:
+                conn.close()
+            self._salas, self._eventos = salas, eventos
+        except Exception as e:
+            print(f"Aviso - No se pudieron leer las etiquetas de métricas: {e}")
+        finally:
+            with self._lock:
+                self._vence = time.monotonic() + self.ttl
+                self._actualizando = False
+
+    def _revisar(self):
+        if time.monotonic() < self._vence:
+            return
+        with self._lock:
+            if self._actualizando or time.monotonic() < self._vence:
+                return
+            self._actualizando = True
+        hilo = threading.Thread(target=self._leer)
+        hilo.daemon = True
+        hilo.start()
+
+    @staticmethod
+    def _entero(valor):
+        try:
+            return int(valor)
+        except (TypeError, ValueError, OverflowError):
+            return None
+
+    def sala(self, sala_id):
+        self._revisar()
+        sala_id = self._entero(sala_id)
+        return str(sala_id) if sala_id in self._salas else 'otra'
+
+    def evento(self, evento_id):
+        self._revisar()
+        evento_id = self._entero(evento_id)
+        return f"evento:{evento_id}" if evento_id in self._eventos else 'otra'
+
+
+etiquetas_sala = EtiquetasSala(ETIQUETAS_TTL)
+
+
+class MetricasEscaneo:
+    """Histogramas móviles de latencia por (ruta, sala, resultado, etapa)."""
+
+    def __init__(self, ventanas):
+        self._lock = threading.Lock()
+        # deque de (minuto, {(ruta, sala, resultado): {etapa: {cubeta: conteo}}})
+        self._ventanas = deque(maxlen=ventanas)
+
+    def registrar(self, ruta, sala, resultado, etapas):
+        minuto = int(time.time() // VENTANA_S)
+        clave = (ruta, sala, resultado)
+        with self._lock:
+            if not self._ventanas or self._ventanas[-1][0] != minuto:
+                self._ventanas.append((minuto, {}))
+            por_clave = self._ventanas[-1][1].setdefault(clave, {})
+            for etapa, ms in etapas.items():
+                histograma = por_clave.setdefault(etapa, {})
+                cubeta = _cubeta(ms)
+                histograma[cubeta] = histograma.get(cubeta, 0) + 1
+
+    @staticmethod
+    def _percentiles(histograma):
+        total = sum(histograma.values())
+        resultado = {'n': total}
+        cubetas = sorted(histograma.items())
+        for nombre, p in (('p50', 0.50), ('p95', 0.95), ('p99', 0.99)):
+            objetivo = max(1, math.ceil(total * p))
+            acumulado = 0
+            for cubeta, conteo in cubetas:
+                acumulado += conteo
+                if acumulado >= objetivo:
+                    resultado[nombre] = round(_limite_superior(cubeta), 2)
+                    break
+        return resultado
+
+    def resumen(self, minutos=None):
+        """Percentiles (ms, cota superior de la cubeta) de los últimos `minutos`."""
+        desde = int(time.time() // VENTANA_S) - (minutos or len(self._ventanas) or 1) + 1
+        agrupados = {'global': {}, 'por_ruta': {}, 'por_sala': {}, 'por_resultado': {}}
+
+        def acumular(destino, etapa, histograma):
+            dest = destino.setdefault(etapa, {})
+            for cubeta, conteo in histograma.items():
+                dest[cubeta] = dest.get(cubeta, 0) + conteo
+
+        with self._lock:
+            for minuto, datos in self._ventanas:
+                if minuto < desde:
+                    continue
+                for (ruta, sala, resultado), por_etapa in datos.items():
+                    for etapa, histograma in por_etapa.items():
+                        acumular(agrupados['global'], etapa, histograma)
+                        acumular(agrupados['por_ruta'].setdefault(ruta, {}), etapa, histograma)
+                        acumular(agrupados['por_sala'].setdefault(sala, {}), etapa, histograma)
+                        acumular(agrupados['por_resultado'].setdefault(resultado, {}), etapa, histograma)
+
+        def ordenar(por_etapa):
+            return {e: self._percentiles(por_etapa[e]) for e in ETAPAS if e in por_etapa}
+
+        return {
+            'activas': ACTIVAS,
+            'minutos': minutos or len(self._ventanas),
+            'global': ordenar(agrupados['global']),
+            'por_ruta': {k: ordenar(v) for k, v in agrupados['por_ruta'].items()},
+            'por_sala': {k: ordenar(v) for k, v in agrupados['por_sala'].items()},
+            'por_resultado': {k: ordenar(v) for k, v in agrupados['por_resultado'].items()}
+        }
+
+
+metricas_escaneo = MetricasEscaneo(VENTANAS)
@@ -0,0 +1,65 @@
+from utils.esquema_bd import capacidades
+
+# ============================================================
+# PERSONA Y ORIGEN DE CADA INGRESO
+# ============================================================
+# Un ingreso apunta a una sola persona por una de sus cinco columnas
+# (AlumnoID, VisitanteID, EgresadoID, PersonalID, DocenteID). La vista
+# OrigenesPersona (esquema_bd) reúne nombre, DNI, facultad y origen de las
+# cinco tablas con la clave (TipoPersona, PersonaID), así cada consulta hace
+# un solo JOIN en lugar de cinco. La clave del lado del ingreso son las
+# columnas calculadas TipoPersonaIngreso/PersonaIngresoID (migración 002); si
+# aún no se aplicó se calcula con las mismas expresiones. Sin la vista (sin permisos de DDL)
+# se usan los cinco LEFT JOIN con COALESCE de siempre.
+
+_TIPO = """CASE WHEN {r}.AlumnoID IS NOT NULL THEN 'Alumno'
+                WHEN {r}.VisitanteID IS NOT NULL THEN 'Visitante'
+                WHEN {r}.EgresadoID IS NOT NULL THEN 'Egresado'
+                WHEN {r}.PersonalID IS NOT NULL THEN 'Administrativo'
+                WHEN {r}.DocenteID IS NOT NULL THEN 'Docente' END"""
+_ID = "COALESCE({r}.AlumnoID, {r}.VisitanteID, {r}.EgresadoID, {r}.PersonalID, {r}.DocenteID)"
+
+_JOINS_TABLAS = """
+    LEFT JOIN Alumnos A ON {r}.AlumnoID = A.AlumnoID
+    LEFT JOIN Visitantes V ON {r}.VisitanteID = V.VisitanteID
+    LEFT JOIN Egresados E ON {r}.EgresadoID = E.EgresadoID
+    LEFT JOIN PersonalAdministrativo P ON {r}.PersonalID = P.PersonalID
+    LEFT JOIN Docentes D ON {r}.DocenteID = D.DocenteID"""
+
+_COLUMNAS_VISTA = {
+    'nombre': 'O.NombreCompleto',
+    'dni': 'O.DNI',
+    'codigo': 'O.CodigoMatricula',
+    'facultad': 'O.Facultad',
+    'origen': 'O.Origen',
+    # En reportes y en la tabla de últimos ingresos el docente figura como 'Escuela de <Facultad>'
+    'origen_reporte': 'O.OrigenReporte',
+    'encontrada': 'O.PersonaID IS NOT NULL',
+}
+
+_COLUMNAS_TABLAS = {
+    'nombre': 'COALESCE(A.NombreCompleto, V.NombreCompleto, E.NombreCompleto, P.ApellidosNombres, D.ApellidosNombres)',
+    'dni': 'COALESCE(A.DNI, V.DNI, E.DNI, P.DNI, D.DNI)',
+    'codigo': 'COALESCE(A.CodigoMatricula, E.CodigoMatricula)',
+    'facultad': 'COALESCE(A.Facultad, E.Facultad, D.Facultad, P.Oficina, V.Institucion)',
+    'origen': 'COALESCE(A.Escuela, E.EscuelaProfesional, V.Institucion, P.Oficina, D.Facultad)',
+    'origen_reporte': "COALESCE(A.Escuela, V.Institucion, E.EscuelaProfesional, P.Oficina, 'Escuela de ' + D.Facultad)",
+    'encontrada': 'COALESCE(A.AlumnoID, V.VisitanteID, E.EgresadoID, P.PersonalID, D.DocenteID) IS NOT NULL',
+}
+
+
+def persona_de_ingreso(alias='R'):
+    """
+    (joins, columnas) para resolver la persona de cada ingreso de `alias`.
+    `columnas` trae las expresiones nombre, dni, codigo, facultad, origen,
+    origen_reporte y encontrada (condición: el ingreso tiene persona).
+    """
+    if capacidades['origenes_persona']:
+        if capacidades['persona_ingreso']:
+            tipo, persona = f"{alias}.TipoPersonaIngreso", f"{alias}.PersonaIngresoID"
+        else:
+            tipo, persona = _TIPO.format(r=alias), _ID.format(r=alias)
+        joins = (f"\n    LEFT JOIN OrigenesPersona O ON O.TipoPersona = {tipo}"
+                 f"\n        AND O.PersonaID = {persona}")
+        return joins, _COLUMNAS_VISTA
+    return _JOINS_TABLAS.format(r=alias), _COLUMNAS_TABLAS
@@ -0,0 +1,310 @@
+import os
+import time
+import threading
+from datetime import datetime, timedelta
+from db import get_db_connection, usar_pool_fondo
+from utils.indice_identidades import limpiar_clave
+
+# ============================================================
+# PADRÓN EN MEMORIA DE LOS EVENTOS EN CURSO
+# ============================================================
+# En una graduación o conferencia miles de lecturas van al mismo EventoID.
+# Mientras el evento está en curso se mantiene en memoria: sus reglas, la
+# lista de invitados VIP, las poblaciones habilitadas y los códigos que ya
+# registraron asistencia. Así procesar_ingreso_evento decide admitir,
+# denegar o "ya registrado" sin consultar la BD y solo escribe la asistencia.
+# Los códigos que no están en el padrón (altas de último minuto) siguen
+# resolviéndose contra la BD.
+ACTIVO = os.getenv('EVENTOS_PADRON', 'true').lower() == 'true'
+# Segundos antes de volver a intentar armar el padrón de un evento que no estaba en curso
+REINTENTO_S = int(os.getenv('EVENTOS_PADRON_REINTENTO', 60))
+
+# Mismo criterio que la agenda: el evento se considera en curso 15 minutos antes
+_ANTICIPACION = timedelta(minutes=15)
+
+# Prioridad de procesar_ingreso_evento; el primero que toma una clave la conserva
+ORDEN_EVENTO = ('InvitadoEvento', 'Alumno', 'Egresado', 'Personal', 'Docente', 'Visitante')
+
+MENSAJES_DENEGADO = {
+    'Alumno': 'Acceso denegado: Evento no habilitado para Alumnos.',
+    'Egresado': 'Acceso denegado: Evento no habilitado para Egresados.',
+    'Personal': 'Acceso denegado: Evento no habilitado para Personal.',
+    'Visitante': 'Acceso denegado: Evento no habilitado para Visitantes.',
+    'Docente': 'Acceso denegado: Evento no habilitado para Docentes.',
+}
+
+# Columnas: Nombre, Escuela, Semestre, DNI, Codigo, PersonaID, Origen sin valor por defecto
+# (mismos textos que la consulta en BD)
+_SQL_POBLACION = {
+    'InvitadoEvento': """
+        SELECT NombreCompleto, ISNULL(Institucion, 'Invitado Especial'), 'INVITADO', DNI, NULL,
+               InvitadoID, Institucion
+        FROM InvitadosEvento WHERE EventoID = ?
+    """,
+    'Alumno': """
+        SELECT a.NombreCompleto, ISNULL(e.NombreEscuela, 'Sin Escuela'), ISNULL(s.NombreSemestre, ''),
+               a.DNI, a.CodigoMatricula, a.AlumnoID, e.NombreEscuela
+        FROM Alumnos a
+        LEFT JOIN Escuelas e ON a.EscuelaID = e.EscuelaID
+        LEFT JOIN Semestres s ON a.SemestreID = s.SemestreID
+    """,
+    'Egresado': """
+        SELECT eg.NombreCompleto, ISNULL(es.NombreEscuela, 'Egresado'), 'EGRESADO', eg.DNI, NULL,
+               eg.EgresadoID, es.NombreEscuela
+        FROM Egresados eg
+        LEFT JOIN Escuelas es ON eg.EscuelaID = es.EscuelaID
+    """,
+    'Personal': """
+        SELECT ApellidosNombres, ISNULL(Oficina, 'Administrativo'), 'ADMINISTRATIVO', DNI, NULL,
+               PersonalID, Oficina
+        FROM PersonalAdministrativo
+    """,
+    'Docente': """
+        SELECT ApellidosNombres, ISNULL(Facultad, 'Docente'), 'DOCENTE', DNI, NULL,
+               DocenteID, Facultad
+        FROM Docentes
+    """,
+    'Visitante': """
+        SELECT NombreCompleto, ISNULL(Institucion, 'Visitante Externo'), 'VISITANTE', DNI, NULL,
+               VisitanteID, Institucion
+        FROM Visitantes
+    """,
+}
+
+# Poblaciones no habilitadas: basta saber que la clave existe para denegar
+_SQL_CLAVES = {
+    'Alumno': "SELECT DNI, CodigoMatricula FROM Alumnos",
+    'Egresado': "SELECT DNI, NULL FROM Egresados",
+    'Personal': "SELECT DNI, NULL FROM PersonalAdministrativo",
+    'Docente': "SELECT DNI, NULL FROM Docentes",
+    'Visitante': "SELECT DNI, NULL FROM Visitantes",
+}
+
+
+class PadronEvento:
+    """Reglas, personas y asistencias de un evento en curso."""
+
+    def __init__(self, evento_id, nombre, fin, permisos):
+        self.evento_id = evento_id
+        self.nombre = nombre
+        self.fin = fin
+        self.permisos = permisos
+        # clave -> (tipo, nombre, escuela, semestre, identificadores, persona_id, origen)
+        # o (tipo,) si no está habilitado
+        self.personas = {}
+        self.asistencia = set()
+        self.construido = datetime.now()
+        self._lock = threading.Lock()
+
+    def resolver(self, codigo):
+        """
+        ('denegado', msg) | ('duplicado', persona) | ('admitir', persona), o None
+        si el código no está en el padrón (se resuelve en la BD).
+        """
+        persona = self.personas.get(limpiar_clave(codigo))
+        if persona is None:
+            return None
+        if len(persona) == 1:
+            return 'denegado', MENSAJES_DENEGADO[persona[0]]
+        if self.asistencia.intersection(persona[4]):
+            return 'duplicado', persona
+        return 'admitir', persona
+
+    def reservar(self, identificadores):
+        """Marca la asistencia antes del INSERT; False si otro escaneo se adelantó."""
+        with self._lock:
+            if self.asistencia.intersection(identificadores):
+                return False
+            self.asistencia.update(identificadores)
+            return True
+
+    def liberar(self, identificadores):
+        with self._lock:
+            self.asistencia.difference_update(identificadores)
+
+
+class PadronesEventos:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._padrones = {}
+        self._no_en_curso = {}
+        self._construyendo = set()
+        self.aciertos = 0
+        self.fallos = 0
+        self.construcciones = 0
+
+    # ---------------------------------------------------------
+    # Consulta (camino del escáner)
+    # ---------------------------------------------------------
+    def obtener(self, evento_id):
+        """
+        Padrón del evento si ya está armado. Si no, lanza su construcción en
+        segundo plano y devuelve None (mientras tanto se usa la BD).
+        """
+        if not ACTIVO:
+            return None
+        evento_id = int(evento_id)
+        padron = self._padrones.get(evento_id)
+        if padron is not None:
+            if datetime.now() > padron.fin:
+                self.descartar(evento_id)
+                return None
+            return padron
+        if self._no_en_curso.get(evento_id, 0) > time.monotonic():
+            return None
+        self._programar(evento_id)
+        return None
+
+    def contar(self, acierto):
+        if acierto:
+            self.aciertos += 1
+        else:
+            self.fallos += 1
+
+    # ---------------------------------------------------------
+    # Construcción
+    # ---------------------------------------------------------
+    def _programar(self, evento_id):
+        with self._lock:
+            if evento_id in self._construyendo:
+                return
+            self._construyendo.add(evento_id)
+        hilo = threading.Thread(target=self._construir, args=(evento_id,))
+        hilo.daemon = True
+        hilo.start()
+
+    def _cargar(self, cursor, evento_id):
+        cursor.execute("""
+            SELECT NombreEvento, Estado, FechaEvento, HoraInicio, HoraFin,
+                   PermiteAlumnos, PermiteEgresados, PermitePersonal, PermiteVisitantes, PermiteDocentes
+            FROM Eventos WHERE EventoID = ?
+        """, (evento_id,))
+        row = cursor.fetchone()
+        if not row or not row[2] or not row[3] or not row[4]:
+            return None
+
+        nombre, estado, fecha, h_ini, h_fin = row[0], row[1], row[2], row[3], row[4]
+        inicio = datetime.combine(fecha, h_ini)
+        fin = datetime.combine(fecha, h_fin)
+        ahora = datetime.now()
+        if estado != 'Activo' or ahora < inicio - _ANTICIPACION or ahora > fin:
+            return None
+
+        permisos = {
+            'InvitadoEvento': True,
+            'Alumno': bool(row[5]),
+            'Egresado': bool(row[6]),
+            'Personal': bool(row[7]),
+            'Visitante': bool(row[8]),
+            'Docente': bool(row[9]),
+        }
+        padron = PadronEvento(evento_id, nombre, fin, permisos)
+        textos = {}
+
+        for tipo in ORDEN_EVENTO:
+            if permisos[tipo]:
+                params = (evento_id,) if tipo == 'InvitadoEvento' else ()
+                cursor.execute(_SQL_POBLACION[tipo], params)
+                for fila in cursor.fetchall():
+                    dni, cod = limpiar_clave(fila[3]), limpiar_clave(fila[4])
+                    claves = [c for c in (dni, cod) if c]
+                    if not claves:
+                        continue
+                    persona = (
+                        tipo,
+                        fila[0],
+                        textos.setdefault(fila[1], fila[1]),
+                        textos.setdefault(fila[2], fila[2]),
+                        # Alumnos: se validan DNI y código para evitar doble ingreso
+                        tuple(claves),
+                        fila[5],
+                        textos.setdefault(fila[6], fila[6])
+                    )
+                    for clave in claves:
+                        padron.personas.setdefault(clave, persona)
+            else:
+                denegado = (tipo,)
+                cursor.execute(_SQL_CLAVES[tipo])
+                for fila in cursor.fetchall():
+                    for clave in (limpiar_clave(fila[0]), limpiar_clave(fila[1])):
+                        if clave:
+                            padron.personas.setdefault(clave, denegado)
+
+        cursor.execute("SELECT CodigoEscaneado FROM AsistenciaEventos WHERE EventoID = ?", (evento_id,))
+        padron.asistencia = {c for c in (limpiar_clave(r[0]) for r in cursor.fetchall()) if c}
+        return padron
+
+    def _construir(self, evento_id):
+        usar_pool_fondo()
+        inicio = time.perf_counter()
+        conn = None
+        try:
+            conn = get_db_connection()
+            if not conn:
+                return
+            padron = self._cargar(conn.cursor(), evento_id)
+            with self._lock:
+                if padron is None:
+                    self._padrones.pop(evento_id, None)
+                    self._no_en_curso[evento_id] = time.monotonic() + REINTENTO_S
+                    return
+                anterior = self._padrones.get(evento_id)
+                if anterior is not None:
+                    # Asistencias registradas mientras se reconstruía
+                    padron.asistencia |= anterior.asistencia
+                self._padrones[evento_id] = padron
+                self._no_en_curso.pop(evento_id, None)
+                self.construcciones += 1
+            print(f"[*] Padrón del evento {evento_id} listo: {len(padron.personas)} claves, "
+                  f"{len(padron.asistencia)} asistencias en {int((time.perf_counter() - inicio) * 1000)} ms")
+        except Exception as e:
+            print(f"Error armando padrón del evento {evento_id}: {e}")
+        finally:
+            with self._lock:
+                self._construyendo.discard(evento_id)
+            if conn:
+                conn.close()
+
+    # ---------------------------------------------------------
+    # Invalidación
+    # ---------------------------------------------------------
+    def descartar(self, evento_id):
+        """El evento terminó, cambió o se eliminó: el próximo escaneo decide si se vuelve a armar."""
+        with self._lock:
+            self._padrones.pop(int(evento_id), None)
+            self._no_en_curso.pop(int(evento_id), None)
+
+    def reconstruir(self, evento_id):
+        """
+        Vuelve a armar el padrón (p. ej. tras importar invitados con el evento
+        en curso). El padrón anterior sigue atendiendo hasta el reemplazo.
+        """
+        if not ACTIVO:
+            return
+        evento_id = int(evento_id)
+        with self._lock:
+            self._no_en_curso.pop(evento_id, None)
+        self._programar(evento_id)
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                'activo': ACTIVO,
+                'eventos': {
+                    str(k): {
+                        'nombre': p.nombre,
+                        'claves': len(p.personas),
+                        'asistencias': len(p.asistencia),
+                        'construido': p.construido.strftime('%Y-%m-%d %H:%M:%S'),
+                        'fin': p.fin.strftime('%Y-%m-%d %H:%M')
+                    } for k, p in self._padrones.items()
+                },
+                'construyendo': sorted(self._construyendo),
+                'aciertos': self.aciertos,
+                'fallos': self.fallos,
+                'construcciones': self.construcciones
+            }
+
+
+padrones_eventos = PadronesEventos()
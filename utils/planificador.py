@@ -0,0 +1,238 @@
+import os
+import time
+import socket
+import threading
+from datetime import datetime, timedelta
+from db import get_db_connection, usar_pool_fondo
+from utils.esquema_bd import capacidades
+
+# ============================================================
+# TAREAS PERIÓDICAS DE MANTENIMIENTO (en proceso)
+# ============================================================
+# Un hilo revisa cada pocos segundos qué tareas tocan (cada N segundos o a
+# horas fijas del día) y corre cada una en su propio hilo; una tarea no se
+# solapa consigo misma. Las tareas exclusivas toman además un lease en la
+# tabla TareasProgramadas, así con varios procesos de la app solo uno la
+# ejecuta por turno. Las no exclusivas (p. ej. calentar cachés en memoria)
+# corren en cada proceso.
+ACTIVO = os.getenv('TAREAS_PROGRAMADAS', 'true').lower() == 'true'
+# Segundos entre revisiones del planificador
+TICK = float(os.getenv('TAREAS_TICK', 5))
+
+# Identifica al proceso dueño del lease
+PROCESO = f"{socket.gethostname()}:{os.getpid()}"[:200]
+
+# Toma el lease si está libre, vencido o ya es nuestro. Devuelve 1 si se tomó.
+_SQL_TOMAR_LEASE = """
+SET NOCOUNT ON;
+DECLARE @nombre NVARCHAR(100) = ?, @duenio NVARCHAR(200) = ?, @segundos INT = ?, @ok INT = 0;
+BEGIN TRY
+    UPDATE TareasProgramadas WITH (UPDLOCK, HOLDLOCK)
+    SET Duenio = @duenio, VenceEn = DATEADD(SECOND, @segundos, SYSUTCDATETIME())
+    WHERE Nombre = @nombre
+      AND (VenceEn IS NULL OR VenceEn < SYSUTCDATETIME() OR Duenio = @duenio);
+    SET @ok = @@ROWCOUNT;
+
+    IF @ok = 0 AND NOT EXISTS (SELECT 1 FROM TareasProgramadas WHERE Nombre = @nombre)
+    BEGIN
+        INSERT INTO TareasProgramadas (Nombre, Duenio, VenceEn)
+        VALUES (@nombre, @duenio, DATEADD(SECOND, @segundos, SYSUTCDATETIME()));
+        SET @ok = 1;
+    END
+END TRY
+BEGIN CATCH
+    -- Otro proceso insertó la fila a la vez: el turno es suyo
+    IF ERROR_NUMBER() NOT IN (2601, 2627) THROW;
+END CATCH
+SELECT @ok;
+"""
+
+# Al terminar se deja el lease hasta el próximo turno, así otro proceso no
+# repite la tarea en el mismo intervalo, y se registra la ejecución.
+_SQL_SOLTAR_LEASE = """
+UPDATE TareasProgramadas
+SET VenceEn = DATEADD(SECOND, ?, SYSUTCDATETIME()),
+    UltimaEjecucion = SYSUTCDATETIME(), DuracionMs = ?, Resultado = ?
+WHERE Nombre = ? AND Duenio = ?
+"""
+
+
+class Tarea:
+
+    def __init__(self, nombre, funcion, intervalo=None, a_las=None, exclusiva=True, duracion_max=600):
+        if not intervalo and not a_las:
+            raise ValueError(f"La tarea '{nombre}' necesita intervalo o a_las")
+        self.nombre = nombre
+        self.funcion = funcion
+        self.intervalo = intervalo
+        # Horas fijas del día ('HH:MM'), como una línea de cron diaria
+        self.a_las = sorted(datetime.strptime(h, '%H:%M').time() for h in (a_las or []))
+        self.exclusiva = exclusiva
+        # Segundos que dura el lease mientras corre (si el proceso muere, se libera solo)
+        self.duracion_max = duracion_max
+
+        self.proxima = self.siguiente(datetime.now()) if self.a_las else datetime.now()
+        self.en_ejecucion = False
+        self.ejecuciones = 0
+        self.errores = 0
+        self.omitidas = 0
+        self.ultima_ejecucion = None
+        self.ultima_duracion_ms = None
+        self.ultimo_resultado = None
+
+    def siguiente(self, desde):
+        """Próximo turno posterior a `desde`."""
+        if self.intervalo:
+            return desde + timedelta(seconds=self.intervalo)
+        for hora in self.a_las:
+            turno = datetime.combine(desde.date(), hora)
+            if turno > desde:
+                return turno
+        return datetime.combine(desde.date() + timedelta(days=1), self.a_las[0])
+
+
+class Planificador:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._despertar = threading.Event()
+        self._hilo = None
+        self._tareas = {}
+
+    def registrar(self, nombre, funcion, intervalo=None, a_las=None, exclusiva=True, duracion_max=600):
+        tarea = Tarea(nombre, funcion, intervalo, a_las, exclusiva, duracion_max)
+        with self._lock:
+            self._tareas[nombre] = tarea
+        self._despertar.set()
+        return tarea
+
+    def iniciar(self):
+        if not ACTIVO:
+            print("[*] Tareas programadas desactivadas (TAREAS_PROGRAMADAS=false)")
+            return
+        with self._lock:
+            if self._hilo:
+                return
+            self._hilo = threading.Thread(target=self._ciclo)
+            self._hilo.daemon = True
+        self._hilo.start()
+
+    def ejecutar_ahora(self, nombre):
+        """Adelanta el turno de una tarea (respeta el no-solapamiento y el lease)."""
+        with self._lock:
+            tarea = self._tareas.get(nombre)
+            if not tarea:
+                return {'status': 'error', 'msg': f"No existe la tarea '{nombre}'"}
+            if tarea.en_ejecucion:
+                return {'status': 'error', 'msg': 'La tarea ya se está ejecutando'}
+            tarea.proxima = datetime.now()
+        self._despertar.set()
+        return {'status': 'success', 'msg': 'Tarea programada para ejecutarse ahora'}
+
+    # ---------------------------------------------------------
+    # Ciclo
+    # ---------------------------------------------------------
+    def _ciclo(self):
+        while True:
+            ahora = datetime.now()
+            with self._lock:
+                pendientes = [t for t in self._tareas.values() if not t.en_ejecucion and t.proxima <= ahora]
+                for tarea in pendientes:
+                    tarea.en_ejecucion = True
+            for tarea in pendientes:
+                hilo = threading.Thread(target=self._ejecutar, args=(tarea,))
+                hilo.daemon = True
+                hilo.start()
+
+            self._despertar.wait(TICK)
+            self._despertar.clear()
+
+    def _tomar_lease(self, tarea):
+        """True si este proceso puede correr la tarea en este turno."""
+        if not tarea.exclusiva or not capacidades['lease_tareas']:
+            return True
+        conn = get_db_connection()
+        if not conn:
+            # Sin BD la tarea fallará sola; no hay a quién ceder el turno
+            return True
+        try:
+            cursor = conn.cursor()
+            cursor.execute(_SQL_TOMAR_LEASE, (tarea.nombre, PROCESO, tarea.duracion_max))
+            ok = bool(cursor.fetchone()[0])
+            conn.commit()
+            return ok
+        except Exception as e:
+            print(f"Aviso - No se pudo tomar el lease de '{tarea.nombre}': {e}")
+            return True
+        finally:
+            conn.close()
+
+    def _soltar_lease(self, tarea, hasta_proxima):
+        if not tarea.exclusiva or not capacidades['lease_tareas']:
+            return
+        conn = get_db_connection()
+        if not conn:
+            return
+        try:
+            # Un segundo de margen para no pisar el turno siguiente de otro proceso
+            segundos = max(0, int((hasta_proxima - datetime.now()).total_seconds()) - 1)
+            conn.cursor().execute(_SQL_SOLTAR_LEASE, (
+                segundos, tarea.ultima_duracion_ms, (tarea.ultimo_resultado or '')[:500], tarea.nombre, PROCESO
+            ))
+            conn.commit()
+        except Exception as e:
+            print(f"Aviso - No se pudo registrar la ejecución de '{tarea.nombre}': {e}")
+        finally:
+            conn.close()
+
+    def _ejecutar(self, tarea):
+        usar_pool_fondo()
+        try:
+            if not self._tomar_lease(tarea):
+                tarea.omitidas += 1
+                return
+
+            inicio = time.perf_counter()
+            tarea.ultima_ejecucion = datetime.now()
+            try:
+                retorno = tarea.funcion()
+                tarea.ultimo_resultado = 'ok' if retorno is None else f"ok: {retorno}"
+            except Exception as e:
+                tarea.errores += 1
+                tarea.ultimo_resultado = f"error: {e}"
+                print(f"Error en tarea programada '{tarea.nombre}': {e}")
+            tarea.ultima_duracion_ms = int((time.perf_counter() - inicio) * 1000)
+            tarea.ejecuciones += 1
+            self._soltar_lease(tarea, tarea.siguiente(datetime.now()))
+        finally:
+            with self._lock:
+                tarea.proxima = tarea.siguiente(datetime.now())
+                tarea.en_ejecucion = False
+
+    def estadisticas(self):
+        def fecha(valor):
+            return valor.strftime('%Y-%m-%d %H:%M:%S') if valor else None
+
+        with self._lock:
+            tareas = [{
+                'nombre': t.nombre,
+                'programacion': f"cada {t.intervalo} s" if t.intervalo else 'a las ' + ', '.join(h.strftime('%H:%M') for h in t.a_las),
+                'exclusiva': t.exclusiva,
+                'en_ejecucion': t.en_ejecucion,
+                'proxima': fecha(t.proxima),
+                'ultima_ejecucion': fecha(t.ultima_ejecucion),
+                'ultima_duracion_ms': t.ultima_duracion_ms,
+                'ultimo_resultado': t.ultimo_resultado,
+                'ejecuciones': t.ejecuciones,
+                'errores': t.errores,
+                'omitidas_por_lease': t.omitidas
+            } for t in self._tareas.values()]
+        return {
+            'activo': ACTIVO,
+            'proceso': PROCESO,
+            'lease_bd': capacidades['lease_tareas'],
+            'tareas': tareas
+        }
+
+
+planificador = Planificador()
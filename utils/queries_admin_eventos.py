@@ -1,9 +1,13 @@
 import pandas as pd
 import io
+import pyodbc
 from datetime import datetime
-from db import get_db_connection
+from db import get_db_connection, usar_pool_fondo
 from utils.task_manager import update_task_progress, finish_task
 from utils.validaciones import formatear_nombre_estetico
+from utils.padrones_eventos import padrones_eventos
+from utils.queries_eventos import invalidar_agenda_eventos
+from utils.canal_eventos import canal_eventos
 
 def buscar_eventos(query='', page=1, sede_filtro='Todas'):
     items_por_pagina = 10
@@ -25,13 +29,35 @@ def buscar_eventos(query='', page=1, sede_filtro='Todas'):
         total_items = cursor.fetchone()[0]
         total_paginas = (total_items + items_por_pagina - 1) // items_por_pagina
 
-        # Datos
+        # Datos: la página y sus conteos en una sola consulta (agrupados solo
+        # sobre los eventos de la página, no uno por uno). Los IDs de la página
+        # se fijan una vez en @pagina, con EventoID como desempate: así la
+        # página y los conteos ven los mismos eventos aunque varios coincidan
+        # en fecha y hora.
         sql_datos = f"""
-            SELECT EventoID, NombreEvento, FechaEvento, HoraInicio, HoraFin, Lugar, Estado,
-                   PermiteAlumnos, PermiteEgresados, PermitePersonal, PermiteVisitantes, PermiteDocentes, NombreSede
+            SET NOCOUNT ON;
+            DECLARE @pagina TABLE (Orden INT IDENTITY PRIMARY KEY, EventoID INT NOT NULL);
+
+            INSERT INTO @pagina (EventoID)
+            SELECT EventoID
             {sql_base}
-            ORDER BY FechaEvento DESC, HoraInicio DESC
-            OFFSET ? ROWS FETCH NEXT ? ROWS ONLY
+            ORDER BY FechaEvento DESC, HoraInicio DESC, EventoID DESC
+            OFFSET ? ROWS FETCH NEXT ? ROWS ONLY;
+
+            SELECT E.EventoID, E.NombreEvento, E.FechaEvento, E.HoraInicio, E.HoraFin, E.Lugar, E.Estado,
+                   E.PermiteAlumnos, E.PermiteEgresados, E.PermitePersonal, E.PermiteVisitantes, E.PermiteDocentes, E.NombreSede,
+                   ISNULL(A.Total, 0), ISNULL(I.Total, 0)
+            FROM @pagina P
+            JOIN Eventos E ON E.EventoID = P.EventoID
+            LEFT JOIN (
+                SELECT EventoID, COUNT(*) AS Total FROM AsistenciaEventos
+                WHERE EventoID IN (SELECT EventoID FROM @pagina) GROUP BY EventoID
+            ) A ON A.EventoID = P.EventoID
+            LEFT JOIN (
+                SELECT EventoID, COUNT(*) AS Total FROM InvitadosEvento
+                WHERE EventoID IN (SELECT EventoID FROM @pagina) GROUP BY EventoID
+            ) I ON I.EventoID = P.EventoID
+            ORDER BY P.Orden
         """
         params_datos = base_params + [offset, items_por_pagina]
         cursor.execute(sql_datos, tuple(params_datos))
@@ -45,15 +71,10 @@ def buscar_eventos(query='', page=1, sede_filtro='Todas'):
             hora_fin = row[4]
             estado = row[6]
             
-            # Verificar si el evento ya expiró y actualizarlo dinámicamente
-            if estado == 'Activo':
-                fecha_hora_fin = datetime.combine(fecha_evento, hora_fin)
-                if now > fecha_hora_fin:
-                    estado = 'Finalizado'
-                    # Instanciar otro cursor para no interferir con la iteración principal fetchall
-                    cursor_update = conn.cursor()
-                    cursor_update.execute("UPDATE Eventos SET Estado = 'Finalizado' WHERE EventoID = ?", (evento_id,))
-                    cursor_update.commit()
+            # Un evento vencido se muestra finalizado aunque el UPDATE periódico
+            # (finalizar_eventos_vencidos) todavía no lo haya marcado en la BD
+            if estado == 'Activo' and now > datetime.combine(fecha_evento, hora_fin):
+                estado = 'Finalizado'
             
             # Calcular estado display
             estado_display = estado
@@ -64,12 +85,8 @@ def buscar_eventos(query='', page=1, sede_filtro='Todas'):
                 else:
                     estado_display = 'En Curso'
             
-            # Contar asistencia
-            cursor.execute("SELECT COUNT(*) FROM AsistenciaEventos WHERE EventoID = ?", (evento_id,))
-            asistentes = cursor.fetchone()[0]
-            
-            cursor.execute("SELECT COUNT(*) FROM InvitadosEvento WHERE EventoID = ?", (evento_id,))
-            invitados = cursor.fetchone()[0]
+            asistentes = row[13]
+            invitados = row[14]
             
             eventos.append({
                 'id': evento_id,
@@ -104,6 +121,37 @@ def buscar_eventos(query='', page=1, sede_filtro='Todas'):
     finally:
         if 'conn' in locals() and conn: conn.close()
 
+def finalizar_eventos_vencidos():
+    """
+    Marca como 'Finalizado' todos los eventos activos cuya hora de fin ya pasó,
+    en una sola sentencia. Devuelve cuántos eventos cambió (0 si la BD no responde).
+    """
+    conn = get_db_connection()
+    if not conn:
+        return 0
+    try:
+        ahora = datetime.now()
+        cursor = conn.cursor()
+        cursor.execute("""
+            SET NOCOUNT ON;
+            UPDATE Eventos SET Estado = 'Finalizado'
+            WHERE Estado = 'Activo'
+              AND (FechaEvento < CAST(? AS DATE)
+                   OR (FechaEvento = CAST(? AS DATE) AND HoraFin < CAST(? AS TIME)));
+            SELECT @@ROWCOUNT;
+        """, (ahora.date(), ahora.date(), ahora.strftime('%H:%M:%S')))
+        finalizados = cursor.fetchone()[0]
+        conn.commit()
+        if finalizados:
+            invalidar_agenda_eventos()
+            canal_eventos.despertar()
+        return finalizados
+    except Exception as e:
+        print(f"Error finalizando eventos vencidos: {e}")
+        return 0
+    finally:
+        conn.close()
+
 def guardar_evento(data):
     try:
         conn = get_db_connection()
@@ -143,6 +191,11 @@ def guardar_evento(data):
             msg = 'Evento creado correctamente.'
             
         conn.commit()
+        invalidar_agenda_eventos()
+        canal_eventos.despertar()
+        if evento_id:
+            # Reglas u horario pudieron cambiar: el padrón se vuelve a armar al próximo escaneo
+            padrones_eventos.descartar(evento_id)
         return {'status': 'success', 'msg': msg}
     except Exception as e:
         return {'status': 'error', 'msg': str(e)}
@@ -166,13 +219,64 @@ def borrar_evento(evento_id, sede_owner='Todas'):
         cursor.execute("DELETE FROM Eventos WHERE EventoID = ?", (evento_id,))
         
         conn.commit()
+        invalidar_agenda_eventos()
+        canal_eventos.despertar()
+        padrones_eventos.descartar(evento_id)
         return {'status': 'success', 'msg': 'Evento eliminado.'}
     except Exception as e:
         return {'status': 'error', 'msg': str(e)}
     finally:
         if 'conn' in locals() and conn: conn.close()
 
+# Carga masiva de invitados: las filas ya validadas van a una tabla temporal
+# con fast_executemany y pasan a InvitadosEvento con un solo INSERT...SELECT
+LOTE_CARGA_INVITADOS = 2000
+
+_SQL_CREAR_CARGA_INVITADOS = """
+IF OBJECT_ID('tempdb..#InvitadosCarga') IS NOT NULL DROP TABLE #InvitadosCarga;
+CREATE TABLE #InvitadosCarga (
+    Fila INT NOT NULL,
+    DNI NVARCHAR(20) NOT NULL,
+    NombreCompleto NVARCHAR(300) NOT NULL,
+    Institucion NVARCHAR(300) NOT NULL,
+    Existente BIT NOT NULL DEFAULT 0
+);
+"""
+
+_SQL_FUSIONAR_INVITADOS = """
+SET NOCOUNT ON;
+DECLARE @evento INT = ?;
+
+-- Los (DNI, EventoID) que ya existen se marcan y se reportan; el bloqueo
+-- evita que otra importación simultánea inserte los mismos entre medio
+UPDATE C SET Existente = 1
+FROM #InvitadosCarga C
+WHERE EXISTS (SELECT 1 FROM InvitadosEvento I WITH (UPDLOCK, HOLDLOCK)
+              WHERE I.DNI = C.DNI AND I.EventoID = @evento);
+
+INSERT INTO InvitadosEvento (DNI, NombreCompleto, Institucion, EventoID)
+SELECT DNI, NombreCompleto, Institucion, @evento
+FROM #InvitadosCarga
+WHERE Existente = 0;
+
+SELECT Fila, DNI FROM #InvitadosCarga WHERE Existente = 1 ORDER BY Fila;
+"""
+
+def _normalizar_dni_invitado(valor):
+    dni = str(valor).strip()
+    if dni.endswith('.0'): dni = dni[:-2]
+    
+    # Restaurar ceros a la izquierda borrados por Excel numérico
+    if dni.isdigit() and dni != '0' and len(dni) > 0 and len(dni) < 8:
+        dni = dni.zfill(8)
+
+    # Prevenir colisiones de DNIs fantasmas
+    if dni == '0' or dni == '0.0':
+        dni = ''
+    return dni
+
 def procesar_excel_invitados_async(file_bytes, evento_id, task_id):
+    usar_pool_fondo()
     conn = get_db_connection()
     errores = []
     contador = 0
@@ -186,22 +290,13 @@ def procesar_excel_invitados_async(file_bytes, evento_id, task_id):
         total_filas = len(df)
         update_task_progress(task_id, 0, total=total_filas, msg=f"Validando cabeceras y preparando {total_filas} registros...")
         
-        cursor = conn.cursor()
-        
-        # Solo DNI y Nombre son obligatorios
-        for idx, row in df.iterrows():
+        # 1. Validar y normalizar en memoria (solo DNI y Nombre son obligatorios)
+        filas = []
+        vistos = set()
+        for idx, row in enumerate(df.to_dict('records')):
             fila_num = idx + 2
             
-            dni = str(row.get('DNI', '')).strip()
-            if dni.endswith('.0'): dni = dni[:-2]
-            
-            # Restaurar ceros a la izquierda borrados por Excel numérico
-            if dni.isdigit() and dni != '0' and len(dni) > 0 and len(dni) < 8:
-                dni = dni.zfill(8)
-
-            # Prevenir colisiones de DNIs fantasmas
-            if dni == '0' or dni == '0.0':
-                dni = ''
+            dni = _normalizar_dni_invitado(row.get('DNI', ''))
             
             # Buscar variaciones de la columna nombre en mayúsculas
             nombre_raw = str(row.get('NOMBRE COMPLETO', row.get('APELLIDOS Y NOMBRES', row.get('NOMBRES', row.get('APELLIDOS Y NOMBRE', ''))))).strip()
@@ -210,33 +305,53 @@ def procesar_excel_invitados_async(file_bytes, evento_id, task_id):
             
             inst = str(row.get('INSTITUCIÓN', row.get('INSTITUCION', ''))).strip()
             
-            if not dni or len(dni) < 5:
+            if not dni or len(dni) < 5 or len(dni) > 20:
                 errores.append(f"Fila {fila_num}: Falta DNI válido.")
                 continue
                 
             if not nombre:
                 errores.append(f"Fila {fila_num}: Falta nombre válido.")
                 continue
-            
-            # Check si ya está invitado al mismo evento
-            cursor.execute("SELECT InvitadoID FROM InvitadosEvento WHERE DNI = ? AND EventoID = ?", (dni, evento_id))
-            if not cursor.fetchone():
-                cursor.execute("""
-                    INSERT INTO InvitadosEvento (DNI, NombreCompleto, Institucion, EventoID) 
-                    VALUES (?, ?, ?, ?)
-                """, (dni, nombre, inst, evento_id))
-                contador += 1
-                
-                if contador % 500 == 0:
-                    conn.commit()
-            else:
+
+            if dni in vistos:
+                errores.append(f"Fila {fila_num}: DNI {dni} repetido en el archivo.")
+                continue
+            vistos.add(dni)
+            filas.append((fila_num, dni, nombre[:300], inst[:300]))
+
+        # 2. Carga en bloque a la tabla temporal
+        cursor = conn.cursor()
+        cursor.execute(_SQL_CREAR_CARGA_INVITADOS)
+        cursor.fast_executemany = True
+        # Tipos explícitos: el driver no necesita describir la tabla temporal
+        cursor.setinputsizes([
+            (pyodbc.SQL_INTEGER, 0, 0),
+            (pyodbc.SQL_WVARCHAR, 20, 0),
+            (pyodbc.SQL_WVARCHAR, 300, 0),
+            (pyodbc.SQL_WVARCHAR, 300, 0)
+        ])
+        for inicio in range(0, len(filas), LOTE_CARGA_INVITADOS):
+            cursor.executemany(
+                "INSERT INTO #InvitadosCarga (Fila, DNI, NombreCompleto, Institucion) VALUES (?, ?, ?, ?)",
+                filas[inicio:inicio + LOTE_CARGA_INVITADOS]
+            )
+            cargadas = min(inicio + LOTE_CARGA_INVITADOS, len(filas))
+            update_task_progress(task_id, cargadas, total=total_filas, msg=f"Guardando en BD: {cargadas} de {len(filas)} válidos...")
+
+        # 3. Paso a InvitadosEvento omitiendo los ya invitados
+        if filas:
+            update_task_progress(task_id, len(filas), total=total_filas, msg="Registrando invitados en el evento...")
+            cursor = conn.cursor()
+            cursor.execute(_SQL_FUSIONAR_INVITADOS, (evento_id,))
+            duplicados = cursor.fetchall()
+            for fila_num, dni in duplicados:
                 errores.append(f"Fila {fila_num}: DNI {dni} ya registrado para este evento.")
-                
-            if idx % 50 == 0:
-                print(f"-> Procesados {idx} invitados VIP...")
-                update_task_progress(task_id, idx, total=total_filas, msg=f"Guardando en BD: {idx} de {total_filas}...")
+            contador = len(filas) - len(duplicados)
                 
         conn.commit()
+        if contador:
+            # Importación a mitad del evento: los nuevos invitados deben entrar al padrón
+            padrones_eventos.reconstruir(evento_id)
         msg = f'Se agregaron {contador} de {total_filas} invitados VIP con éxito.'
         if errores:
             detalles = "<br> • ".join(errores[:5])
@@ -250,4 +365,11 @@ def procesar_excel_invitados_async(file_bytes, evento_id, task_id):
     except Exception as e:
         finish_task(task_id, success=False, msg=f'Error fatal al procesar Excel VIP: {str(e)}')
     finally:
-        conn.close()
+        if conn:
+            try:
+                # La conexión vuelve al pool: la tabla temporal no debe quedar viva
+                conn.cursor().execute("IF OBJECT_ID('tempdb..#InvitadosCarga') IS NOT NULL DROP TABLE #InvitadosCarga")
+                conn.commit()
+            except Exception:
+                pass
+            conn.close()
@@ -1,82 +1,252 @@
 from db import get_db_connection
+from utils.esquema_bd import capacidades
 
-def obtener_asistentes_evento(evento_id):
+# Filas de AsistenciaEventos que se completan por cada UPDATE del backfill
+LOTE_BACKFILL = 5000
+
+# Esquema original (sin identidad guardada): nombres reales cruzando con todas
+# las tablas según el TipoPersona que guardó el scanner
+_SQL_ASISTENTES_CRUZADO = """
+    SELECT 
+        A.AsistenciaID,
+        A.HoraAsistencia,
+        A.CodigoEscaneado,
+        A.TipoPersona,
+        COALESCE(
+            AL.NombreCompleto,
+            E.NombreCompleto,
+            P.ApellidosNombres,
+            V.NombreCompleto,
+            I.NombreCompleto,
+            D.ApellidosNombres,
+            'Desconocido'
+        ) AS NombreCompleto,
+        COALESCE(
+            ES_AL.NombreEscuela,
+            ES_EG.NombreEscuela,
+            P.Oficina,
+            V.Institucion,
+            I.Institucion,
+            D.Facultad,
+            '--'
+        ) AS Origen
+    FROM AsistenciaEventos A
+    LEFT JOIN Alumnos AL ON (A.CodigoEscaneado = AL.CodigoMatricula OR A.CodigoEscaneado = AL.DNI) AND A.TipoPersona = 'Alumno'
+    LEFT JOIN Escuelas ES_AL ON AL.EscuelaID = ES_AL.EscuelaID
+    LEFT JOIN Egresados E ON A.CodigoEscaneado = E.DNI AND A.TipoPersona = 'Egresado'
+    LEFT JOIN Escuelas ES_EG ON E.EscuelaID = ES_EG.EscuelaID
+    LEFT JOIN PersonalAdministrativo P ON A.CodigoEscaneado = P.DNI AND A.TipoPersona = 'Personal'
+    LEFT JOIN Visitantes V ON A.CodigoEscaneado = V.DNI AND A.TipoPersona = 'Visitante'
+    LEFT JOIN InvitadosEvento I ON A.CodigoEscaneado = I.DNI AND A.TipoPersona = 'InvitadoEvento' AND I.EventoID = A.EventoID
+    LEFT JOIN Docentes D ON A.CodigoEscaneado = D.DNI AND A.TipoPersona = 'Docente'
+    WHERE A.EventoID = ?
+"""
+
+# Con la identidad guardada: una sola tabla, por IX_AsistenciaEventos_Evento_Hora
+_SQL_ASISTENTES = """
+    SELECT AsistenciaID, HoraAsistencia, CodigoEscaneado, TipoPersona,
+           ISNULL(NombrePersona, 'Desconocido') AS NombreCompleto,
+           ISNULL(OrigenPersona, '--') AS Origen
+    FROM AsistenciaEventos
+    WHERE EventoID = ?
+"""
+
+# Tamaño de página del listado de asistentes (y tope para ?limite=)
+PAGINA_ASISTENTES = 100
+MAX_PAGINA_ASISTENTES = 500
+
+# Backfill de la identidad resuelta para asistencias anteriores a esas columnas.
+# Un UPDATE por tipo (y por CodigoMatricula / DNI en alumnos) en vez del OR del
+# detalle, así cada join usa índice. Lo que no se encuentre queda como
+# 'Desconocido', igual que lo mostraba el detalle.
+_SQL_BACKFILL = [
+    """
+    UPDATE TOP (?) A SET PersonaID = AL.AlumnoID, NombrePersona = AL.NombreCompleto, OrigenPersona = ES.NombreEscuela
+    FROM AsistenciaEventos A
+    JOIN Alumnos AL ON AL.CodigoMatricula = A.CodigoEscaneado
+    LEFT JOIN Escuelas ES ON AL.EscuelaID = ES.EscuelaID
+    WHERE A.TipoPersona = 'Alumno' AND A.NombrePersona IS NULL {filtro}
+    """,
+    """
+    UPDATE TOP (?) A SET PersonaID = AL.AlumnoID, NombrePersona = AL.NombreCompleto, OrigenPersona = ES.NombreEscuela
+    FROM AsistenciaEventos A
+    JOIN Alumnos AL ON AL.DNI = A.CodigoEscaneado
+    LEFT JOIN Escuelas ES ON AL.EscuelaID = ES.EscuelaID
+    WHERE A.TipoPersona = 'Alumno' AND A.NombrePersona IS NULL {filtro}
+    """,
+    """
+    UPDATE TOP (?) A SET PersonaID = E.EgresadoID, NombrePersona = E.NombreCompleto, OrigenPersona = ES.NombreEscuela
+    FROM AsistenciaEventos A
+    JOIN Egresados E ON E.DNI = A.CodigoEscaneado
+    LEFT JOIN Escuelas ES ON E.EscuelaID = ES.EscuelaID
+    WHERE A.TipoPersona = 'Egresado' AND A.NombrePersona IS NULL {filtro}
+    """,
+    """
+    UPDATE TOP (?) A SET PersonaID = P.PersonalID, NombrePersona = P.ApellidosNombres, OrigenPersona = P.Oficina
+    FROM AsistenciaEventos A
+    JOIN PersonalAdministrativo P ON P.DNI = A.CodigoEscaneado
+    WHERE A.TipoPersona = 'Personal' AND A.NombrePersona IS NULL {filtro}
+    """,
+    """
+    UPDATE TOP (?) A SET PersonaID = V.VisitanteID, NombrePersona = V.NombreCompleto, OrigenPersona = V.Institucion
+    FROM AsistenciaEventos A
+    JOIN Visitantes V ON V.DNI = A.CodigoEscaneado
+    WHERE A.TipoPersona = 'Visitante' AND A.NombrePersona IS NULL {filtro}
+    """,
+    """
+    UPDATE TOP (?) A SET PersonaID = I.InvitadoID, NombrePersona = I.NombreCompleto, OrigenPersona = I.Institucion
+    FROM AsistenciaEventos A
+    JOIN InvitadosEvento I ON I.DNI = A.CodigoEscaneado AND I.EventoID = A.EventoID
+    WHERE A.TipoPersona = 'InvitadoEvento' AND A.NombrePersona IS NULL {filtro}
+    """,
+    """
+    UPDATE TOP (?) A SET PersonaID = D.DocenteID, NombrePersona = D.ApellidosNombres, OrigenPersona = D.Facultad
+    FROM AsistenciaEventos A
+    JOIN Docentes D ON D.DNI = A.CodigoEscaneado
+    WHERE A.TipoPersona = 'Docente' AND A.NombrePersona IS NULL {filtro}
+    """,
+    """
+    UPDATE TOP (?) A SET NombrePersona = 'Desconocido'
+    FROM AsistenciaEventos A
+    WHERE A.NombrePersona IS NULL {filtro}
+    """,
+]
+
+def completar_identidad_asistencias(evento_id=None):
+    """
+    Completa PersonaID / NombrePersona / OrigenPersona de asistencias antiguas
+    (todas, o solo las de un evento). Por lotes y con commit en cada uno para
+    no bloquear la tabla mientras las terminales registran. Lo corre la tarea
+    programada 'identidad_asistencias'; el detalle del evento solo lee.
+    """
+    if not capacidades['identidad_asistencia']:
+        return 0
+    conn = get_db_connection()
+    if not conn:
+        return 0
+    total = 0
+    try:
+        cursor = conn.cursor()
+        filtro = "AND A.EventoID = ?" if evento_id else ""
+        for plantilla in _SQL_BACKFILL:
+            sql = plantilla.format(filtro=filtro)
+            params = [LOTE_BACKFILL] + ([evento_id] if evento_id else [])
+            while True:
+                cursor.execute(sql, params)
+                filas = cursor.rowcount
+                conn.commit()
+                total += max(filas, 0)
+                if filas < LOTE_BACKFILL:
+                    break
+        if total and not evento_id:
+            print(f"[*] Identidad completada en {total} asistencias a eventos")
+        return total
+    except Exception as e:
+        print(f"Error completando identidad de asistencias: {e}")
+        return total
+    finally:
+        conn.close()
+
+def _fila_asistente(row):
+    return {
+        'id': row[0],
+        'hora': row[1].strftime('%H:%M:%S'),
+        'codigo': row[2],
+        'tipo': row[3],
+        'nombre': row[4],
+        'origen': row[5]
+    }
+
+def obtener_info_evento(evento_id):
+    """Encabezado y estadísticas del evento (el listado se pide por páginas)."""
     try:
         conn = get_db_connection()
         cursor = conn.cursor()
-        
-        # Consultar información del evento para encabezado
-        cursor.execute("SELECT NombreEvento, FechaEvento, HoraInicio, HoraFin FROM Eventos WHERE EventoID = ?", (evento_id,))
+        cursor.execute("""
+            SELECT NombreEvento, FechaEvento, HoraInicio, HoraFin FROM Eventos WHERE EventoID = ?;
+            SELECT TipoPersona, COUNT(*) FROM AsistenciaEventos WHERE EventoID = ? GROUP BY TipoPersona;
+        """, (evento_id, evento_id))
         evento = cursor.fetchone()
         if not evento:
             return {'status': 'error', 'msg': 'Evento no encontrado'}
+        cursor.nextset()
+        stats = {row[0]: row[1] for row in cursor.fetchall()}
 
-        info_evento = {
-            'nombre': evento[0],
-            'fecha': evento[1].strftime('%d/%m/%Y'),
-            'hora': f"{evento[2].strftime('%H:%M')} - {evento[3].strftime('%H:%M')}"
+        return {
+            'status': 'success',
+            'evento': {
+                'nombre': evento[0],
+                'fecha': evento[1].strftime('%d/%m/%Y'),
+                'hora': f"{evento[2].strftime('%H:%M')} - {evento[3].strftime('%H:%M')}"
+            },
+            'stats': stats
         }
-        
-        # Consultar la lista de asistentes cruzando con todas las tablas posibles
-        # Usamos LEFT JOINs para obtener los nombres reales según el TipoPersona que guardó el scanner
-        sql = """
-            SELECT 
-                A.HoraAsistencia,
-                A.CodigoEscaneado,
-                A.TipoPersona,
-                COALESCE(
-                    AL.NombreCompleto,
-                    E.NombreCompleto,
-                    P.ApellidosNombres,
-                    V.NombreCompleto,
-                    I.NombreCompleto,
-                    D.ApellidosNombres,
-                    'Desconocido'
-                ) AS NombreCompleto,
-                COALESCE(
-                    ES_AL.NombreEscuela,
-                    ES_EG.NombreEscuela,
-                    P.Oficina,
-                    V.Institucion,
-                    I.Institucion,
-                    D.Facultad,
-                    '--'
-                ) AS Origen
-            FROM AsistenciaEventos A
-            LEFT JOIN Alumnos AL ON (A.CodigoEscaneado = AL.CodigoMatricula OR A.CodigoEscaneado = AL.DNI) AND A.TipoPersona = 'Alumno'
-            LEFT JOIN Escuelas ES_AL ON AL.EscuelaID = ES_AL.EscuelaID
-            LEFT JOIN Egresados E ON A.CodigoEscaneado = E.DNI AND A.TipoPersona = 'Egresado'
-            LEFT JOIN Escuelas ES_EG ON E.EscuelaID = ES_EG.EscuelaID
-            LEFT JOIN PersonalAdministrativo P ON A.CodigoEscaneado = P.DNI AND A.TipoPersona = 'Personal'
-            LEFT JOIN Visitantes V ON A.CodigoEscaneado = V.DNI AND A.TipoPersona = 'Visitante'
-            LEFT JOIN InvitadosEvento I ON A.CodigoEscaneado = I.DNI AND A.TipoPersona = 'InvitadoEvento' AND I.EventoID = A.EventoID
-            LEFT JOIN Docentes D ON A.CodigoEscaneado = D.DNI AND A.TipoPersona = 'Docente'
-            WHERE A.EventoID = ?
-            ORDER BY A.HoraAsistencia DESC
+    except Exception as e:
+        return {'status': 'error', 'msg': str(e)}
+    finally:
+        if 'conn' in locals() and conn: conn.close()
+
+def listar_asistentes_evento(evento_id, tipo=None, texto='', orden='desc', despues_de=None, desde_id=None, limite=PAGINA_ASISTENTES):
+    """
+    Página de asistentes ordenada por hora (keyset: el cursor es el
+    AsistenciaID de la última fila recibida, nunca OFFSET). Filtra por
+    TipoPersona y por texto (nombre, código u origen).
+    - despues_de: siguiente página a partir de esa fila.
+    - desde_id: solo las asistencias registradas después de esa (refresco en vivo).
+    Las estadísticas por tipo del evento vienen en el mismo lote.
+    """
+    orden = 'ASC' if str(orden).lower() == 'asc' else 'DESC'
+    limite = max(1, min(int(limite or PAGINA_ASISTENTES), MAX_PAGINA_ASISTENTES))
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+
+        fuente = _SQL_ASISTENTES if capacidades['identidad_asistencia'] else _SQL_ASISTENTES_CRUZADO
+
+        condiciones = []
+        params = [evento_id]
+        if tipo:
+            condiciones.append("TipoPersona = ?")
+            params.append(tipo)
+        if texto:
+            condiciones.append("(NombreCompleto LIKE ? OR CodigoEscaneado LIKE ? OR Origen LIKE ?)")
+            params.extend([f'%{texto}%'] * 3)
+        if desde_id:
+            condiciones.append("AsistenciaID > ?")
+            params.append(int(desde_id))
+        if despues_de:
+            # La hora de la fila cursor se lee en la BD: evita comparar DATETIME
+            # contra un valor redondeado en Python
+            op = '>' if orden == 'ASC' else '<'
+            condiciones.append(f"""(HoraAsistencia {op} @hora_cursor
+                 OR (HoraAsistencia = @hora_cursor AND AsistenciaID {op} @id_cursor))""")
+
+        sql = f"""
+            SET NOCOUNT ON;
+            DECLARE @id_cursor INT = ?;
+            DECLARE @hora_cursor DATETIME2 = (SELECT HoraAsistencia FROM AsistenciaEventos WHERE AsistenciaID = @id_cursor);
+
+            SELECT TipoPersona, COUNT(*) FROM AsistenciaEventos WHERE EventoID = ? GROUP BY TipoPersona;
+
+            SELECT TOP ({limite + 1}) AsistenciaID, HoraAsistencia, CodigoEscaneado, TipoPersona, NombreCompleto, Origen
+            FROM ({fuente}) T
+            {('WHERE ' + ' AND '.join(condiciones)) if condiciones else ''}
+            ORDER BY HoraAsistencia {orden}, AsistenciaID {orden};
         """
-        cursor.execute(sql, (evento_id,))
-        
-        asistentes = []
-        for row in cursor.fetchall():
-            asistentes.append({
-                'hora': row[0].strftime('%H:%M:%S'),
-                'codigo': row[1],
-                'tipo': row[2],
-                'nombre': row[3],
-                'origen': row[4]
-            })
-            
-        # Stats agrupadas
-        cursor.execute("SELECT TipoPersona, COUNT(*) FROM AsistenciaEventos WHERE EventoID = ? GROUP BY TipoPersona", (evento_id,))
+        cursor.execute(sql, [int(despues_de) if despues_de else None, evento_id] + params)
         stats = {row[0]: row[1] for row in cursor.fetchall()}
+        cursor.nextset()
+        filas = cursor.fetchall()
 
+        hay_mas = len(filas) > limite
+        asistentes = [_fila_asistente(row) for row in filas[:limite]]
         return {
-            'status': 'success', 
-            'evento': info_evento,
+            'status': 'success',
             'data': asistentes,
-            'stats': stats
+            'siguiente': asistentes[-1]['id'] if hay_mas else None,
+            'stats': stats,
+            'total': sum(stats.values())
         }
-
     except Exception as e:
         return {'status': 'error', 'msg': str(e)}
     finally:
@@ -1,9 +1,14 @@
-from db import get_db_connection
+from db import get_db_connection, usar_pool_fondo
 from datetime import datetime
 from utils.validaciones import verificar_dni_global, formatear_nombre_estetico
 import pandas as pd
 import io
 from utils.task_manager import update_task_progress, finish_task
+from utils.indice_identidades import indice_identidades
+from utils.contadores_salas import contadores_salas
+from utils.cache_manager import escaneos_repetidos
+from utils import resumen_ingresos
+from utils.queries_dashboard import invalidar_cache_dashboard
 import functools
 
 def _get_global_expiration():
@@ -103,6 +108,8 @@ def crear_alumno_individual(data):
             VALUES (?, ?, ?, ?, ?, 1)
         """, (nombre, dni, codigo, escuela, val_fecha))
         conn.commit()
+        conn.close()
+        indice_identidades.refrescar_claves([dni, codigo])
         return True, "Alumno creado correctamente"
     except Exception as e:
         return False, str(e)
@@ -129,6 +136,8 @@ def actualizar_alumno_completo_db(data):
             WHERE AlumnoID = ?
         """, (nombre, dni, codigo, escuela, val_fecha, alumno_id))
         conn.commit()
+        conn.close()
+        indice_identidades.refrescar_entidad('Alumno', [alumno_id])
         return True, "Alumno actualizado correctamente"
     except Exception as e:
         return False, str(e)
@@ -144,6 +153,12 @@ def eliminar_alumno_individual(alumno_id):
         cursor.execute("DELETE FROM RegistroIngresos WHERE AlumnoID = ?", (alumno_id,))
         cursor.execute("DELETE FROM Alumnos WHERE AlumnoID = ?", (alumno_id,))
         conn.commit()
+        conn.close()
+        indice_identidades.refrescar_entidad('Alumno', [alumno_id])
+        contadores_salas.reiniciar()
+        escaneos_repetidos.clear()
+        resumen_ingresos.marcar_para_reconstruir()
+        invalidar_cache_dashboard()
         return True, "Alumno eliminado correctamente"
     except Exception as e:
         return False, str(e)
@@ -165,6 +180,12 @@ def eliminar_alumnos_masivo_db(ids):
         sql = f"DELETE FROM Alumnos WHERE AlumnoID IN ({placeholders})"
         cursor.execute(sql, ids)
         conn.commit()
+        conn.close()
+        indice_identidades.refrescar_entidad('Alumno', ids)
+        contadores_salas.reiniciar()
+        escaneos_repetidos.clear()
+        resumen_ingresos.marcar_para_reconstruir()
+        invalidar_cache_dashboard()
         return True, "Alumnos eliminados correctamente"
     except Exception as e:
         return False, str(e)
@@ -179,6 +200,12 @@ def vaciar_alumnos_db():
         cursor.execute("DELETE FROM RegistroIngresos WHERE AlumnoID IS NOT NULL")
         cursor.execute("DELETE FROM Alumnos")
         conn.commit()
+        conn.close()
+        indice_identidades.recargar_async()
+        contadores_salas.reiniciar()
+        escaneos_repetidos.clear()
+        resumen_ingresos.marcar_para_reconstruir()
+        invalidar_cache_dashboard()
         return True, "Base de datos de alumnos truncada/vaciada exitosamente."
     except Exception as e:
         return False, str(e)
@@ -208,6 +235,8 @@ def actualizar_vencimiento_masivo(ids, accion):
         params = [fecha_val] + ids
         cursor.execute(sql, params)
         conn.commit()
+        conn.close()
+        indice_identidades.refrescar_entidad('Alumno', ids)
         return True, f"Se actualizaron {len(ids)} carnets."
     except Exception as e:
         return False, str(e)
@@ -234,6 +263,8 @@ def actualizar_vencimiento_global(accion):
         sql = "UPDATE Alumnos SET FechaVencimientoCarnet = ?"
         cursor.execute(sql, (fecha_val,))
         conn.commit()
+        conn.close()
+        indice_identidades.recargar_async()
         return True, "Se actualizó el estado de todos los alumnos en la base de datos."
     except Exception as e:
         return False, str(e)
@@ -241,6 +272,7 @@ def actualizar_vencimiento_global(accion):
         conn.close()
 
 def procesar_excel_alumnos_async(file_bytes, task_id):
+    usar_pool_fondo()
     buscar_alumnos_paginados.cache_clear()
     conn = get_db_connection()
     contador = 0
@@ -365,6 +397,8 @@ def procesar_excel_alumnos_async(file_bytes, task_id):
                 update_task_progress(task_id, index, total=total_filas, msg=f"Guardando en BD: {index} de {total_filas}...")
                 
         conn.commit()
+        conn.close()
+        indice_identidades.recargar()
         
         msg = f'Procesados {contador} de {total_filas} alumnos con éxito.'
         if errores:
@@ -1,124 +1,261 @@
+import os
+import time
+import threading
+from datetime import datetime
 from db import get_db_connection
+from utils.cache_manager import ExpiringCache
+from utils.filtros_fecha import filtro_ingresos, filtro_sede, rango_dias, ATRASO_MAX_INGRESO
+from utils.resumen_ingresos import cubre_rango, origen_resumen
+from utils.origenes_persona import persona_de_ingreso
+
+# Totales, conteo por tipo, pisos y sedes, salas de Central e histograma por
+# hora salen de un solo recorrido del rango filtrado: cada conjunto de
+# GROUPING SETS es uno de los antiguos COUNT/GROUP BY. La columna Conjunto
+# indica a cuál pertenece cada fila. {fuente} entrega (TipoUsuario, Piso,
+# Sede, SalaID, Hora, Cantidad): ingresos crudos (Cantidad 1) y/o filas de
+# ResumenIngresosHora.
+_SQL_AGREGADO = """
+    SELECT
+        CASE
+            WHEN GROUPING(TipoUsuario) = 0 THEN 'tipo'
+            WHEN GROUPING(EsCentral) = 0 THEN 'piso'
+            WHEN GROUPING(Sede) = 0 THEN 'sede'
+            WHEN GROUPING(NombreSala) = 0 THEN 'sala'
+            WHEN GROUPING(Hora) = 0 THEN 'hora'
+            ELSE 'total'
+        END AS Conjunto,
+        TipoUsuario, EsCentral, Piso, Sede, SedeSala, PisoSala, NombreSala, Hora,
+        SUM(Cantidad) AS Cantidad
+    FROM (
+        SELECT
+            X.TipoUsuario, X.Piso, X.Sede,
+            CASE WHEN X.Sede = 'Central' OR X.Sede IS NULL THEN 1 ELSE 0 END AS EsCentral,
+            S.Sede AS SedeSala, S.Piso AS PisoSala, S.NombreSala,
+            X.Hora, X.Cantidad
+        FROM ({fuente}) X
+        LEFT JOIN {salas} S ON X.SalaID = S.SalaID
+    ) T
+    GROUP BY GROUPING SETS (
+        (),
+        (TipoUsuario),
+        (EsCentral, Piso),
+        (Sede),
+        (SedeSala, PisoSala, NombreSala),
+        (Hora)
+    )
+"""
+
+_FUENTE_CRUDA = """
+    SELECT R.TipoUsuario, R.Piso, R.Sede, R.SalaID, DATEPART(HOUR, R.FechaHora) AS Hora, 1 AS Cantidad
+    FROM {ingresos} R WHERE {where}
+"""
+
+# Las claves vacías del resumen (-1, 0, '') vuelven a NULL como en la tabla cruda
+_FUENTE_RESUMEN = """
+    SELECT NULLIF(H.TipoUsuario, '') AS TipoUsuario, NULLIF(H.Piso, -1) AS Piso, H.Sede,
+           NULLIF(H.SalaID, 0) AS SalaID, DATEPART(HOUR, H.Hora) AS Hora, H.Cantidad
+    FROM ResumenIngresosHora H WHERE {where}
+"""
+
+# Orígenes de los ingresos crudos que cumplen {where} (alias R): un solo
+# recorrido de RegistroIngresos, con la persona resuelta por persona_de_ingreso.
+# El origen se recorta igual que en ResumenIngresosHora, así el top agrupa lo
+# mismo con o sin resumen.
+_SQL_ORIGENES_CRUDOS = """
+    SELECT {origen} AS Origen FROM RegistroIngresos R{joins}
+    WHERE {where} AND {encontrada} AND {origen} <> ''
+"""
+
+def _sql_origenes_crudos(where):
+    joins, columnas = persona_de_ingreso('R')
+    return _SQL_ORIGENES_CRUDOS.format(origen=origen_resumen(columnas['origen']), joins=joins, where=where,
+                                       encontrada=columnas['encontrada'])
+
+# TipoUsuario -> clave del diccionario del dashboard
+_TOTALES_POR_TIPO = {
+    'Alumno': 'total_alumnos',
+    'Visitante': 'total_visitantes',
+    'Egresado': 'total_egresados',
+    'Administrativo': 'total_personal',
+    'Docente': 'total_docentes'
+}
+
+def _repartir_agregado(filas):
+    """Separa las filas de _SQL_AGREGADO en las claves que usan la plantilla y el SSE."""
+    datos = {'total_hoy': 0, 'pisos': {}, 'salas': {}, 'sedes': {}}
+    for clave in _TOTALES_POR_TIPO.values():
+        datos[clave] = 0
+    horas = []
+
+    for conjunto, tipo, es_central, piso, sede, sede_sala, piso_sala, nombre_sala, hora, cantidad in filas:
+        if conjunto == 'total':
+            datos['total_hoy'] = cantidad
+        elif conjunto == 'tipo':
+            if tipo in _TOTALES_POR_TIPO:
+                datos[_TOTALES_POR_TIPO[tipo]] = cantidad
+        elif conjunto == 'piso':
+            if es_central == 1:
+                datos['pisos'][piso] = cantidad
+        elif conjunto == 'sede':
+            if sede is not None and sede != 'Central':
+                datos['sedes'][sede] = cantidad
+        elif conjunto == 'sala':
+            if sede_sala == 'Central':
+                datos['salas'].setdefault(str(piso_sala), {})[nombre_sala] = cantidad
+        elif conjunto == 'hora':
+            horas.append((hora, cantidad))
+
+    horas.sort()
+    datos['chart_horas_labels'] = [f"{hora}:00" for hora, _ in horas]
+    datos['chart_horas_values'] = [cantidad for _, cantidad in horas]
+    return datos
+
+# ============================================================
+# CACHÉ DE RESULTADOS DEL DASHBOARD
+# ============================================================
+# Clave: (inicio, fin, hora_inicio, hora_fin, sede). Los rangos que terminaron
+# hace más de ATRASO_MAX_INGRESO casi no cambian y se guardan mucho tiempo;
+# los demás (hoy, y ayer hasta el mediodía, que aún pueden recibir ingresos
+# tardíos del write-behind) viven pocos segundos y, al vencer, una sola
+# petición recalcula mientras las concurrentes esperan ese mismo resultado.
+# Borrar ingresos (eliminar_*/vaciar_*) o escribir ingresos más antiguos que
+# esa ventana (recuperación del journal del write-behind) vacía la caché.
+CACHE_TTL_HOY = float(os.getenv('DASHBOARD_CACHE_TTL_HOY', 5))
+CACHE_TTL_HISTORICO = float(os.getenv('DASHBOARD_CACHE_TTL_HISTORICO', 3600))
+
+_dashboard_cache = ExpiringCache(max_items=500)
+_vuelos = {}
+_vuelos_lock = threading.Lock()
+# Sube con cada invalidación: un cálculo iniciado antes no se guarda
+_generacion = 0
+_compartidos = 0
+
+def invalidar_cache_dashboard():
+    global _generacion
+    with _vuelos_lock:
+        _generacion += 1
+    _dashboard_cache.clear()
+
+def estadisticas_cache_dashboard():
+    stats = _dashboard_cache.stats()
+    stats['calculos_compartidos'] = _compartidos
+    stats['en_calculo'] = len(_vuelos)
+    return stats
 
 def obtener_datos_dashboard(f_inicio, f_fin, sede_filtro=None, hora_inicio=None, hora_fin=None):
+    global _compartidos
+    clave = (f_inicio or None, f_fin or None, hora_inicio or None, hora_fin or None, sede_filtro or None)
+    datos = _dashboard_cache.get(clave)
+    if datos is not None:
+        return datos
+
+    with _vuelos_lock:
+        vuelo = _vuelos.get(clave)
+        lider = vuelo is None
+        if lider:
+            # [terminado, resultado]
+            vuelo = _vuelos[clave] = [threading.Event(), None]
+        else:
+            _compartidos += 1
+        generacion = _generacion
+
+    if not lider:
+        vuelo[0].wait(timeout=60)
+        if vuelo[1] is not None:
+            return vuelo[1]
+        # El cálculo compartido falló: se intenta por cuenta propia
+        return _calcular_datos_dashboard(f_inicio, f_fin, sede_filtro, hora_inicio, hora_fin)
+
+    try:
+        datos = _calcular_datos_dashboard(f_inicio, f_fin, sede_filtro, hora_inicio, hora_fin)
+        if datos:
+            vuelo[1] = datos
+            _, hasta = rango_dias(f_inicio, f_fin)
+            cerrado = hasta <= datetime.now() - ATRASO_MAX_INGRESO
+            ttl = CACHE_TTL_HISTORICO if cerrado else CACHE_TTL_HOY
+            with _vuelos_lock:
+                if generacion == _generacion:
+                    _dashboard_cache.set(clave, datos, time.time() + ttl)
+        return datos
+    finally:
+        with _vuelos_lock:
+            _vuelos.pop(clave, None)
+        vuelo[0].set()
+
+def _calcular_datos_dashboard(f_inicio, f_fin, sede_filtro=None, hora_inicio=None, hora_fin=None):
     conn = get_db_connection()
     if not conn: return {}
     cursor = conn.cursor()
 
     if f_inicio and f_fin:
-        date_where = "CAST(FechaHora AS DATE) >= ? AND CAST(FechaHora AS DATE) <= ?"
-        base_params = [f_inicio, f_fin]
         filtro_label = f"Desde {f_inicio} hasta {f_fin}"
     else:
-        date_where = "CAST(FechaHora AS DATE) = CAST(GETDATE() AS DATE)"
-        base_params = []
         filtro_label = "Datos de Hoy"
 
     if hora_inicio and hora_fin:
-        date_where += " AND CAST(FechaHora AS TIME) >= ? AND CAST(FechaHora AS TIME) <= ?"
-        base_params.extend([hora_inicio, hora_fin])
         filtro_label += f" ({hora_inicio} - {hora_fin})"
 
-    date_where_g = date_where
-    date_where_r = date_where
-    params_g = list(base_params)
-    params_r = list(base_params)
-
-    if sede_filtro and sede_filtro != 'Todas':
-        if sede_filtro == 'Central':
-            date_where_g += " AND ISNULL(Sede, 'Central') = 'Central'"
-            date_where_r += " AND ISNULL(R.Sede, 'Central') = 'Central'"
-        else:
-            date_where_g += " AND ISNULL(Sede, 'Central') = ?"
-            date_where_r += " AND ISNULL(R.Sede, 'Central') = ?"
-            params_g.append(sede_filtro)
-            params_r.append(sede_filtro)
-
-    params_g = tuple(params_g)
+    date_where_r, params_r = filtro_ingresos(f_inicio, f_fin, sede_filtro, hora_inicio, hora_fin, alias='R')
     params_r = tuple(params_r)
 
-    # 1. Totales
-    cursor.execute(f"SELECT COUNT(*) FROM RegistroIngresos WHERE {date_where_g}", params_g)
-    total_hoy = cursor.fetchone()[0]
-    
-    cursor.execute(f"SELECT COUNT(*) FROM RegistroIngresos WHERE TipoUsuario = 'Alumno' AND {date_where_g}", params_g)
-    total_alumnos = cursor.fetchone()[0]
-
-    cursor.execute(f"SELECT COUNT(*) FROM RegistroIngresos WHERE TipoUsuario = 'Visitante' AND {date_where_g}", params_g)
-    total_visitantes = cursor.fetchone()[0]
-
-    cursor.execute(f"SELECT COUNT(*) FROM RegistroIngresos WHERE TipoUsuario = 'Egresado' AND {date_where_g}", params_g)
-    total_egresados = cursor.fetchone()[0]
-
-    cursor.execute(f"SELECT COUNT(*) FROM RegistroIngresos WHERE TipoUsuario = 'Administrativo' AND {date_where_g}", params_g)
-    total_personal = cursor.fetchone()[0]
-
-    cursor.execute(f"SELECT COUNT(*) FROM RegistroIngresos WHERE TipoUsuario = 'Docente' AND {date_where_g}", params_g)
-    total_docentes = cursor.fetchone()[0]
-
-    # 2. Por Piso y Sede
-    cursor.execute(f"SELECT Piso, COUNT(*) FROM RegistroIngresos WHERE ISNULL(Sede, 'Central')='Central' AND {date_where_g} GROUP BY Piso", params_g)
-    pisos_dict = {row[0]: row[1] for row in cursor.fetchall()}
-
-    # 2.5 Por Salas Físicas (Central)
-    cursor.execute(f"""
-        SELECT S.Piso, S.NombreSala, COUNT(R.RegistroID) 
-        FROM RegistroIngresos R
-        JOIN Salas S ON R.SalaID = S.SalaID
-        WHERE S.Sede = 'Central' AND {date_where_r}
-        GROUP BY S.Piso, S.NombreSala
-    """, params_r)
-    salas_db = cursor.fetchall()
-    salas_dict = {}
-    for piso, nombre_sala, cant in salas_db:
-        if str(piso) not in salas_dict: salas_dict[str(piso)] = {}
-        salas_dict[str(piso)][nombre_sala] = cant
+    # Las horas ya cerradas salen de ResumenIngresosHora si está al día para el
+    # rango (sin franja horaria: el resumen no tiene minutos); la hora en curso
+    # siempre se lee cruda.
+    desde, hasta = rango_dias(f_inicio, f_fin)
+    corte = datetime.now().replace(minute=0, second=0, microsecond=0)
+    fin_resumen = min(hasta, corte)
+    usar_resumen = not (hora_inicio and hora_fin) and cubre_rango(cursor, desde, fin_resumen)
+
+    if usar_resumen:
+        sql_sede_h, params_sede_h = filtro_sede(sede_filtro, 'H')
+        sql_sede_r, params_sede_r = filtro_sede(sede_filtro, 'R')
+        where_h = "H.Hora >= ? AND H.Hora < ?" + (f" AND {sql_sede_h}" if sql_sede_h else '')
+        params_h = (desde, fin_resumen, *params_sede_h)
+        if hasta > corte:
+            where_cola = "R.FechaHora >= ? AND R.FechaHora < ?" + (f" AND {sql_sede_r}" if sql_sede_r else '')
+            params_cola = (corte, hasta, *params_sede_r)
+        else:
+            where_cola, params_cola = "1 = 0", ()
 
-    cursor.execute(f"SELECT Sede, COUNT(*) FROM RegistroIngresos WHERE ISNULL(Sede, 'Central')!='Central' AND {date_where_g} GROUP BY Sede", params_g)
-    sedes_dict = {row[0]: row[1] for row in cursor.fetchall()}
+        fuente = (_FUENTE_RESUMEN.format(where=where_h) + " UNION ALL " +
+                  _FUENTE_CRUDA.format(ingresos='RegistroIngresos', where=where_cola))
+        params_agregado = params_h + params_cola
+    else:
+        fuente = _FUENTE_CRUDA.format(ingresos='RegistroIngresos', where=date_where_r)
+        params_agregado = params_r
 
-    # 3. Gráfico Horas
-    cursor.execute(f"""
-        SELECT DATEPART(HOUR, FechaHora) as Hora, COUNT(*) 
-        FROM RegistroIngresos WHERE {date_where_g} 
-        GROUP BY DATEPART(HOUR, FechaHora) ORDER BY Hora
-    """, params_g)
-    datos_horas = cursor.fetchall()
-    chart_horas_labels = [f"{row[0]}:00" for row in datos_horas]
-    chart_horas_values = [row[1] for row in datos_horas]
+    # 1-3. Totales, pisos, sedes, salas y gráfico de horas en un solo recorrido
+    cursor.execute(_SQL_AGREGADO.format(fuente=fuente, salas='Salas'), params_agregado)
+    agregado = _repartir_agregado(cursor.fetchall())
 
     # 4. Top Orígenes (Unificado) - usa alias R
-    # Multiplicamos los params_r por 5 (incluye Docentes)
-    params_origenes = params_r * 5
-    cursor.execute(f"""
-        SELECT TOP 5 Origen, COUNT(*) as Cantidad FROM (
-            SELECT A.Escuela as Origen FROM RegistroIngresos R JOIN Alumnos A ON R.AlumnoID = A.AlumnoID 
-            WHERE {date_where_r}
-            UNION ALL
-            SELECT V.Institucion as Origen FROM RegistroIngresos R JOIN Visitantes V ON R.VisitanteID = V.VisitanteID 
-            WHERE {date_where_r}
-            UNION ALL
-            SELECT E.EscuelaProfesional as Origen FROM RegistroIngresos R JOIN Egresados E ON R.EgresadoID = E.EgresadoID 
-            WHERE {date_where_r}
-            UNION ALL
-            SELECT P.Oficina as Origen FROM RegistroIngresos R JOIN PersonalAdministrativo P ON R.PersonalID = P.PersonalID
-            WHERE {date_where_r}
-            UNION ALL
-            SELECT D.Facultad as Origen FROM RegistroIngresos R JOIN Docentes D ON R.DocenteID = D.DocenteID
-            WHERE {date_where_r}
-        ) as T GROUP BY Origen ORDER BY Cantidad DESC
-    """, params_origenes)
+    if usar_resumen:
+        cursor.execute(f"""
+            SELECT TOP 5 Origen, SUM(Cantidad) as Cantidad FROM (
+                SELECT H.Origen, H.Cantidad FROM ResumenIngresosHora H
+                WHERE {where_h} AND H.Origen <> ''
+                UNION ALL
+                SELECT Origen, 1 FROM ({_sql_origenes_crudos(where_cola)}) as C
+            ) as T GROUP BY Origen ORDER BY Cantidad DESC
+        """, params_h + params_cola)
+    else:
+        cursor.execute(f"""
+            SELECT TOP 5 Origen, COUNT(*) as Cantidad FROM (
+                {_sql_origenes_crudos(date_where_r)}
+            ) as T GROUP BY Origen ORDER BY Cantidad DESC
+        """, params_r)
     datos_escuelas = cursor.fetchall()
     chart_escuelas_labels = [row[0] for row in datos_escuelas]
     chart_escuelas_values = [row[1] for row in datos_escuelas]
 
     # 5. Tabla Últimos - usa alias R
+    joins_persona, persona = persona_de_ingreso('R')
     cursor.execute(f"""
         SELECT TOP 10 
-            COALESCE(A.NombreCompleto, V.NombreCompleto, E.NombreCompleto, P.ApellidosNombres, D.ApellidosNombres), 
+            {persona['nombre']}, 
             R.Piso, 
             FORMAT(R.FechaHora, 'HH:mm:ss'), 
-            COALESCE(A.Escuela, V.Institucion, E.EscuelaProfesional, P.Oficina, 'Escuela de ' + D.Facultad), 
+            {persona['origen_reporte']}, 
             CASE 
                 WHEN R.VisitanteID IS NOT NULL THEN 'Visitante' 
                 WHEN R.EgresadoID IS NOT NULL THEN 'Egresado'
@@ -129,12 +266,7 @@ def obtener_datos_dashboard(f_inicio, f_fin, sede_filtro=None, hora_inicio=None,
             FORMAT(R.FechaHora, 'dd/MM/yyyy'),
             ISNULL(R.Sede, 'Central'),
             S.NombreSala
-        FROM RegistroIngresos R
-        LEFT JOIN Alumnos A ON R.AlumnoID = A.AlumnoID
-        LEFT JOIN Visitantes V ON R.VisitanteID = V.VisitanteID
-        LEFT JOIN Egresados E ON R.EgresadoID = E.EgresadoID
-        LEFT JOIN PersonalAdministrativo P ON R.PersonalID = P.PersonalID
-        LEFT JOIN Docentes D ON R.DocenteID = D.DocenteID
+        FROM RegistroIngresos R{joins_persona}
         LEFT JOIN Salas S ON R.SalaID = S.SalaID
         WHERE {date_where_r}
         ORDER BY R.FechaHora DESC
@@ -157,17 +289,7 @@ def obtener_datos_dashboard(f_inicio, f_fin, sede_filtro=None, hora_inicio=None,
     conn.close()
 
     return {
-        'total_hoy': total_hoy,
-        'total_alumnos': total_alumnos,
-        'total_visitantes': total_visitantes,
-        'total_egresados': total_egresados,
-        'total_personal': total_personal,
-        'total_docentes': total_docentes,
-        'pisos': pisos_dict,
-        'salas': salas_dict,
-        'sedes': sedes_dict,
-        'chart_horas_labels': chart_horas_labels,
-        'chart_horas_values': chart_horas_values,
+        **agregado,
         'chart_escuelas_labels': chart_escuelas_labels,
         'chart_escuelas_values': chart_escuelas_values,
         'ultimos': ultimos,
@@ -183,52 +305,19 @@ def obtener_registros_csv(f_inicio, f_fin, sede_filtro=None, hora_inicio=None, h
     try:
         cursor = conn.cursor()
 
-        base_params = []
-
-        if f_inicio and f_fin:
-            date_where = "CAST(R.FechaHora AS DATE) >= ? AND CAST(R.FechaHora AS DATE) <= ?"
-            base_params = [f_inicio, f_fin]
-        else:
-            date_where = "CAST(R.FechaHora AS DATE) = CAST(GETDATE() AS DATE)"
-
-        if hora_inicio and hora_fin:
-            date_where += " AND CAST(R.FechaHora AS TIME) >= ? AND CAST(R.FechaHora AS TIME) <= ?"
-            base_params.extend([hora_inicio, hora_fin])
+        date_where, base_params = filtro_ingresos(f_inicio, f_fin, sede_filtro, hora_inicio, hora_fin, alias='R')
 
-        if sede_filtro and sede_filtro != 'Todas':
-            if sede_filtro == 'Central':
-                date_where += " AND ISNULL(R.Sede, 'Central') = 'Central'"
-            else:
-                date_where += " AND ISNULL(R.Sede, 'Central') = ?"
-                base_params.append(sede_filtro)
+        joins_persona, persona = persona_de_ingreso('R')
 
         sql = f"""
             SELECT 
                 R.RegistroID AS ID,
 
-                COALESCE(
-                    A.NombreCompleto,
-                    V.NombreCompleto,
-                    E.NombreCompleto,
-                    P.ApellidosNombres,
-                    D.ApellidosNombres,
-                    'Sin nombre'
-                ) AS Usuario,
+                ISNULL({persona['nombre']}, 'Sin nombre') AS Usuario,
 
-                COALESCE(
-                    A.DNI,
-                    V.DNI,
-                    E.DNI,
-                    P.DNI,
-                    D.DNI,
-                    ''
-                ) AS DNI,
+                ISNULL({persona['dni']}, '') AS DNI,
 
-                COALESCE(
-                    A.CodigoMatricula,
-                    E.CodigoMatricula,
-                    ''
-                ) AS CodigoMatricula,
+                ISNULL({persona['codigo']}, '') AS CodigoMatricula,
 
                 COALESCE(
                     NULLIF(R.TipoUsuario, ''),
@@ -254,30 +343,11 @@ def obtener_registros_csv(f_inicio, f_fin, sede_filtro=None, hora_inicio=None, h
 
                 FORMAT(R.FechaHora, 'HH:mm:ss') AS Hora,
 
-                COALESCE(
-                    A.Facultad,
-                    E.Facultad,
-                    D.Facultad,
-                    P.Oficina,
-                    V.Institucion,
-                    ''
-                ) AS FacultadArea,
+                ISNULL({persona['facultad']}, '') AS FacultadArea,
 
-                COALESCE(
-                    A.Escuela,
-                    E.EscuelaProfesional,
-                    V.Institucion,
-                    P.Oficina,
-                    D.Facultad,
-                    ''
-                ) AS Origen
-
-            FROM RegistroIngresos R
-            LEFT JOIN Alumnos A ON R.AlumnoID = A.AlumnoID
-            LEFT JOIN Visitantes V ON R.VisitanteID = V.VisitanteID
-            LEFT JOIN Egresados E ON R.EgresadoID = E.EgresadoID
-            LEFT JOIN PersonalAdministrativo P ON R.PersonalID = P.PersonalID
-            LEFT JOIN Docentes D ON R.DocenteID = D.DocenteID
+                ISNULL({persona['origen']}, '') AS Origen
+
+            FROM RegistroIngresos R{joins_persona}
             LEFT JOIN Salas S ON R.SalaID = S.SalaID
             WHERE {date_where}
             ORDER BY R.FechaHora DESC
@@ -1,8 +1,13 @@
 import pandas as pd
 import io
-from db import get_db_connection
+from db import get_db_connection, usar_pool_fondo
 from utils.validaciones import verificar_dni_global, formatear_nombre_estetico
 from utils.task_manager import update_task_progress, finish_task
+from utils.indice_identidades import indice_identidades
+from utils.contadores_salas import contadores_salas
+from utils.cache_manager import escaneos_repetidos
+from utils import resumen_ingresos
+from utils.queries_dashboard import invalidar_cache_dashboard
 
 def buscar_docentes(query, page, limit=20):
     offset = (page - 1) * limit
@@ -91,6 +96,11 @@ def guardar_docentes(data):
             """, (nombre, dni, facultad, correo_personal, correo_inst, telefono))
             
         conn.commit()
+        conn.close()
+        if docente_id:
+            indice_identidades.refrescar_entidad('Docente', [docente_id])
+        else:
+            indice_identidades.refrescar_claves([dni])
         return {'status': 'success', 'msg': 'Docente guardado correctamente'}
     except Exception as e:
         return {'status': 'error', 'msg': str(e)}
@@ -108,6 +118,12 @@ def borrar_docentes(id_doc):
         cursor.execute("DELETE FROM Docentes WHERE DocenteID = ?", (id_doc,))
         
         conn.commit()
+        conn.close()
+        indice_identidades.refrescar_entidad('Docente', [id_doc])
+        contadores_salas.reiniciar()
+        escaneos_repetidos.clear()
+        resumen_ingresos.marcar_para_reconstruir()
+        invalidar_cache_dashboard()
         return {'status': 'success', 'msg': 'Docente eliminado permanentemente.'}
     except Exception as e:
         return {'status': 'error', 'msg': f"No se pudo eliminar: {str(e)}"}
@@ -115,6 +131,7 @@ def borrar_docentes(id_doc):
         if 'conn' in locals(): conn.close()
 
 def procesar_excel_docentes_async(file_bytes, task_id):
+    usar_pool_fondo()
     conn = get_db_connection()
     errores = []
     contador = 0
@@ -189,6 +206,8 @@ def procesar_excel_docentes_async(file_bytes, task_id):
                 update_task_progress(task_id, idx, total=total_filas, msg=f"Guardando en BD: {idx} de {total_filas}...")
             
         conn.commit()
+        conn.close()
+        indice_identidades.recargar()
         msg = f'Procesados {contador} de {total_filas} registros de docentes con éxito.'
         if errores:
             detalles = "<br> • ".join(errores[:5])
@@ -219,6 +238,12 @@ def eliminar_docentes_masivo(ids):
         cursor.execute(f"DELETE FROM Docentes WHERE DocenteID IN ({placeholders})", ids)
         
         conn.commit()
+        conn.close()
+        indice_identidades.refrescar_entidad('Docente', ids)
+        contadores_salas.reiniciar()
+        escaneos_repetidos.clear()
+        resumen_ingresos.marcar_para_reconstruir()
+        invalidar_cache_dashboard()
         return {'status': 'success', 'msg': f"{len(ids)} registros eliminados exitosamente."}
     except Exception as e:
         return {'status': 'error', 'msg': f"Error al eliminar en bloque: {str(e)}"}
@@ -241,6 +266,12 @@ def vaciar_docentes_db():
         cursor.execute("DBCC CHECKIDENT ('Docentes', RESEED, 0)")
         
         conn.commit()
+        conn.close()
+        indice_identidades.recargar_async()
+        contadores_salas.reiniciar()
+        escaneos_repetidos.clear()
+        resumen_ingresos.marcar_para_reconstruir()
+        invalidar_cache_dashboard()
         return {'status': 'success', 'msg': "La tabla de Docentes ha sido VACIADA permanentemente."}
     except Exception as e:
         return {'status': 'error', 'msg': f"Error crítico al vaciar tabla: {str(e)}"}
@@ -1,8 +1,13 @@
-from db import get_db_connection
+from db import get_db_connection, usar_pool_fondo
 from utils.validaciones import verificar_dni_global, formatear_nombre_estetico
 import pandas as pd
 import io
 from utils.task_manager import update_task_progress, finish_task
+from utils.indice_identidades import indice_identidades
+from utils.contadores_salas import contadores_salas
+from utils.cache_manager import escaneos_repetidos
+from utils import resumen_ingresos
+from utils.queries_dashboard import invalidar_cache_dashboard
 import functools
 
 @functools.lru_cache(maxsize=128)
@@ -76,7 +81,7 @@ def guardar_egresado_individual(data):
         cursor = conn.cursor()
         
         # --- VALIDACIÓN GLOBAL DE DNI ---
-        err_bool, err_msg = verificar_dni_global(dni, ignora_tabla='Egresados', ignora_id=egresado_id)
+        err_bool, err_msg = verificar_dni_global(dni, ignora_tabla='Egresados', ignora_id=egresado_id, cursor=cursor)
         if err_bool:
             conn.close()
             return False, err_msg
@@ -95,6 +100,11 @@ def guardar_egresado_individual(data):
             """, (nombre, dni, codigo, facultad, escuela, correo_personal, correo_inst, celular))
             
         conn.commit()
+        conn.close()
+        if egresado_id:
+            indice_identidades.refrescar_entidad('Egresado', [egresado_id])
+        else:
+            indice_identidades.refrescar_claves([dni])
         return True, 'Egresado guardado correctamente'
     except Exception as e:
         return False, str(e)
@@ -104,6 +114,7 @@ def guardar_egresado_individual(data):
 
 
 def procesar_excel_egresados_async(file_bytes, task_id):
+    usar_pool_fondo()
     buscar_egresados_paginados.cache_clear()
     conn = get_db_connection()
     contador = 0
@@ -206,6 +217,8 @@ def procesar_excel_egresados_async(file_bytes, task_id):
                 update_task_progress(task_id, index, total=total_filas, msg=f"Guardando en BD: {index} de {total_filas}...")
             
         conn.commit()
+        conn.close()
+        indice_identidades.recargar()
         
         msg = f'Procesados {contador} de {total_filas} egresados con éxito.'
         if errores:
@@ -239,6 +252,11 @@ def eliminar_egresado_permanente(id):
         
         conn.commit()
         conn.close()
+        indice_identidades.refrescar_entidad('Egresado', [id])
+        contadores_salas.reiniciar()
+        escaneos_repetidos.clear()
+        resumen_ingresos.marcar_para_reconstruir()
+        invalidar_cache_dashboard()
         return True, 'Egresado eliminado permanentemente.'
     except Exception as e:
         return False, f"No se pudo eliminar: {str(e)}"
@@ -262,6 +280,12 @@ def eliminar_egresados_masivo(ids):
         cursor.execute(f"DELETE FROM Egresados WHERE EgresadoID IN ({placeholders})", ids)
         
         conn.commit()
+        conn.close()
+        indice_identidades.refrescar_entidad('Egresado', ids)
+        contadores_salas.reiniciar()
+        escaneos_repetidos.clear()
+        resumen_ingresos.marcar_para_reconstruir()
+        invalidar_cache_dashboard()
         return True, f"{len(ids)} egresados eliminados exitosamente."
     except Exception as e:
         return False, f"Error al eliminar en bloque: {str(e)}"
@@ -285,6 +309,12 @@ def vaciar_egresados_db():
         cursor.execute("DBCC CHECKIDENT ('Egresados', RESEED, 0)")
         
         conn.commit()
+        conn.close()
+        indice_identidades.recargar_async()
+        contadores_salas.reiniciar()
+        escaneos_repetidos.clear()
+        resumen_ingresos.marcar_para_reconstruir()
+        invalidar_cache_dashboard()
         return True, "La tabla de Egresados ha sido VACIADA permanentemente."
     except Exception as e:
         return False, f"Error crítico al vaciar tabla: {str(e)}"
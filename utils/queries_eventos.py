@@ -1,5 +1,64 @@
+import os
+import time
 import datetime
+import threading
 from db import get_db_connection
+from utils.metricas_escaneo import marcar_etapa
+from utils.cache_manager import ExpiringCache
+from utils.esquema_bd import capacidades
+from utils.padrones_eventos import padrones_eventos, MENSAJES_DENEGADO
+
+# ============================================================
+# AGENDA DEL DÍA EN CACHÉ (polling de las terminales)
+# ============================================================
+# Todas las terminales de una sede consultan la agenda cada minuto. Las filas
+# del día se guardan por sede y el estado (proximo/en_curso/finalizado) se
+# calcula en cada consulta con la hora local, así la BD solo se consulta al
+# invalidar (guardar_evento / borrar_evento), al cambiar de día o al vencer
+# el TTL de resguardo (cambios hechos fuera de la aplicación).
+AGENDA_TTL = int(os.getenv('EVENTOS_AGENDA_TTL', 300))
+
+_agenda_cache = ExpiringCache(max_items=100)
+_agenda_lock = threading.Lock()
+
+def invalidar_agenda_eventos():
+    """Descarta la agenda en caché de todas las sedes (un evento puede ser de 'Todas')."""
+    _agenda_cache.clear()
+
+def _filas_agenda(sede, hoy):
+    clave = (sede, hoy)
+    filas = _agenda_cache.get(clave)
+    if filas is not None:
+        return filas
+
+    # Una sola consulta por sede aunque 50 terminales pregunten a la vez
+    with _agenda_lock:
+        filas = _agenda_cache.get(clave)
+        if filas is not None:
+            return filas
+
+        conn = get_db_connection()
+        if not conn:
+            return []
+        try:
+            cursor = conn.cursor()
+            # Solo eventos de HOY que no estén Cancelados.
+            cursor.execute("""
+                SELECT EventoID, NombreEvento, HoraInicio, HoraFin, Lugar, Estado
+                FROM Eventos 
+                WHERE FechaEvento = ?
+                AND Estado != 'Cancelado'
+                AND (NombreSede = ? OR NombreSede = 'Todas' OR NombreSede = 'MULTIPLES (TODAS)')
+                ORDER BY HoraInicio ASC
+            """, (hoy, sede))
+            filas = [tuple(row) for row in cursor.fetchall()]
+        finally:
+            conn.close()
+
+        # Vence con el TTL o a medianoche, lo que llegue primero
+        manana = datetime.datetime.combine(hoy + datetime.timedelta(days=1), datetime.time.min)
+        _agenda_cache.set(clave, filas, min(time.time() + AGENDA_TTL, manana.timestamp()))
+        return filas
 
 def obtener_agenda_eventos_hoy(sede="Central"):
     """
@@ -7,24 +66,13 @@ def obtener_agenda_eventos_hoy(sede="Central"):
     como 'en_curso', 'proximo', o 'finalizado', filtrando por Sede.
     """
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Solo eventos de HOY que no estén Cancelados.
-        sql = """
-            SELECT EventoID, NombreEvento, HoraInicio, HoraFin, Lugar
-            FROM Eventos 
-            WHERE FechaEvento = CAST(GETDATE() AS DATE)
-            AND Estado != 'Cancelado'
-            AND (NombreSede = ? OR NombreSede = 'Todas' OR NombreSede = 'MULTIPLES (TODAS)')
-            ORDER BY HoraInicio ASC
-        """
-        cursor.execute(sql, (sede,))
-        rows = cursor.fetchall()
+        ahora = datetime.datetime.now()
+        rows = _filas_agenda(sede, ahora.date())
         
-        # Necesitamos la hora actual para calcular estados
-        cursor.execute("SELECT CAST(GETDATE() AS TIME)")
-        current_time = cursor.fetchone()[0]
+        def to_minutes(t):
+            return t.hour * 60 + t.minute
+            
+        curr_min = to_minutes(ahora)
         
         agenda = []
         for row in rows:
@@ -34,10 +82,6 @@ def obtener_agenda_eventos_hoy(sede="Central"):
             if not h_ini or not h_fin:
                 continue
             
-            def to_minutes(t):
-                return t.hour * 60 + t.minute
-                
-            curr_min = to_minutes(current_time)
             ini_min = to_minutes(h_ini)
             fin_min = to_minutes(h_fin)
             
@@ -56,7 +100,8 @@ def obtener_agenda_eventos_hoy(sede="Central"):
                 'lugar': row[4],
                 'hora_inicio': h_ini_str,
                 'hora_fin': h_fin_str,
-                'estado_virtual': estado_virtual
+                'estado_virtual': estado_virtual,
+                'estado': row[5]
             })
             
         return agenda
@@ -64,9 +109,34 @@ def obtener_agenda_eventos_hoy(sede="Central"):
     except Exception as e:
         print(f"Error consultando agenda de eventos: {e}")
         return []
+
+def precalentar_agenda_eventos():
+    """
+    Deja en caché la agenda de hoy de cada sede con salas activas y lanza la
+    carga del padrón de los eventos en curso, para que el primer escaneo no
+    pague la consulta. Devuelve cuántos eventos en curso encontró.
+    """
+    conn = get_db_connection()
+    if not conn:
+        return 0
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT DISTINCT ISNULL(Sede, 'Central') FROM Salas WHERE Activo = 1")
+        sedes = [row[0] for row in cursor.fetchall()]
     finally:
-        if 'conn' in locals() and conn:
-            conn.close()
+        conn.close()
+
+    en_curso = set()
+    for sede in sedes or ['Central']:
+        for evento in obtener_agenda_eventos_hoy(sede):
+            if evento['estado_virtual'] == 'en_curso' and evento['estado'] == 'Activo':
+                en_curso.add(evento['id'])
+    for evento_id in en_curso:
+        padrones_eventos.obtener(evento_id)
+    return len(en_curso)
+
+def estadisticas_agenda_eventos():
+    return _agenda_cache.stats()
 
 def verificar_estado_evento(evento_id):
     """
@@ -85,6 +155,7 @@ def verificar_estado_evento(evento_id):
         row = cursor.fetchone()
         
         if not row:
+            padrones_eventos.descartar(evento_id)
             return {'status': 'error', 'msg': 'No existe'}
             
         estado, hora_fin, fecha_evento = row
@@ -94,6 +165,7 @@ def verificar_estado_evento(evento_id):
         fecha_hora_fin = datetime.datetime.combine(fecha_evento, hora_fin)
         
         if estado != 'Activo' or now > fecha_hora_fin:
+            padrones_eventos.descartar(evento_id)
             return {'status': 'success', 'activo': False}
             
         return {'status': 'success', 'activo': True}
@@ -105,145 +177,232 @@ def verificar_estado_evento(evento_id):
         if 'conn' in locals() and conn:
             conn.close()
 
+# Alta atómica: la asistencia solo se inserta si la persona no figura ya en el
+# evento con ninguno de sus identificadores (alumnos: DNI y código). UPDLOCK +
+# HOLDLOCK bloquea ese rango de la clave (EventoID, CodigoEscaneado) hasta el
+# commit, así dos terminales que leen a la misma persona a la vez no insertan
+# ambas; si aun así choca con la clave única, se informa como ya registrado.
+# Usa @ev, @cod, @tipo, @dni, @codigo, @pid, @nombre, @origen y deja
+# @insertado en 1 o 0. Con el esquema ampliado (esquema_bd) guarda además la
+# identidad resuelta y una foto del nombre y el origen para el detalle.
+_SQL_INSERTAR_ASISTENCIA = """
+    BEGIN TRY
+        INSERT INTO AsistenciaEventos (EventoID, CodigoEscaneado, TipoPersona{columnas})
+        SELECT @ev, @cod, @tipo{valores}
+        WHERE NOT EXISTS (
+            SELECT 1 FROM AsistenciaEventos WITH (UPDLOCK, HOLDLOCK)
+            WHERE EventoID = @ev AND CodigoEscaneado IN (@cod, @dni, @codigo)
+        );
+        SET @insertado = @@ROWCOUNT;
+    END TRY
+    BEGIN CATCH
+        IF ERROR_NUMBER() NOT IN (2601, 2627) THROW;
+        SET @insertado = 0;
+    END CATCH
+"""
+
+def _sql_insertar_asistencia(con_identidad):
+    if con_identidad:
+        return _SQL_INSERTAR_ASISTENCIA.format(
+            columnas=', PersonaID, NombrePersona, OrigenPersona', valores=', @pid, @nombre, @origen')
+    return _SQL_INSERTAR_ASISTENCIA.format(columnas='', valores='')
+
+_SQL_REGISTRAR_ASISTENCIA = """
+    SET NOCOUNT ON;
+    DECLARE @ev INT = ?, @cod NVARCHAR(50) = ?, @tipo NVARCHAR(30) = ?;
+    DECLARE @dni NVARCHAR(50) = ?, @codigo NVARCHAR(50) = ?;
+    DECLARE @pid INT = ?, @nombre NVARCHAR(300) = ?, @origen NVARCHAR(300) = ?, @insertado INT = 0;
+    {insertar}
+    SELECT @insertado;
+"""
+
+_SQL_REGISTRAR = {
+    con_identidad: _SQL_REGISTRAR_ASISTENCIA.format(insertar=_sql_insertar_asistencia(con_identidad))
+    for con_identidad in (False, True)
+}
+
+# Reglas del evento + persona (en orden de prioridad) + alta de la asistencia
+# en un solo lote. Cada rama devuelve como máximo una fila, igual que los
+# fetchone() secuenciales de antes; se queda la de menor Prioridad.
+# Resultado: N = persona no encontrada, X = tipo no habilitado,
+#            I = asistencia registrada, D = ya registrado.
+_SQL_RESOLVER_EVENTO = """
+    SET NOCOUNT ON;
+    DECLARE @cod NVARCHAR(50) = ?;
+    DECLARE @ev INT = ?;
+    DECLARE @existe BIT = 0, @pa BIT, @pe BIT, @pp BIT, @pv BIT, @pd BIT;
+    DECLARE @tipo NVARCHAR(30), @nombre NVARCHAR(300), @escuela NVARCHAR(300), @semestre NVARCHAR(100);
+    DECLARE @dni NVARCHAR(50), @codigo NVARCHAR(50), @pid INT, @origen NVARCHAR(300);
+    DECLARE @insertado INT = 0, @resultado CHAR(1) = 'N';
+
+    SELECT @existe = 1, @pa = PermiteAlumnos, @pe = PermiteEgresados, @pp = PermitePersonal,
+           @pv = PermiteVisitantes, @pd = PermiteDocentes
+    FROM Eventos WHERE EventoID = @ev;
+
+    IF @existe = 1
+    BEGIN
+        SELECT TOP 1 @tipo = Tipo, @nombre = Nombre, @escuela = Escuela, @semestre = Semestre,
+                     @dni = DNI, @codigo = Codigo, @pid = PersonaID, @origen = Origen
+        FROM (
+            SELECT * FROM (
+                SELECT TOP 1 1 AS Prioridad, 'InvitadoEvento' AS Tipo, NombreCompleto AS Nombre,
+                       ISNULL(Institucion, 'Invitado Especial') AS Escuela, 'INVITADO' AS Semestre,
+                       DNI, CAST(NULL AS NVARCHAR(50)) AS Codigo, InvitadoID AS PersonaID, Institucion AS Origen
+                FROM InvitadosEvento WHERE DNI = @cod AND EventoID = @ev
+            ) i
+            UNION ALL
+            SELECT * FROM (
+                SELECT TOP 1 2, 'Alumno', a.NombreCompleto, ISNULL(e.NombreEscuela, 'Sin Escuela'),
+                       ISNULL(s.NombreSemestre, ''), a.DNI, a.CodigoMatricula, a.AlumnoID, e.NombreEscuela
+                FROM Alumnos a
+                LEFT JOIN Escuelas e ON a.EscuelaID = e.EscuelaID
+                LEFT JOIN Semestres s ON a.SemestreID = s.SemestreID
+                WHERE a.CodigoMatricula = @cod OR a.DNI = @cod
+            ) a
+            UNION ALL
+            SELECT * FROM (
+                SELECT TOP 1 3, 'Egresado', eg.NombreCompleto, ISNULL(es.NombreEscuela, 'Egresado'),
+                       'EGRESADO', eg.DNI, NULL, eg.EgresadoID, es.NombreEscuela
+                FROM Egresados eg
+                LEFT JOIN Escuelas es ON eg.EscuelaID = es.EscuelaID
+                WHERE eg.DNI = @cod
+            ) g
+            UNION ALL
+            SELECT * FROM (
+                SELECT TOP 1 4, 'Personal', ApellidosNombres, ISNULL(Oficina, 'Administrativo'),
+                       'ADMINISTRATIVO', DNI, NULL, PersonalID, Oficina
+                FROM PersonalAdministrativo WHERE DNI = @cod
+            ) p
+            UNION ALL
+            SELECT * FROM (
+                SELECT TOP 1 5, 'Docente', ApellidosNombres, ISNULL(Facultad, 'Docente'),
+                       'DOCENTE', DNI, NULL, DocenteID, Facultad
+                FROM Docentes WHERE DNI = @cod
+            ) d
+            UNION ALL
+            SELECT * FROM (
+                SELECT TOP 1 6, 'Visitante', NombreCompleto, ISNULL(Institucion, 'Visitante Externo'),
+                       'VISITANTE', DNI, NULL, VisitanteID, Institucion
+                FROM Visitantes WHERE DNI = @cod
+            ) v
+        ) candidatos
+        ORDER BY Prioridad;
+
+        IF @tipo IS NOT NULL
+        BEGIN
+            -- Los invitados VIP pasan siempre; el resto según las reglas del evento
+            IF CASE @tipo WHEN 'InvitadoEvento' THEN 1 WHEN 'Alumno' THEN @pa WHEN 'Egresado' THEN @pe
+                          WHEN 'Personal' THEN @pp WHEN 'Docente' THEN @pd WHEN 'Visitante' THEN @pv END = 1
+            BEGIN
+                -- Solo los alumnos aportan un segundo identificador (DNI y código)
+                IF @tipo <> 'Alumno' SELECT @dni = NULL, @codigo = NULL;
+                {insertar}
+                SET @resultado = CASE WHEN @insertado = 1 THEN 'I' ELSE 'D' END;
+            END
+            ELSE
+                SET @resultado = 'X';
+        END
+    END
+
+    SELECT @existe, @tipo, @nombre, @escuela, @semestre, @resultado;
+"""
+
+_SQL_RESOLVER = {
+    con_identidad: _SQL_RESOLVER_EVENTO.format(insertar=_sql_insertar_asistencia(con_identidad))
+    for con_identidad in (False, True)
+}
+
+def _respuesta_evento(status, msg, persona):
+    return {
+        'status': status,
+        'msg': msg,
+        'alumno': persona[1],
+        'escuela': persona[2],
+        'semestre': persona[3]
+    }
+
+def _procesar_con_padron(padron, codigo, evento_id):
+    """Decide con el padrón en memoria; None si el código no está en él."""
+    decision = padron.resolver(codigo)
+    padrones_eventos.contar(decision is not None)
+    if decision is None:
+        return None
+    accion, dato = decision
+    if accion == 'denegado':
+        return {'status': 'error', 'msg': dato}
+    if accion == 'duplicado' or not padron.reservar(dato[4]):
+        return _respuesta_evento('warning', 'YA REGISTRADO EN EVENTO', dato)
+
+    identificadores = list(dato[4]) + [None, None]
+    con_identidad = capacidades['identidad_asistencia']
+    try:
+        marcar_etapa('preparacion')
+        conn = get_db_connection()
+        marcar_etapa('conexion')
+        cursor = conn.cursor()
+        cursor.execute(_SQL_REGISTRAR[con_identidad],
+                       (evento_id, codigo, dato[0], identificadores[0], identificadores[1],
+                        dato[5], dato[1], dato[6]))
+        insertado = cursor.fetchone()[0]
+        marcar_etapa('ejecucion')
+        conn.commit()
+        marcar_etapa('commit')
+        if not insertado:
+            # Otro servidor/proceso ya la había registrado: queda reservada en el padrón
+            return _respuesta_evento('warning', 'YA REGISTRADO EN EVENTO', dato)
+        return _respuesta_evento('success', 'ACCESO EVENTO CONCEDIDO', dato)
+    except Exception as e:
+        padron.liberar(dato[4])
+        print(f"Error procesando ingreso evento: {e}")
+        return {'status': 'error', 'msg': f'Error interno: {str(e)}'}
+    finally:
+        if 'conn' in locals() and conn:
+            conn.close()
+
 def procesar_ingreso_evento(codigo, evento_id):
     """
     Procesa un código escaneado (DNI o Carnet) comprobando reglas de acceso del evento
     y registrando en AsistenciaEventos.
+    Prioridad: Invitado VIP > Alumno > Egresado > Personal > Docente > Visitante.
     """
+    # Evento en curso con padrón armado: solo se escribe la asistencia
+    padron = padrones_eventos.obtener(evento_id)
+    if padron is not None:
+        respuesta = _procesar_con_padron(padron, codigo, evento_id)
+        if respuesta is not None:
+            return respuesta
+
     try:
+        marcar_etapa('preparacion')
         conn = get_db_connection()
+        marcar_etapa('conexion')
         cursor = conn.cursor()
         
-        # 1. Obtener reglas del evento
-        cursor.execute("SELECT PermiteAlumnos, PermiteEgresados, PermitePersonal, PermiteVisitantes, PermiteDocentes, NombreEvento FROM Eventos WHERE EventoID = ?", (evento_id,))
-        evento = cursor.fetchone()
+        # Reglas del evento, persona encontrada y alta atómica de la asistencia en una sola ida
+        cursor.execute(_SQL_RESOLVER[capacidades['identidad_asistencia']], (codigo, evento_id))
+        existe, tipo_persona, nombre_persona, escuela_persona, semestre_persona, resultado = cursor.fetchone()
+        marcar_etapa('ejecucion')
         
-        if not evento:
+        if not existe:
             return {'status': 'error', 'msg': 'Evento no encontrado o finalizado.'}
             
-        p_alum, p_egre, p_pers, p_vis, p_doc, nombre_evento = evento
-        
-        # 2. Variable para almacenar el tipo encontrado
-        tipo_persona = None
-        nombre_persona = "Desconocido"
-        escuela_persona = "Exterior"
-        semestre_persona = ""
-        identificadores_a_verificar = [codigo]
-        
-        # A) ES INVITADO VIP DEL EVENTO (Lista Blanca en InvitadosEvento)?
-        cursor.execute("SELECT NombreCompleto, Institucion FROM InvitadosEvento WHERE DNI = ? AND EventoID = ?", (codigo, evento_id))
-        invitado = cursor.fetchone()
-        if invitado:
-            tipo_persona = 'InvitadoEvento'
-            nombre_persona = invitado[0]
-            escuela_persona = invitado[1] or 'Invitado Especial'
-            semestre_persona = 'INVITADO'
-        else:
-            # B) ES ALUMNO (Por Código Matrícula o DNI)?
-            cursor.execute("""
-                SELECT a.NombreCompleto, e.NombreEscuela, s.NombreSemestre, a.DNI, a.CodigoMatricula
-                FROM Alumnos a
-                LEFT JOIN Escuelas e ON a.EscuelaID = e.EscuelaID
-                LEFT JOIN Semestres s ON a.SemestreID = s.SemestreID
-                WHERE a.CodigoMatricula = ? OR a.DNI = ?
-            """, (codigo, codigo))
-            alum = cursor.fetchone()
-            if alum:
-                if p_alum:
-                    tipo_persona = 'Alumno'
-                    nombre_persona = alum[0]
-                    escuela_persona = alum[1] if alum[1] else 'Sin Escuela'
-                    semestre_persona = alum[2] if alum[2] else ''
-                    # IMPORTANTE: Validamos ambos códigos para evitar doble ingreso
-                    identificadores_a_verificar = [x for x in [alum[3], alum[4]] if x]
-                else:
-                    return {'status': 'error', 'msg': 'Acceso denegado: Evento no habilitado para Alumnos.'}
-            else:
-                # C) ES EGRESADO?
-                cursor.execute("""
-                    SELECT eg.NombreCompleto, es.NombreEscuela 
-                    FROM Egresados eg
-                    LEFT JOIN Escuelas es ON eg.EscuelaID = es.EscuelaID
-                    WHERE eg.DNI = ?
-                """, (codigo,))
-                egre = cursor.fetchone()
-                if egre:
-                    if p_egre:
-                        tipo_persona = 'Egresado'
-                        nombre_persona = egre[0]
-                        escuela_persona = egre[1] if egre[1] else 'Egresado'
-                        semestre_persona = 'EGRESADO'
-                    else:
-                        return {'status': 'error', 'msg': 'Acceso denegado: Evento no habilitado para Egresados.'}
-                else:
-                    # D) ES PERSONAL?
-                    cursor.execute("SELECT ApellidosNombres, Oficina FROM PersonalAdministrativo WHERE DNI = ?", (codigo,))
-                    pers = cursor.fetchone()
-                    if pers:
-                        if p_pers:
-                            tipo_persona = 'Personal'
-                            nombre_persona = pers[0]
-                            escuela_persona = pers[1] if pers[1] else 'Administrativo'
-                            semestre_persona = 'ADMINISTRATIVO'
-                        else:
-                            return {'status': 'error', 'msg': 'Acceso denegado: Evento no habilitado para Personal.'}
-                    else:
-                        # E) ES DOCENTE?
-                        cursor.execute("SELECT ApellidosNombres, Facultad FROM Docentes WHERE DNI = ?", (codigo,))
-                        doc = cursor.fetchone()
-                        if doc:
-                            if p_doc:
-                                tipo_persona = 'Docente'
-                                nombre_persona = doc[0]
-                                escuela_persona = doc[1] if doc[1] else 'Docente'
-                                semestre_persona = 'DOCENTE'
-                            else:
-                                return {'status': 'error', 'msg': 'Acceso denegado: Evento no habilitado para Docentes.'}
-                        else:
-                            # F) ES VISITANTE?
-                            cursor.execute("SELECT NombreCompleto, Institucion FROM Visitantes WHERE DNI = ?", (codigo,))
-                            visit = cursor.fetchone()
-                            if visit:
-                                if p_vis:
-                                    tipo_persona = 'Visitante'
-                                    nombre_persona = visit[0]
-                                    escuela_persona = visit[1] if visit[1] else 'Visitante Externo'
-                                    semestre_persona = 'VISITANTE'
-                                else:
-                                    return {'status': 'error', 'msg': 'Acceso denegado: Evento no habilitado para Visitantes.'}
-        
         # SI NO ENCONTRÓ NADA
-        if not tipo_persona:
+        if resultado == 'N':
             return {'status': 'error', 'msg': 'Persona no registrada o sin invitación para este evento.'}
             
-        # 3. YA REGISTRÓ ASISTENCIA?
-        placeholders = ','.join(['?'] * len(identificadores_a_verificar))
-        query_check = f"SELECT AsistenciaID FROM AsistenciaEventos WHERE EventoID = ? AND CodigoEscaneado IN ({placeholders})"
-        params_check = [evento_id] + identificadores_a_verificar
-        cursor.execute(query_check, params_check)
-        ya_asistio = cursor.fetchone()
+        # EL EVENTO NO ADMITE ESTE TIPO DE PERSONA
+        if resultado == 'X':
+            return {'status': 'error', 'msg': MENSAJES_DENEGADO[tipo_persona]}
+            
+        persona = (tipo_persona, nombre_persona, escuela_persona, semestre_persona)
         
-        if ya_asistio:
-            return {
-                'status': 'warning',
-                'msg': 'YA REGISTRADO EN EVENTO',
-                'alumno': nombre_persona,
-                'escuela': escuela_persona,
-                'semestre': semestre_persona
-            }
+        # YA REGISTRÓ ASISTENCIA
+        if resultado == 'D':
+            return _respuesta_evento('warning', 'YA REGISTRADO EN EVENTO', persona)
             
-        # 4. REGISTRAR ASISTENCIA
-        cursor.execute("INSERT INTO AsistenciaEventos (EventoID, CodigoEscaneado, TipoPersona) VALUES (?, ?, ?)", 
-                       (evento_id, codigo, tipo_persona))
         conn.commit()
-        
-        return {
-            'status': 'success',
-            'msg': 'ACCESO EVENTO CONCEDIDO',
-            'alumno': nombre_persona,
-            'escuela': escuela_persona,
-            'semestre': semestre_persona
-        }
+        marcar_etapa('commit')
+        return _respuesta_evento('success', 'ACCESO EVENTO CONCEDIDO', persona)
 
     except Exception as e:
         print(f"Error procesando ingreso evento: {e}")
@@ -1,67 +1,393 @@
-from db import get_db_connection
+import os
+import pyodbc
+from datetime import datetime, date
+from db import get_db_connection, pool_agotado
+from utils.indice_identidades import indice_identidades
+from utils.esquema_bd import capacidades
+from utils.bloques_horario import obtener_bloque
+from utils.queries_carnets import _get_global_expiration
+from utils.escritura_diferida import escritura_diferida
+from utils.cache_manager import escaneos_repetidos
+from utils.journal_offline import journal_offline
+from utils.contadores_salas import contadores_salas
+from utils.metricas_escaneo import marcar_etapa
+
+# El registro síncrono (identidad, bloque horario y duplicados) es siempre el
+# de sp_RegistrarIngreso: su código no está en este repositorio y no se
+# replica aquí. El índice en memoria solo alimenta el write-behind y el acuse
+# sin conexión, y solo se carga si alguno de esos modos está activo.
+
+ERROR_BD = 'Error BD'
+# Pool sin conexiones libres: la BD responde, no se pasa al journal offline
+ERROR_OCUPADO = 'Servidor ocupado, intente nuevamente'
+
+# Escaneos por lote de /procesar_ingreso_batch (cada uno es un EXEC del procedimiento en la misma ida)
+MAX_ESCANEOS_LOTE = min(int(os.getenv('SCAN_LOTE_MAX', 100)), 150)
+
+
+def _es_error_conexion(e):
+    # SQLSTATE 08xxx = enlace de comunicación caído; OperationalError incluye timeouts de login.
+    # Un timeout de consulta (DB_QUERY_TIMEOUT) es BD lenta, no caída
+    codigo = str(e.args[0]) if getattr(e, 'args', None) else ''
+    if codigo == 'HYT00' and 'query timeout' in str(e).lower():
+        return False
+    return isinstance(e, pyodbc.OperationalError) or codigo.startswith('08')
+
+
+def _interpretar_mensaje(mensaje, nombre, escuela, semestre):
+    """Convierte el mensaje del registro en el diccionario que espera el terminal."""
+    if 'CONCEDIDO' in mensaje or 'NUEVO INGRESO' in mensaje:
+        warning_type = None
+        if 'VENCIDO' in mensaje or 'CARNET VENCIDO' in mensaje:
+            warning_type = 'carnet_vencido'
+
+        return {
+            'status': 'success',
+            'msg': mensaje,
+            'warning': warning_type,
+            'alumno': nombre,
+            'escuela': escuela,
+            'semestre': semestre
+        }
+
+    elif 'YA REGISTRADO' in mensaje or 'YA ESTÁS REGISTRADO' in mensaje:
+        return {
+            'status': 'warning',
+            'msg': mensaje,
+            'alumno': nombre,
+            'escuela': escuela,
+            'semestre': semestre
+        }
+
+    return {'status': 'error', 'msg': mensaje}
+
+
+def _carnet_vencido(identidad, hoy):
+    if identidad.tipo != 'Alumno':
+        return False
+    vencimiento = identidad.vencimiento or _get_global_expiration()
+    if isinstance(vencimiento, datetime):
+        vencimiento = vencimiento.date()
+    return vencimiento < hoy
+
+
+def _mensaje_concedido(identidad, momento):
+    if _carnet_vencido(identidad, momento.date()):
+        return 'ACCESO CONCEDIDO - CARNET VENCIDO'
+    return 'ACCESO CONCEDIDO'
+
+
+def _recordar_repetido(clave_repetido, fin_bloque, res):
+    """Guarda el aviso de 'ya registrado' hasta que termine el bloque horario."""
+    if not clave_repetido or res.get('status') not in ('success', 'warning'):
+        return
+    aviso = res if res['status'] == 'warning' else {
+        'status': 'warning',
+        'msg': 'YA REGISTRADO EN ESTE BLOQUE HORARIO',
+        'alumno': res.get('alumno'),
+        'escuela': res.get('escuela'),
+        'semestre': res.get('semestre')
+    }
+    escaneos_repetidos.set(clave_repetido, dict(aviso), fin_bloque.timestamp())
+
+
+def _contar_exitoso(sala_id, res, fecha_registro):
+    """
+    Suma el ingreso al contador en vivo de la sala y lo devuelve al terminal.
+    Solo cuenta inserciones confirmadas con FechaHora de hoy: los acuses
+    provisionales se cuentan cuando el replay los confirma.
+    """
+    if res.get('status') != 'success' or res.get('provisional') or fecha_registro != date.today():
+        return
+    total = contadores_salas.incrementar(sala_id)
+    if total is not None:
+        res['contador_sala'] = total
+
+
+def _registrar_diferido(identidad, sala_id, momento):
+    """
+    Modo write-behind: registra con las reglas en memoria a una persona ya
+    identificada por el índice. Retorna None si el escaneo debe resolverlo
+    sp_RegistrarIngreso (modo inactivo, fuera de horario o cola no disponible).
+    """
+    if not escritura_diferida.activa:
+        return None
+    try:
+        mensaje = escritura_diferida.registrar(identidad, sala_id, momento, _mensaje_concedido(identidad, momento))
+    except Exception as e:
+        print(f"Error en registro diferido (se usa sp_RegistrarIngreso): {e}")
+        return None
+    if not mensaje:
+        return None
+    return _interpretar_mensaje(mensaje, identidad.nombre, identidad.escuela, identidad.semestre)
+
 
 def registrar_ingreso_general(codigo, sala_id):
     """
-    Ejecuta el stored procedure sp_RegistrarIngreso y retorna el resultado
-    en un formato de diccionario que el endpoint espera.
+    Registra un escaneo. Los repetidos del mismo bloque horario se responden
+    desde memoria sin tocar la BD; el resto lo resuelve el stored procedure
+    sp_RegistrarIngreso (identidad, bloque horario y duplicados).
+    Retorna el diccionario que el endpoint espera.
     """
+    momento = datetime.now()
+    bloque = obtener_bloque(momento)
+    clave_repetido = (codigo, str(sala_id), momento.date(), bloque[0]) if bloque else None
+
+    if clave_repetido:
+        aviso = escaneos_repetidos.get(clave_repetido)
+        if aviso:
+            marcar_etapa('preparacion')
+            return dict(aviso)
+
+    if journal_offline.activo and journal_offline.bd_caida():
+        res = _acuse_provisional(codigo, sala_id, momento)
+    else:
+        res = _registrar_ingreso(codigo, sala_id, momento)
+        if journal_offline.activo and res.get('msg') == ERROR_BD:
+            journal_offline.marcar_caida()
+            res = _acuse_provisional(codigo, sala_id, momento)
+
+    if clave_repetido:
+        _recordar_repetido(clave_repetido, bloque[2], res)
+    _contar_exitoso(sala_id, res, momento.date())
+    marcar_etapa('preparacion')
+
+    return res
+
+
+# ============================================================
+# sp_RegistrarIngreso
+# ============================================================
+_SQL_DECLARAR = """
+SET NOCOUNT ON;
+DECLARE @out_msg nvarchar(250), @out_nombre nvarchar(250),
+        @out_escuela nvarchar(200), @out_semestre nvarchar(40),
+        @lectura DATETIME;
+"""
+
+_SQL_SP = """
+SELECT @out_msg = NULL, @out_nombre = NULL, @out_escuela = NULL, @out_semestre = NULL,
+       @lectura = ?;
+EXEC sp_RegistrarIngreso ?, ?, @out_msg OUTPUT, @out_nombre OUTPUT, @out_escuela OUTPUT, @out_semestre OUTPUT;
+"""
+
+# Con migraciones/001_hora_lectura.sql aplicada, la hora en que el controlador
+# leyó el carnet viaja en el SESSION_CONTEXT y el DEFAULT de FechaHoraLectura
+# la toma en el INSERT del procedimiento; FechaHora queda la del registro. Se
+# limpia al terminar (también si falla) para que no la herede otro INSERT de
+# la misma conexión del pool.
+_SQL_SP_LECTURA = """
+SELECT @out_msg = NULL, @out_nombre = NULL, @out_escuela = NULL, @out_semestre = NULL,
+       @lectura = ?;
+EXEC sp_set_session_context N'lectura_escaneo', @lectura;
+BEGIN TRY
+    EXEC sp_RegistrarIngreso ?, ?, @out_msg OUTPUT, @out_nombre OUTPUT, @out_escuela OUTPUT, @out_semestre OUTPUT;
+END TRY
+BEGIN CATCH
+    EXEC sp_set_session_context N'lectura_escaneo', NULL;
+    THROW;
+END CATCH
+EXEC sp_set_session_context N'lectura_escaneo', NULL;
+"""
+
+
+def _sql_sp():
+    return _SQL_SP_LECTURA if capacidades['hora_lectura'] else _SQL_SP
+
+
+def _registrar_ingreso(codigo, sala_id, momento, lectura=None, diferida=True):
+    """
+    Registra con sp_RegistrarIngreso (o con el write-behind si está activo y la
+    persona está en el índice). `lectura`: hora original del escaneo cuando se
+    registra después (replay del journal offline).
+    """
+    if diferida and escritura_diferida.activa:
+        identidad = indice_identidades.buscar(codigo)
+        if identidad:
+            res = _registrar_diferido(identidad, sala_id, momento)
+            if res is not None:
+                return res
+
+    marcar_etapa('preparacion')
     conn = get_db_connection()
-    if not conn: 
-        return {'status': 'error', 'msg': 'Error BD'}
+    marcar_etapa('conexion')
+    if not conn:
+        return {'status': 'error', 'msg': ERROR_OCUPADO if pool_agotado() else ERROR_BD}
 
     try:
         cursor = conn.cursor()
-        sql = """
-        DECLARE @out_msg nvarchar(250);
-        DECLARE @out_nombre nvarchar(250);
-        DECLARE @out_escuela nvarchar(200);
-        DECLARE @out_semestre nvarchar(40);
-        
-        -- Ejecutamos el procedimiento enviando Codigo y SalaID
-        EXEC sp_RegistrarIngreso ?, ?, @out_msg OUTPUT, @out_nombre OUTPUT, @out_escuela OUTPUT, @out_semestre OUTPUT;
-        
-        SELECT @out_msg, @out_nombre, @out_escuela, @out_semestre;
-        """
-        cursor.execute(sql, (codigo, sala_id))
+        sql = _SQL_DECLARAR + _sql_sp() + "SELECT @out_msg, @out_nombre, @out_escuela, @out_semestre;"
+        cursor.execute(sql, (lectura, codigo, sala_id))
         row = cursor.fetchone()
+        marcar_etapa('ejecucion')
         conn.commit()
-        
+        marcar_etapa('commit')
+
         if row:
-            mensaje = row[0]
-            nombre = row[1]
-            escuela = row[2]
-            semestre = row[3]
-
-            if 'CONCEDIDO' in mensaje or 'NUEVO INGRESO' in mensaje: 
-                warning_type = None
-                if 'VENCIDO' in mensaje or 'CARNET VENCIDO' in mensaje:
-                    warning_type = 'carnet_vencido'
-
-                return {
-                    'status': 'success', 
-                    'msg': mensaje, 
-                    'warning': warning_type,
-                    'alumno': nombre, 
-                    'escuela': escuela, 
-                    'semestre': semestre
-                }
-            
-            elif 'YA REGISTRADO' in mensaje or 'YA ESTÁS REGISTRADO' in mensaje:
-                return {
-                    'status': 'warning', 
-                    'msg': mensaje, 
-                    'alumno': nombre, 
-                    'escuela': escuela, 
-                    'semestre': semestre
-                }
+            return _interpretar_mensaje(row[0], row[1], row[2], row[3])
 
-            else:
-                return {'status': 'error', 'msg': mensaje}
-        
         return {'status': 'error', 'msg': 'Error desconocido en BD'}
 
     except Exception as e:
+        if _es_error_conexion(e):
+            return {'status': 'error', 'msg': ERROR_BD}
         return {'status': 'error', 'msg': str(e)}
     finally:
         if 'conn' in locals() and conn:
             conn.close()
+
+
+# ============================================================
+# LOTES DE ESCANEOS (controladores que acumulan lecturas)
+# ============================================================
+_SQL_LOTE_FILA = """
+BEGIN TRY
+    {sp}
+    INSERT INTO @res VALUES (?, @out_msg, @out_nombre, @out_escuela, @out_semestre);
+END TRY
+BEGIN CATCH
+    INSERT INTO @res (Idx, Msg) VALUES (?, ERROR_MESSAGE());
+END CATCH
+"""
+
+
+def _ejecutar_lote(escaneos):
+    """
+    Ejecuta sp_RegistrarIngreso para cada escaneo [(idx, codigo, sala_id, momento)]
+    en una sola ida a la BD. Retorna {idx: fila (Msg, Nombre, Escuela, Semestre)}.
+    """
+    conn = get_db_connection()
+    if not conn:
+        raise ConnectionError(ERROR_OCUPADO if pool_agotado() else ERROR_BD)
+
+    try:
+        partes = [_SQL_DECLARAR, """
+        DECLARE @res TABLE (Idx INT PRIMARY KEY, Msg NVARCHAR(250), Nombre NVARCHAR(250),
+                            Escuela NVARCHAR(200), Semestre NVARCHAR(40));
+        """]
+        params = []
+        fila = _SQL_LOTE_FILA.format(sp=_sql_sp())
+        for idx, codigo, sala_id, momento in escaneos:
+            partes.append(fila)
+            params.extend([momento.replace(microsecond=0), codigo, sala_id, idx, idx])
+
+        partes.append("SELECT Idx, Msg, Nombre, Escuela, Semestre FROM @res ORDER BY Idx;")
+
+        cursor = conn.cursor()
+        cursor.execute('\n'.join(partes), params)
+        filas = {row[0]: row[1:] for row in cursor.fetchall()}
+        conn.commit()
+        return filas
+    finally:
+        conn.close()
+
+
+def registrar_ingresos_lote(escaneos):
+    """
+    Registra varios escaneos [{'codigo', 'sala_id', 'momento'}] con una sola ida
+    a la BD. Los repetidos y el modo sin conexión se resuelven igual que en
+    registrar_ingreso_general. sp_RegistrarIngreso aplica sus reglas a la hora
+    del servidor; la hora de lectura del controlador queda en FechaHoraLectura
+    (migración 001).
+    Retorna un resultado por escaneo, en el mismo orden.
+    """
+    resultados = [None] * len(escaneos)
+    claves = [None] * len(escaneos)
+    # FechaHora con la que queda cada ingreso: la del servidor al pasar por
+    # sp_RegistrarIngreso, la del controlador en el write-behind
+    fechas = [date.today()] * len(escaneos)
+    por_sp = []
+    bd_caida = journal_offline.activo and journal_offline.bd_caida()
+
+    for idx, escaneo in enumerate(escaneos):
+        codigo, sala_id, momento = escaneo['codigo'], escaneo['sala_id'], escaneo['momento']
+        bloque = obtener_bloque(momento)
+        if bloque:
+            claves[idx] = ((codigo, str(sala_id), momento.date(), bloque[0]), bloque[2])
+            aviso = escaneos_repetidos.get(claves[idx][0])
+            if aviso:
+                resultados[idx] = dict(aviso)
+                continue
+
+        if bd_caida:
+            resultados[idx] = _acuse_provisional(codigo, sala_id, momento)
+            continue
+
+        if escritura_diferida.activa:
+            identidad = indice_identidades.buscar(codigo)
+            if identidad:
+                resultados[idx] = _registrar_diferido(identidad, sala_id, momento)
+                if resultados[idx] is not None:
+                    fechas[idx] = momento.date()
+                    continue
+        por_sp.append((idx, codigo, sala_id, momento))
+
+    if por_sp:
+        try:
+            filas = _ejecutar_lote(por_sp)
+            error = None
+        except Exception as e:
+            filas = {}
+            if isinstance(e, ConnectionError):
+                error = str(e)
+            else:
+                error = ERROR_BD if _es_error_conexion(e) else str(e)
+
+        if error == ERROR_BD and journal_offline.activo:
+            journal_offline.marcar_caida()
+
+        for idx, codigo, sala_id, momento in por_sp:
+            fila = filas.get(idx)
+            if error == ERROR_BD and journal_offline.activo:
+                resultados[idx] = _acuse_provisional(codigo, sala_id, momento)
+            elif error:
+                resultados[idx] = {'status': 'error', 'msg': error}
+            elif not fila or not fila[0]:
+                resultados[idx] = {'status': 'error', 'msg': 'Error desconocido en BD'}
+            else:
+                resultados[idx] = _interpretar_mensaje(fila[0], fila[1], fila[2], fila[3])
+
+    for idx, clave in enumerate(claves):
+        if clave:
+            _recordar_repetido(clave[0], clave[1], resultados[idx])
+        _contar_exitoso(escaneos[idx]['sala_id'], resultados[idx], fechas[idx])
+
+    return resultados
+
+
+def _acuse_provisional(codigo, sala_id, momento):
+    """
+    Guarda el escaneo en el journal local y responde sin esperar a la BD.
+    Solo para personas del índice en memoria: un código desconocido no se puede
+    validar sin la BD y no recibe acceso.
+    """
+    identidad = indice_identidades.buscar(codigo)
+    if not identidad:
+        return {'status': 'error', 'msg': 'SIN CONEXIÓN A BD - CÓDIGO NO VERIFICADO'}
+
+    try:
+        journal_offline.guardar(codigo, sala_id, momento)
+    except Exception as e:
+        print(f"Error guardando escaneo en journal offline: {e}")
+        return {'status': 'error', 'msg': ERROR_BD}
+
+    return {
+        'status': 'success',
+        'msg': 'INGRESO PROVISIONAL (SIN CONEXIÓN A BD)',
+        'warning': 'provisional',
+        'provisional': True,
+        'alumno': identidad.nombre,
+        'escuela': identidad.escuela,
+        'semestre': identidad.semestre
+    }
+
+
+def reproducir_escaneo(codigo, sala_id, momento):
+    """
+    Re-procesa un escaneo guardado en el journal offline con sp_RegistrarIngreso;
+    la hora original del escaneo queda en FechaHoraLectura (migración 001). El ingreso confirmado
+    recién ahora suma al contador de la sala.
+    """
+    res = _registrar_ingreso(codigo, sala_id, momento, lectura=momento.replace(microsecond=0), diferida=False)
+    _contar_exitoso(sala_id, res, date.today())
+    return res
@@ -1,8 +1,13 @@
 import pandas as pd
 import io
-from db import get_db_connection
+from db import get_db_connection, usar_pool_fondo
 from utils.validaciones import verificar_dni_global, formatear_nombre_estetico
 from utils.task_manager import update_task_progress, finish_task
+from utils.indice_identidades import indice_identidades
+from utils.contadores_salas import contadores_salas
+from utils.cache_manager import escaneos_repetidos
+from utils import resumen_ingresos
+from utils.queries_dashboard import invalidar_cache_dashboard
 
 def buscar_personal_administrativo(query, page, limit=20):
     offset = (page - 1) * limit
@@ -91,6 +96,11 @@ def guardar_personal_administrativo(data):
             """, (nombre, dni, oficina, correo_personal, correo_inst, telefono))
             
         conn.commit()
+        conn.close()
+        if personal_id:
+            indice_identidades.refrescar_entidad('Administrativo', [personal_id])
+        else:
+            indice_identidades.refrescar_claves([dni])
         return {'status': 'success', 'msg': 'Personal Administrativo guardado correctamente'}
     except Exception as e:
         return {'status': 'error', 'msg': str(e)}
@@ -109,6 +119,12 @@ def borrar_personal_administrativo(id_per):
         cursor.execute("DELETE FROM PersonalAdministrativo WHERE PersonalID = ?", (id_per,))
         
         conn.commit()
+        conn.close()
+        indice_identidades.refrescar_entidad('Administrativo', [id_per])
+        contadores_salas.reiniciar()
+        escaneos_repetidos.clear()
+        resumen_ingresos.marcar_para_reconstruir()
+        invalidar_cache_dashboard()
         return {'status': 'success', 'msg': 'Personal eliminado permanentemente.'}
     except Exception as e:
         return {'status': 'error', 'msg': f"No se pudo eliminar: {str(e)}"}
@@ -116,6 +132,7 @@ def borrar_personal_administrativo(id_per):
         if 'conn' in locals(): conn.close()
 
 def procesar_excel_personal_async(file_bytes, task_id):
+    usar_pool_fondo()
     conn = get_db_connection()
     errores = []
     contador = 0
@@ -195,6 +212,8 @@ def procesar_excel_personal_async(file_bytes, task_id):
                 update_task_progress(task_id, idx, total=total_filas, msg=f"Guardando en BD: {idx} de {total_filas}...")
             
         conn.commit()
+        conn.close()
+        indice_identidades.recargar()
         msg = f'Procesados {contador} de {total_filas} registros de personal con éxito.'
         if errores:
             detalles = "<br> • ".join(errores[:5])
@@ -228,6 +247,12 @@ def eliminar_personal_masivo(ids):
         cursor.execute(f"DELETE FROM PersonalAdministrativo WHERE PersonalID IN ({placeholders})", ids)
         
         conn.commit()
+        conn.close()
+        indice_identidades.refrescar_entidad('Administrativo', ids)
+        contadores_salas.reiniciar()
+        escaneos_repetidos.clear()
+        resumen_ingresos.marcar_para_reconstruir()
+        invalidar_cache_dashboard()
         return {'status': 'success', 'msg': f"{len(ids)} registros de personal eliminados exitosamente."}
     except Exception as e:
         return {'status': 'error', 'msg': f"Error al eliminar en bloque: {str(e)}"}
@@ -250,6 +275,12 @@ def vaciar_personal_db():
         cursor.execute("DBCC CHECKIDENT ('PersonalAdministrativo', RESEED, 0)")
         
         conn.commit()
+        conn.close()
+        indice_identidades.recargar_async()
+        contadores_salas.reiniciar()
+        escaneos_repetidos.clear()
+        resumen_ingresos.marcar_para_reconstruir()
+        invalidar_cache_dashboard()
         return {'status': 'success', 'msg': "La tabla de Personal Administrativo ha sido VACIADA permanentemente."}
     except Exception as e:
         return {'status': 'error', 'msg': f"Error crítico al vaciar tabla: {str(e)}"}
@@ -1,8 +1,13 @@
 import pandas as pd
 import io
-from db import get_db_connection
+from db import get_db_connection, usar_pool_fondo
 from utils.validaciones import verificar_dni_global, formatear_nombre_estetico
 from utils.task_manager import update_task_progress, finish_task
+from utils.indice_identidades import indice_identidades
+from utils.contadores_salas import contadores_salas
+from utils.cache_manager import escaneos_repetidos
+from utils import resumen_ingresos
+from utils.queries_dashboard import invalidar_cache_dashboard
 import functools
 
 @functools.lru_cache(maxsize=128)
@@ -39,6 +44,8 @@ def registrar_nuevo_visitante(data):
         cursor.execute("INSERT INTO Visitantes (NombreCompleto, DNI, Correo, Institucion) VALUES (?,?,?,?)",
                        (data.get('nombre'), dni, data.get('correo'), inst))
         conn.commit()
+        conn.close()
+        indice_identidades.refrescar_claves([dni])
         return {'status': 'success', 'msg': 'Guardado'}
     except Exception as e:
         return {'status': 'error', 'msg': str(e)}
@@ -64,6 +71,8 @@ def actualizar_visitante(data):
         """, (data.get('nombre'), dni, data.get('institucion') or 'Sin Institución', data.get('correo'), vis_id))
         
         conn.commit()
+        conn.close()
+        indice_identidades.refrescar_entidad('Visitante', [vis_id])
         return {'status': 'success', 'msg': 'Visitante actualizado.'}
     except Exception as e:
         return {'status': 'error', 'msg': str(e)}
@@ -77,6 +86,8 @@ def borrar_todos_visitantes():
         cursor = conn.cursor()
         cursor.execute("TRUNCATE TABLE Visitantes")
         conn.commit()
+        conn.close()
+        indice_identidades.recargar_async()
         return {'status': 'success', 'msg': 'Directorio de Visitantes vaciado completamente.'}
     except Exception as e:
         return {'status': 'error', 'msg': f"No se pudo vaciar la BD: {str(e)}"}
@@ -95,6 +106,12 @@ def borrar_visitante(id_vis):
         cursor.execute("DELETE FROM Visitantes WHERE VisitanteID = ?", (id_vis,))
         
         conn.commit()
+        conn.close()
+        indice_identidades.refrescar_entidad('Visitante', [id_vis])
+        contadores_salas.reiniciar()
+        escaneos_repetidos.clear()
+        resumen_ingresos.marcar_para_reconstruir()
+        invalidar_cache_dashboard()
         return {'status': 'success', 'msg': 'Visitante eliminado permanentemente.'}
     except Exception as e:
         return {'status': 'error', 'msg': str(e)}
@@ -102,6 +119,7 @@ def borrar_visitante(id_vis):
         if 'conn' in locals(): conn.close()
 
 def procesar_excel_visitantes_async(file_bytes, task_id):
+    usar_pool_fondo()
     obtener_todos_visitantes.cache_clear()
     conn = get_db_connection()
     errores = []
@@ -175,6 +193,8 @@ def procesar_excel_visitantes_async(file_bytes, task_id):
                 update_task_progress(task_id, idx, total=total_filas, msg=f"Guardando en BD: {idx} de {total_filas}...")
             
         conn.commit()
+        conn.close()
+        indice_identidades.recargar()
         msg = f'Procesados {contador} de {total_filas} visitantes con éxito.'
         if errores:
             detalles = "<br> • ".join(errores[:5])
@@ -0,0 +1,207 @@
+import os
+from db import get_db_connection
+from utils.esquema_bd import capacidades
+from utils.filtros_fecha import rango_dias
+from utils.origenes_persona import persona_de_ingreso
+
+# ============================================================
+# RESUMEN POR HORA DE RegistroIngresos (ResumenIngresosHora)
+# ============================================================
+# Conteos por (hora, sede, piso, sala, TipoUsuario, origen). Una tarea
+# programada los acumula avanzando desde la marca UltimoRegistroID de
+# ResumenIngresosMarca, así cada ingreso se cuenta una sola vez aunque llegue
+# tarde (write-behind, journal offline). Borrar ingresos (eliminar/vaciar
+# personas) marca el resumen para reconstruirse; mientras tanto, o mientras
+# queden ingresos sin acumular en el rango pedido, el dashboard lee la tabla
+# cruda.
+ACTIVO = os.getenv('RESUMEN_INGRESOS', 'true').lower() == 'true'
+# Ingresos por lote y lotes por pasada de la tarea
+LOTE = int(os.getenv('RESUMEN_INGRESOS_LOTE', 50000))
+MAX_LOTES_POR_PASADA = int(os.getenv('RESUMEN_INGRESOS_LOTES_PASADA', 20))
+
+# Largo de ResumenIngresosHora.Origen (parte de la clave primaria)
+LARGO_ORIGEN = 300
+
+# Filas del resumen para los ingresos que cumplen {where} (alias R). Las
+# columnas clave no admiten NULL: Sede NULL es Central, Piso/Sala/Tipo/Origen
+# ausentes se guardan como -1, 0 y ''. El origen es el de la persona al
+# momento de acumular. READCOMMITTEDLOCK espera a los INSERT aún sin
+# confirmar en vez de saltarlos (con RCSI se perderían detrás de la marca).
+_SQL_FILAS_RESUMEN = """
+    SELECT Hora, Sede, Piso, SalaID, TipoUsuario, Origen, COUNT(*) AS Cantidad
+    FROM (
+        SELECT
+            DATEADD(HOUR, DATEDIFF(HOUR, 0, R.FechaHora), 0) AS Hora,
+            ISNULL(R.Sede, 'Central') AS Sede,
+            ISNULL(R.Piso, -1) AS Piso,
+            ISNULL(R.SalaID, 0) AS SalaID,
+            ISNULL(R.TipoUsuario, '') AS TipoUsuario,
+            {origen} AS Origen
+        FROM RegistroIngresos R WITH (READCOMMITTEDLOCK){joins}
+        WHERE {where}
+    ) F
+    GROUP BY Hora, Sede, Piso, SalaID, TipoUsuario, Origen
+"""
+
+_SQL_ACUMULAR = """
+SET NOCOUNT ON;
+SET XACT_ABORT ON;
+DECLARE @lote INT = ?, @desde BIGINT, @hasta BIGINT, @reconstruir BIT;
+
+BEGIN TRAN;
+SELECT @desde = UltimoRegistroID, @reconstruir = Reconstruir
+FROM ResumenIngresosMarca WITH (UPDLOCK, HOLDLOCK) WHERE MarcaID = 1;
+
+IF @reconstruir = 1
+BEGIN
+    -- Se borraron ingresos: se vuelve a acumular desde el principio
+    DELETE FROM ResumenIngresosHora;
+    SET @desde = 0;
+    UPDATE ResumenIngresosMarca SET Reconstruir = 0, UltimoRegistroID = 0 WHERE MarcaID = 1;
+END
+
+SELECT @hasta = MAX(RegistroID)
+FROM (SELECT TOP (@lote) RegistroID FROM RegistroIngresos
+      WHERE RegistroID > @desde ORDER BY RegistroID) L;
+
+IF @hasta IS NOT NULL
+BEGIN
+    MERGE ResumenIngresosHora AS D
+    USING ({filas}) AS O
+    ON D.Hora = O.Hora AND D.Sede = O.Sede AND D.Piso = O.Piso AND D.SalaID = O.SalaID
+       AND D.TipoUsuario = O.TipoUsuario AND D.Origen = O.Origen
+    WHEN MATCHED THEN UPDATE SET Cantidad = D.Cantidad + O.Cantidad
+    WHEN NOT MATCHED THEN
+        INSERT (Hora, Sede, Piso, SalaID, TipoUsuario, Origen, Cantidad)
+        VALUES (O.Hora, O.Sede, O.Piso, O.SalaID, O.TipoUsuario, O.Origen, O.Cantidad);
+
+    UPDATE ResumenIngresosMarca SET UltimoRegistroID = @hasta, ActualizadoEn = GETDATE() WHERE MarcaID = 1;
+END
+COMMIT;
+
+SELECT CASE WHEN @hasta IS NULL THEN 0 ELSE 1 END;
+"""
+
+# Rehace las horas de [desde, hasta) con los ingresos ya cubiertos por la marca
+# (los posteriores los sumará la tarea al avanzar).
+_SQL_RECONSTRUIR_PERIODO = """
+SET NOCOUNT ON;
+SET XACT_ABORT ON;
+DECLARE @inicio DATETIME = ?, @fin DATETIME = ?, @marca BIGINT, @filas INT;
+
+BEGIN TRAN;
+SELECT @marca = UltimoRegistroID FROM ResumenIngresosMarca WITH (UPDLOCK, HOLDLOCK) WHERE MarcaID = 1;
+
+DELETE FROM ResumenIngresosHora WHERE Hora >= @inicio AND Hora < @fin;
+
+INSERT INTO ResumenIngresosHora (Hora, Sede, Piso, SalaID, TipoUsuario, Origen, Cantidad)
+{filas};
+SET @filas = @@ROWCOUNT;
+COMMIT;
+
+SELECT @filas;
+"""
+
+# 1 si el resumen cubre todos los ingresos de [desde, hasta)
+_SQL_CUBRE_RANGO = """
+SELECT CASE WHEN M.Reconstruir = 0 AND NOT EXISTS (
+           SELECT 1 FROM RegistroIngresos R
+           WHERE R.RegistroID > M.UltimoRegistroID AND R.FechaHora >= ? AND R.FechaHora < ?
+       ) THEN 1 ELSE 0 END
+FROM ResumenIngresosMarca M WHERE M.MarcaID = 1
+"""
+
+
+def origen_resumen(origen):
+    """
+    Expresión SQL del origen tal como se guarda en el resumen. Las consultas
+    que leen ingresos crudos junto al resumen (o en su lugar) deben usarla
+    para que un mismo origen agrupe igual por ambos caminos.
+    """
+    return f"LEFT(ISNULL({origen}, ''), {LARGO_ORIGEN})"
+
+
+def _sql_filas_resumen(where):
+    # El JOIN de personas depende de la vista OrigenesPersona, que se detecta al arrancar
+    joins, columnas = persona_de_ingreso('R')
+    return _SQL_FILAS_RESUMEN.format(origen=origen_resumen(columnas['origen']), joins=joins, where=where)
+
+
+def disponible():
+    return ACTIVO and capacidades['resumen_ingresos']
+
+
+def acumular_resumen_ingresos():
+    """Tarea programada: suma al resumen los ingresos posteriores a la marca. Devuelve los lotes procesados."""
+    if not disponible():
+        return 0
+    conn = get_db_connection()
+    if not conn:
+        return 0
+    try:
+        cursor = conn.cursor()
+        sql = _SQL_ACUMULAR.format(filas=_sql_filas_resumen("R.RegistroID > @desde AND R.RegistroID <= @hasta"))
+        lotes = 0
+        while lotes < MAX_LOTES_POR_PASADA:
+            cursor.execute(sql, (LOTE,))
+            hubo_filas = cursor.fetchone()[0]
+            conn.commit()
+            if not hubo_filas:
+                break
+            lotes += 1
+        return lotes
+    finally:
+        conn.close()
+
+
+def reconstruir_resumen_ingresos(f_inicio=None, f_fin=None):
+    """
+    Con fechas, rehace en el momento los días [f_inicio, f_fin]. Sin fechas,
+    marca el resumen completo para que la tarea lo rearme desde cero.
+    """
+    if not disponible():
+        return {'status': 'error', 'msg': 'El resumen de ingresos no está disponible'}
+    if not (f_inicio and f_fin):
+        marcar_para_reconstruir()
+        return {'status': 'success', 'msg': 'El resumen se reconstruirá completo en la próxima pasada'}
+
+    desde, hasta = rango_dias(f_inicio, f_fin)
+    conn = get_db_connection()
+    if not conn:
+        return {'status': 'error', 'msg': 'BD no disponible'}
+    try:
+        cursor = conn.cursor()
+        filas_periodo = _sql_filas_resumen("R.FechaHora >= @inicio AND R.FechaHora < @fin AND R.RegistroID <= @marca")
+        cursor.execute(_SQL_RECONSTRUIR_PERIODO.format(filas=filas_periodo), (desde, hasta))
+        filas = cursor.fetchone()[0]
+        conn.commit()
+        return {'status': 'success', 'msg': f'Resumen reconstruido del {f_inicio} al {f_fin} ({filas} filas)'}
+    except Exception as e:
+        return {'status': 'error', 'msg': str(e)}
+    finally:
+        conn.close()
+
+
+def marcar_para_reconstruir():
+    """Tras borrar ingresos: el resumen deja de usarse hasta rearmarse."""
+    if not disponible():
+        return
+    conn = get_db_connection()
+    if not conn:
+        return
+    try:
+        conn.cursor().execute("UPDATE ResumenIngresosMarca SET Reconstruir = 1 WHERE MarcaID = 1")
+        conn.commit()
+    except Exception as e:
+        print(f"Error marcando el resumen de ingresos para reconstruir: {e}")
+    finally:
+        conn.close()
+
+
+def cubre_rango(cursor, desde, hasta):
+    """True si el resumen ya tiene todos los ingresos de [desde, hasta)."""
+    if not disponible() or desde >= hasta:
+        return False
+    cursor.execute(_SQL_CUBRE_RANGO, (desde, hasta))
+    row = cursor.fetchone()
+    return bool(row and row[0])